@@ -9,10 +9,22 @@ from __future__ import annotations
 
 import csv
 import json
+import mmap
 import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Iterator, Optional
+
+# orjson (optional) parses JSONL lines several times faster than stdlib json
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+# Raw byte markers, so lines can be filtered before JSON parsing
+# (AuditLogger writes compact JSON; older lines use ", " / ": " separators).
+TRADE_EVENT_MARKERS = (b'"event":"trade"', b'"event": "trade"')
+TS_UTC_MARKERS = (b'"ts_utc":"', b'"ts_utc": "')
 
 
 @dataclass
@@ -245,3 +257,74 @@ def compute_avg_cost_from_audit(
         return {}
 
 
+def _loads_line(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def extract_ts_utc(raw: bytes) -> Optional[bytes]:
+    """Return the first 19 bytes of ts_utc ("YYYY-MM-DDTHH:MM:SS") without JSON parsing, or None."""
+    for marker in TS_UTC_MARKERS:
+        pos = raw.find(marker)
+        if pos != -1:
+            start = pos + len(marker)
+            return raw[start:start + 19]
+    return None
+
+
+def iter_jsonl_lines(path: str, start: int = 0) -> Iterator[tuple[int, bytes]]:
+    """
+    Iterate raw lines of a JSONL file through mmap.
+
+    - The file is mapped once; lines are located with mm.find(b"\n") (no per-read buffer copies).
+    - Yields (byte offset of the line, line without the trailing newline); empty lines are skipped.
+    - Only bytes present when the iteration starts are read.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or start >= size:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            find = mm.find
+            pos = max(0, start)
+            while pos < size:
+                nl = find(b"\n", pos)
+                end = size if nl == -1 else nl
+                if end > pos:
+                    yield pos, mm[pos:end]
+                pos = end + 1
+
+
+def iter_trade_events(
+    path: str,
+    since_utc: Optional[datetime] = None,
+    until_utc: Optional[datetime] = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Iterate trade events of the audit JSONL in file order.
+
+    - Non-trade lines are dropped by a byte-level check before JSON parsing.
+    - since_utc/until_utc ([since, until)) are compared against the raw ts_utc bytes; lines whose
+      ts_utc cannot be located are not filtered, so callers should still check the parsed timestamp.
+    - Malformed lines are skipped.
+    """
+    lo = since_utc.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S").encode() if since_utc else None
+    hi = until_utc.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S").encode() if until_utc else None
+
+    for _, raw in iter_jsonl_lines(path):
+        if TRADE_EVENT_MARKERS[0] not in raw and TRADE_EVENT_MARKERS[1] not in raw:
+            continue
+        if lo is not None or hi is not None:
+            ts = extract_ts_utc(raw)
+            if ts is not None and ((lo is not None and ts < lo) or (hi is not None and ts >= hi)):
+                continue
+        try:
+            e = _loads_line(raw)
+        except (ValueError, TypeError):
+            continue
+        if not isinstance(e, dict) or e.get("event") != "trade":
+            continue
+        yield e
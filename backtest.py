@@ -349,8 +349,7 @@ class Backtester:
                     stop_price = current_price - atr_stop_mult * float(atr)
                     take_price = current_price + atr_take_mult * float(atr)
                 else:
-                    stop_price = self.risk_manager.calculate_stop_loss(current_price)
-                    take_price = self.risk_manager.calculate_take_profit(current_price)
+                    stop_price, take_price = self.risk_manager.precompute_levels(current_price)
 
                 # 2) Рассчитываем размер позиции по риску (budget/stop_distance) + cap max_position_size
                 qty = self.risk_manager.calculate_position_size_by_risk(
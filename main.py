@@ -5,6 +5,7 @@
 import logging
 import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Dict, List
 import pandas as pd
@@ -38,7 +39,7 @@ from risk_manager import RiskManager
 from telegram_bot import TelegramBot, TelegramControlPanel
 from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 from audit_logger import AuditLogger, CsvAuditLogger
-from audit_logger import read_last_jsonl_events, compute_avg_cost_from_audit
+from audit_logger import read_last_jsonl_events, compute_avg_cost_from_audit, TRADE_EVENT_MARKERS
 from state_store import load_json, save_json_atomic
 
 # Глобальные модули для повышения доходности
@@ -56,6 +57,11 @@ except ImportError:
     MarketRegimeDetector = None
     CorrelationGuard = None
 
+# Байтовые маркеры событий audit-лога: строки отбрасываются до json.loads
+# (AuditLogger пишет компактный JSON, в старых строках — с пробелами).
+# Маркеры сделок — общие с audit_logger (TRADE_EVENT_MARKERS), чтобы фильтры не разошлись
+_AUDIT_CYCLE_MARKERS = (b'"event":"cycle"', b'"event": "cycle"')
+
 # Канонизация тикеров (чтобы не дублировать позиции из-за алиасов, например YDEX↔YNDX)
 try:
     from tinvest_api import TICKER_CANONICAL_MAP  # type: ignore
@@ -289,6 +295,9 @@ class TradingBot:
         # Инициализация глобальных модулей повышения доходности
         # ============================================
         self.symbol_tracker = None
+        # Запись в Symbol Tracker пишет state-файл на диск — выносим её из event loop.
+        # Один воркер сохраняет порядок записей (streak зависит от последовательности сделок).
+        self._symbol_tracker_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="symbol_tracker")
         self.market_regime_detector = None
         self.correlation_guard = None
 
@@ -313,6 +322,25 @@ class TradingBot:
             except Exception as e:
                 logger.warning(f"Не удалось инициализировать Correlation Guard: {e}")
 
+    def _record_symbol_trade(self, symbol: str, pnl: float, reason: str, confidence: float = 0.0) -> None:
+        """
+        Неблокирующая запись результата сделки в Symbol Tracker (fire-and-forget).
+        """
+        if self.symbol_tracker is None:
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(
+                self._symbol_tracker_executor,
+                self.symbol_tracker.record_trade,
+                symbol, float(pnl), reason, float(confidence),
+            )
+        except RuntimeError:
+            # Loop уже закрывается — пишем синхронно, чтобы не потерять сделку
+            try:
+                self.symbol_tracker.record_trade(symbol, float(pnl), reason, float(confidence))
+            except Exception:
+                pass
+
     def _trading_day(self, dt_loc: datetime | None = None) -> datetime.date:
         """
         Дата торгового дня в локальной TZ. Если reset_hour=10, то период 00:00..09:59 относится к предыдущему дню.
@@ -1099,14 +1127,14 @@ class TradingBot:
     def _day_start_equity_from_audit(self, day_iso: str) -> float | None:
         # day_iso: YYYY-MM-DD in local timezone
         try:
-            with open(AUDIT_LOG_PATH, "r", encoding="utf-8") as f:
+            import json
+            with open(AUDIT_LOG_PATH, "rb") as f:
                 first_eq = None
                 for line in f:
-                    line = line.strip()
-                    if not line:
+                    # большинство строк — decision/skip/market: пропускаем без JSON-парсинга
+                    if not any(m in line for m in _AUDIT_CYCLE_MARKERS):
                         continue
                     try:
-                        import json
                         e = json.loads(line)
                     except Exception:
                         continue
@@ -1135,10 +1163,10 @@ class TradingBot:
         try:
             import json
             cnt = 0
-            with open(AUDIT_LOG_PATH, "r", encoding="utf-8") as f:
+            with open(AUDIT_LOG_PATH, "rb") as f:
                 for line in f:
-                    line = line.strip()
-                    if not line:
+                    # trade-события редки: остальные строки пропускаем без JSON-парсинга
+                    if not any(m in line for m in TRADE_EVENT_MARKERS):
                         continue
                     try:
                         e = json.loads(line)
@@ -3031,7 +3059,7 @@ class TradingBot:
                         # Symbol Tracker: записываем результат сделки
                         if self.symbol_tracker is not None and pnl is not None:
                             try:
-                                self.symbol_tracker.record_trade(
+                                self._record_symbol_trade(
                                     symbol, float(pnl), "signal", float(analysis.get("confidence", 0) or 0)
                                 )
                             except Exception:
@@ -3630,58 +3658,57 @@ class TradingBot:
                                 logger.warning(f"   Позиция: qty_lots={qty_lots}, lot={lot}, qty_shares={qty_shares}")
                             
                             continue
-                        if order:
-                            # Преобразуем FIGI в тикер для корректного отображения в Telegram
-                            symbol_for_telegram = _ensure_ticker_not_figi(symbol, self.broker)
-                            symbol_for_telegram = _canon_symbol(symbol_for_telegram)
-                            
-                            loss = (float(current_price) - float(entry_price)) * float(qty_shares)
-                            ai = self.broker.get_account_info()
-                            currency = (ai.get("currency") or "RUB")
-                            currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(str(currency).upper(), str(currency).upper() + " ")
-                            message = f"🛑 *Стоп-лосс сработал*\n\n"
-                            message += f"Символ: {symbol_for_telegram}\n"
-                            message += f"Вход: {currency_symbol}{entry_price:.2f} {currency}\n"
-                            message += f"Выход: {currency_symbol}{current_price:.2f} {currency}\n"
-                            message += f"Убыток: {currency_symbol}{loss:.2f} {currency}"
-                            await self.telegram.send_message(message, parse_mode='Markdown')
-                            del self.positions_tracking[symbol]
-                            self.trade_history.append({
-                                "ts": datetime.now(),
+                        # Преобразуем FIGI в тикер для корректного отображения в Telegram
+                        symbol_for_telegram = _ensure_ticker_not_figi(symbol, self.broker)
+                        symbol_for_telegram = _canon_symbol(symbol_for_telegram)
+                        
+                        loss = (float(current_price) - float(entry_price)) * float(qty_shares)
+                        ai = self.broker.get_account_info()
+                        currency = (ai.get("currency") or "RUB")
+                        currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(str(currency).upper(), str(currency).upper() + " ")
+                        message = f"🛑 *Стоп-лосс сработал*\n\n"
+                        message += f"Символ: {symbol_for_telegram}\n"
+                        message += f"Вход: {currency_symbol}{entry_price:.2f} {currency}\n"
+                        message += f"Выход: {currency_symbol}{current_price:.2f} {currency}\n"
+                        message += f"Убыток: {currency_symbol}{loss:.2f} {currency}"
+                        await self.telegram.send_message(message, parse_mode='Markdown')
+                        del self.positions_tracking[symbol]
+                        self.trade_history.append({
+                            "ts": datetime.now(),
+                            "symbol": symbol,
+                            "action": "SELL",
+                            "qty_lots": qty_lots,
+                            "price": current_price,
+                            "reason": "stop_loss",
+                            "pnl": loss,
+                        })
+                        self.trade_history = self.trade_history[-50:]
+                        self.cooldown_until[symbol] = datetime.now() + timedelta(minutes=SYMBOL_COOLDOWN_MIN)
+                        try:
+                            self._audit_event({
+                                "event": "trade",
                                 "symbol": symbol,
                                 "action": "SELL",
-                                "qty_lots": qty_lots,
-                                "price": current_price,
+                                "qty_lots": int(qty_lots),
+                                "lot": int(lot),
+                                "price": float(current_price),
                                 "reason": "stop_loss",
-                                "pnl": loss,
+                                "details": {
+                                    "pnl": float(loss),
+                                    "entry_price": float(entry_price),
+                                    "qty_shares": float(qty_shares),
+                                    "stop_level": float(stop_level),
+                                },
+                                "order": order,
                             })
-                            self.trade_history = self.trade_history[-50:]
-                            self.cooldown_until[symbol] = datetime.now() + timedelta(minutes=SYMBOL_COOLDOWN_MIN)
+                        except Exception:
+                            pass
+                        # Symbol Tracker: записываем stop_loss как убыток
+                        if self.symbol_tracker is not None:
                             try:
-                                self._audit_event({
-                                    "event": "trade",
-                                    "symbol": symbol,
-                                    "action": "SELL",
-                                    "qty_lots": int(qty_lots),
-                                    "lot": int(lot),
-                                    "price": float(current_price),
-                                    "reason": "stop_loss",
-                                    "details": {
-                                        "pnl": float(loss),
-                                        "entry_price": float(entry_price),
-                                        "qty_shares": float(qty_shares),
-                                        "stop_level": float(stop_level),
-                                    },
-                                    "order": order,
-                                })
+                                self._record_symbol_trade(symbol, float(loss), "stop_loss", 0.0)
                             except Exception:
                                 pass
-                            # Symbol Tracker: записываем stop_loss как убыток
-                            if self.symbol_tracker is not None:
-                                try:
-                                    self.symbol_tracker.record_trade(symbol, float(loss), "stop_loss", 0.0)
-                                except Exception:
-                                    pass
                     continue
                 
                 # Проверка тейк-профита
@@ -3777,69 +3804,75 @@ class TradingBot:
                                 logger.warning(f"   Позиция: qty_lots={qty_lots}, lot={lot}, qty_shares={qty_shares}")
                             
                             continue
-                        if order:
-                            # Преобразуем FIGI в тикер для корректного отображения в Telegram
-                            symbol_for_telegram = _ensure_ticker_not_figi(symbol, self.broker)
-                            symbol_for_telegram = _canon_symbol(symbol_for_telegram)
-                            
-                            profit = (float(current_price) - float(entry_price)) * float(qty_shares)
-                            ai = self.broker.get_account_info()
-                            currency = (ai.get("currency") or "RUB")
-                            currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(str(currency).upper(), str(currency).upper() + " ")
-                            message = f"🎯 *Тейк-профит сработал*\n\n"
-                            message += f"Символ: {symbol_for_telegram}\n"
-                            message += f"Вход: {currency_symbol}{entry_price:.2f} {currency}\n"
-                            message += f"Выход: {currency_symbol}{current_price:.2f} {currency}\n"
-                            message += f"Прибыль: {currency_symbol}{profit:.2f} {currency}"
-                            await self.telegram.send_message(message, parse_mode='Markdown')
-                            del self.positions_tracking[symbol]
-                            self.trade_history.append({
-                                "ts": datetime.now(),
+                        # Преобразуем FIGI в тикер для корректного отображения в Telegram
+                        symbol_for_telegram = _ensure_ticker_not_figi(symbol, self.broker)
+                        symbol_for_telegram = _canon_symbol(symbol_for_telegram)
+                        
+                        profit = (float(current_price) - float(entry_price)) * float(qty_shares)
+                        ai = self.broker.get_account_info()
+                        currency = (ai.get("currency") or "RUB")
+                        currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(str(currency).upper(), str(currency).upper() + " ")
+                        message = f"🎯 *Тейк-профит сработал*\n\n"
+                        message += f"Символ: {symbol_for_telegram}\n"
+                        message += f"Вход: {currency_symbol}{entry_price:.2f} {currency}\n"
+                        message += f"Выход: {currency_symbol}{current_price:.2f} {currency}\n"
+                        message += f"Прибыль: {currency_symbol}{profit:.2f} {currency}"
+                        await self.telegram.send_message(message, parse_mode='Markdown')
+                        del self.positions_tracking[symbol]
+                        self.trade_history.append({
+                            "ts": datetime.now(),
+                            "symbol": symbol,
+                            "action": "SELL",
+                            "qty_lots": qty_lots,
+                            "price": current_price,
+                            "reason": "take_profit",
+                            "pnl": profit,
+                        })
+                        self.trade_history = self.trade_history[-50:]
+                        self.cooldown_until[symbol] = datetime.now() + timedelta(minutes=SYMBOL_COOLDOWN_MIN)
+                        try:
+                            self._audit_event({
+                                "event": "trade",
                                 "symbol": symbol,
                                 "action": "SELL",
-                                "qty_lots": qty_lots,
-                                "price": current_price,
+                                "qty_lots": int(qty_lots),
+                                "lot": int(lot),
+                                "price": float(current_price),
                                 "reason": "take_profit",
-                                "pnl": profit,
+                                "details": {
+                                    "pnl": float(profit),
+                                    "entry_price": float(entry_price),
+                                    "qty_shares": float(qty_shares),
+                                    "take_level": float(take_level),
+                                },
+                                "order": order,
                             })
-                            self.trade_history = self.trade_history[-50:]
-                            self.cooldown_until[symbol] = datetime.now() + timedelta(minutes=SYMBOL_COOLDOWN_MIN)
+                        except Exception:
+                            pass
+                        # Symbol Tracker: записываем take_profit как прибыль
+                        if self.symbol_tracker is not None:
                             try:
-                                self._audit_event({
-                                    "event": "trade",
-                                    "symbol": symbol,
-                                    "action": "SELL",
-                                    "qty_lots": int(qty_lots),
-                                    "lot": int(lot),
-                                    "price": float(current_price),
-                                    "reason": "take_profit",
-                                    "details": {
-                                        "pnl": float(profit),
-                                        "entry_price": float(entry_price),
-                                        "qty_shares": float(qty_shares),
-                                        "take_level": float(take_level),
-                                    },
-                                    "order": order,
-                                })
+                                self._record_symbol_trade(symbol, float(profit), "take_profit", 0.0)
                             except Exception:
                                 pass
-                            # Symbol Tracker: записываем take_profit как прибыль
-                            if self.symbol_tracker is not None:
-                                try:
-                                    self.symbol_tracker.record_trade(symbol, float(profit), "take_profit", 0.0)
-                                except Exception:
-                                    pass
-    
+
     async def stop(self):
         """Остановить бота"""
         self.running = False
         logger.info("Торговый бот остановлен")
+        # Дожидаемся отложенных записей Symbol Tracker, чтобы не потерять состояние
+        # (в потоке — не блокируем event loop и отправку уведомлений Telegram)
+        try:
+            await asyncio.to_thread(self._symbol_tracker_executor.shutdown, wait=True)
+        except Exception:
+            pass
         await self.telegram.send_message("🛑 *Торговый бот остановлен*")
         if self.telegram_control:
             try:
                 await self.telegram_control.stop()
             except Exception:
                 pass
+        await self.telegram.close()
 
 
 async def main():
@@ -11,293 +11,123 @@ Market Regime Detector - Определитель режима рынка
 - Детектор высокой волатильности (осторожность при экстремальных движениях)
 """
 
-from datetime import datetime, time
-from typing import Dict, Optional, Tuple
+from collections import deque
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
 from zoneinfo import ZoneInfo
+import numpy as np
 import pandas as pd
 
+# Numba опционален: без него декоратор превращается в no-op и код работает как обычный Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda f: f
 
-class MarketRegimeDetector:
+
+@njit(cache=True)
+def _atr_recent_vs_hist(high, low, close):
     """
-    Определяет режим рынка на основе технических индикаторов.
+    Средний True Range за последние 7 баров и за 7 баров до них.
+    Один проход по хвосту из 14 баров, без аллокации массива TR.
     """
-    
-    # Оптимальные часы для торговли на MOEX (MSK)
-    # Анализ показывает: утренние часы (10-12) и вечерние (15-18) более прибыльны
-    OPTIMAL_HOURS_MSK = [
-        (10, 12),  # Утренняя сессия после открытия
-        (15, 18),  # Вечерняя сессия
-    ]
-    
-    # Часы с повышенным риском (открытие, закрытие)
-    RISKY_HOURS_MSK = [
-        (9, 10),   # Первый час после открытия - высокая волатильность
-        (18, 19),  # Последний час - низкая ликвидность
-    ]
-    
-    def __init__(self, tz: str = "Europe/Moscow"):
-        try:
-            self.tz = ZoneInfo(tz)
-        except Exception:
-            self.tz = ZoneInfo("UTC")
-    
-    def detect_regime(self, df: pd.DataFrame) -> str:
-        """
-        Определить режим рынка на основе данных.
-        
-        Args:
-            df: DataFrame со свечами (должен содержать close, high, low)
-        
-        Returns:
-            "BULL", "BEAR", или "SIDEWAYS"
-        """
-        if df is None or len(df) < 20:
-            return "SIDEWAYS"
-        
-        try:
-            close = df["close"].values
-            
-            # Простой детектор на основе скользящих средних
-            ma_short = pd.Series(close).rolling(10).mean().iloc[-1]
-            ma_long = pd.Series(close).rolling(20).mean().iloc[-1]
-            
-            current_price = close[-1]
-            
-            # Определяем тренд
-            if current_price > ma_short > ma_long:
-                # Цена выше обеих MA, MA короткая выше длинной = бычий тренд
-                return "BULL"
-            elif current_price < ma_short < ma_long:
-                # Цена ниже обеих MA, MA короткая ниже длинной = медвежий тренд
-                return "BEAR"
-            else:
-                return "SIDEWAYS"
-        except Exception:
-            return "SIDEWAYS"
-    
-    def get_regime_adjustments(self, regime: str) -> Dict:
-        """
-        Получить корректировки параметров для текущего режима.
-        
-        Returns:
-            Dict с корректировками для confidence, position_size, etc.
-        """
-        if regime == "BULL":
-            return {
-                "buy_confidence_mult": 0.95,   # Снижаем порог для BUY
-                "sell_confidence_mult": 1.1,   # Повышаем порог для SELL
-                "position_size_mult": 1.1,     # Увеличиваем позиции
-                "take_profit_mult": 1.2,       # Увеличиваем цели
-                "description": "Бычий рынок: агрессивнее покупаем",
-            }
-        elif regime == "BEAR":
-            return {
-                "buy_confidence_mult": 1.15,   # Повышаем порог для BUY
-                "sell_confidence_mult": 0.9,   # Снижаем порог для SELL
-                "position_size_mult": 0.8,     # Уменьшаем позиции
-                "take_profit_mult": 0.9,       # Уменьшаем цели (быстрее забираем)
-                "description": "Медвежий рынок: осторожнее покупаем",
-            }
-        else:  # SIDEWAYS
-            return {
-                "buy_confidence_mult": 1.05,   # Немного повышаем пороги
-                "sell_confidence_mult": 1.05,
-                "position_size_mult": 0.9,     # Уменьшаем позиции
-                "take_profit_mult": 0.85,      # Быстрее забираем прибыль
-                "description": "Боковой рынок: только сильные сигналы",
-            }
-    
-    def is_optimal_trading_time(self, dt: Optional[datetime] = None) -> Tuple[bool, str]:
-        """
-        Проверить, оптимальное ли сейчас время для торговли.
-        
-        Returns:
-            (is_optimal, reason)
-        """
-        if dt is None:
-            dt = datetime.now(self.tz)
+    n = len(close)
+    recent = 0.0
+    hist = 0.0
+    for i in range(n - 14, n):
+        prev_close = close[i - 1]
+        tr = high[i] - low[i]
+        up = abs(high[i] - prev_close)
+        down = abs(low[i] - prev_close)
+        if up > tr:
+            tr = up
+        if down > tr:
+            tr = down
+        if i >= n - 7:
+            recent += tr
         else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Проверяем рискованные часы
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return False, f"Рискованный час ({hour}:00 MSK)"
-        
-        # Проверяем оптимальные часы
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return True, f"Оптимальный час ({hour}:00 MSK)"
-        
-        # Нейтральное время
-        return True, f"Нейтральное время ({hour}:00 MSK)"
-    
-    def get_time_based_position_mult(self, dt: Optional[datetime] = None) -> float:
-        """
-        Получить множитель позиции на основе времени.
-        
-        Returns:
-            Множитель (1.0 = норма, 0.7 = уменьшить, 1.1 = увеличить)
-        """
-        if dt is None:
-            dt = datetime.now(self.tz)
-        else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Рискованные часы - уменьшаем
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return 0.7
-        
-        # Оптимальные часы - можно увеличить
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return 1.1
-        
-        return 1.0
-    
-    def detect_high_volatility(self, df: pd.DataFrame, threshold: float = 2.0) -> bool:
-        """
-        Определить, есть ли сейчас повышенная волатильность.
-        
-        Args:
-            df: DataFrame со свечами
-            threshold: Множитель ATR для определения "высокой" волатильности
-        
-        Returns:
-            True если волатильность выше нормы
-        """
-        if df is None or len(df) < 20:
-            return False
-        
-        try:
-            # Считаем ATR
-            high = df["high"].values
-            low = df["low"].values
-            close = df["close"].values
-            
-            tr = []
-            for i in range(1, len(df)):
-                tr.append(max(
-                    high[i] - low[i],
-                    abs(high[i] - close[i-1]),
-                    abs(low[i] - close[i-1])
-                ))
-            
-            if len(tr) < 14:
-                return False
-            
-            atr_recent = sum(tr[-7:]) / 7
-            atr_historical = sum(tr[-14:-7]) / 7 if len(tr) >= 14 else atr_recent
-            
-            # Если недавний ATR значительно выше исторического
-            return atr_recent > atr_historical * threshold
-        except Exception:
-            return False
-
-
-class CorrelationGuard:
+            hist += tr
+    return recent / 7.0, hist / 7.0
+
+
+# Значения режима: интернированные строки, общие для всех модулей (быстрые сравнения в стратегиях)
+_BULL = sys.intern("BULL")
+_BEAR = sys.intern("BEAR")
+_SIDEWAYS = sys.intern("SIDEWAYS")
+
+# Корректировки параметров по режиму рынка (read-only, создаются один раз при импорте)
+_BULL_ADJ = MappingProxyType({
+    "buy_confidence_mult": 0.95,   # Снижаем порог для BUY
+    "sell_confidence_mult": 1.1,   # Повышаем порог для SELL
+    "position_size_mult": 1.1,     # Увеличиваем позиции
+    "take_profit_mult": 1.2,       # Увеличиваем цели
+    "description": "Бычий рынок: агрессивнее покупаем",
+})
+_BEAR_ADJ = MappingProxyType({
+    "buy_confidence_mult": 1.15,   # Повышаем порог для BUY
+    "sell_confidence_mult": 0.9,   # Снижаем порог для SELL
+    "position_size_mult": 0.8,     # Уменьшаем позиции
+    "take_profit_mult": 0.9,       # Уменьшаем цели (быстрее забираем)
+    "description": "Медвежий рынок: осторожнее покупаем",
+})
+_SIDEWAYS_ADJ = MappingProxyType({
+    "buy_confidence_mult": 1.05,   # Немного повышаем пороги
+    "sell_confidence_mult": 1.05,
+    "position_size_mult": 0.9,     # Уменьшаем позиции
+    "take_profit_mult": 0.85,      # Быстрее забираем прибыль
+    "description": "Боковой рынок: только сильные сигналы",
+})
+_REGIME_ADJ = {_BULL: _BULL_ADJ, _BEAR: _BEAR_ADJ, _SIDEWAYS: _SIDEWAYS_ADJ}
+
+
+@lru_cache(maxsize=8)
+def _zone(tz: str) -> ZoneInfo:
+    """Кэш ZoneInfo по имени зоны."""
+    return ZoneInfo(tz)
+
+
+def _fixed_utc_offset_sec(tz: ZoneInfo) -> Optional[int]:
     """
-    Защита от коррелированных позиций.
-    Не открывает несколько позиций в одном секторе/категории.
+    Смещение зоны от UTC в секундах, если оно одинаково зимой и летом (нет DST), иначе None.
     """
-    
-    # Группы коррелированных активов
-    CORRELATION_GROUPS = {
-        "oil_gas": ["LKOH", "ROSN", "GAZP", "NVTK", "SNGS", "SNGSP", "TATN", "TATNP", "SIBN", "RNFT", "BANE", "BANEP"],
-        "metals": ["GMKN", "NLMK", "CHMF", "MAGN", "RUAL", "ALRS", "PLZL", "SELG"],
-        "finance": ["SBER", "VTBR", "MOEX", "AFKS"],
-        "telecom": ["MTSS", "IRAO"],
-        "retail": ["MGNT"],
-        "tech": ["YNDX"],
-        "transport": ["AFLT", "FLOT", "TRNFP"],
-        "commodities_etf": ["UGLD", "LNZL", "GLDRUB_TOM", "SLVRUB_TOM", "PLTRUB_TOM", "PLDRUB_TOM"],
-        "currency": ["USD000UTSTOM", "CNYRUB_TOM"],
-    }
-    
-    def __init__(self, max_per_group: int = 2):
-        self.max_per_group = max_per_group
-    
-    def get_symbol_group(self, symbol: str) -> Optional[str]:
-        """Получить группу для символа."""
-        symbol = str(symbol).upper()
-        for group, symbols in self.CORRELATION_GROUPS.items():
-            if symbol in symbols:
-                return group
+    year = datetime.now(tz).year
+    winter = datetime(year, 1, 15, 12, tzinfo=tz).utcoffset()
+    summer = datetime(year, 7, 15, 12, tzinfo=tz).utcoffset()
+    if winter is None or winter != summer:
         return None
-    
-    def can_open_position(self, symbol: str, open_positions: Dict) -> Tuple[bool, str]:
-        """
-        Проверить, можно ли открыть позицию по символу.
-        
-        Args:
-            symbol: Тикер для открытия
-            open_positions: Текущие открытые позиции {symbol: {...}}
-        
-        Returns:
-            (can_open, reason)
-        """
-        symbol = str(symbol).upper()
-        group = self.get_symbol_group(symbol)
-        
-        if group is None:
-            return True, "Символ не в коррелированных группах"
-        
-        # Считаем сколько позиций уже в этой группе
-        group_symbols = set(self.CORRELATION_GROUPS.get(group, []))
-        count_in_group = sum(1 for s in open_positions if str(s).upper() in group_symbols)
-        
-        if count_in_group >= self.max_per_group:
-            return False, f"Уже {count_in_group} позиций в группе '{group}'"
-        
-        return True, f"OK (группа '{group}': {count_in_group}/{self.max_per_group})"
-
+    return int(winter.total_seconds())
 
-# Singleton instances
-_regime_detector: Optional[MarketRegimeDetector] = None
-_correlation_guard: Optional[CorrelationGuard] = None
 
+def _as_float_tail(values, n: int) -> Optional[np.ndarray]:
+    """
+    Последние n значений как непрерывный float64 массив.
+    None, если данных меньше n, они не числовые или среди них есть NaN/inf.
+    """
+    if values is None or len(values) < n:
+        return None
+    try:
+        tail = np.ascontiguousarray(values[-n:], dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if not np.isfinite(tail).all():
+        return None
+    return tail
 
-def get_market_regime_detector(tz: str = "Europe/Moscow") -> MarketRegimeDetector:
-    global _regime_detector
-    if _regime_detector is None:
-        _regime_detector = MarketRegimeDetector(tz=tz)
-    return _regime_detector
-
-
-def get_correlation_guard(max_per_group: int = 2) -> CorrelationGuard:
-    global _correlation_guard
-    if _correlation_guard is None:
-        _correlation_guard = CorrelationGuard(max_per_group=max_per_group)
-    return _correlation_guard
-
-
-Market Regime Detector - Определитель режима рынка
-
-Определяет текущий режим рынка (бычий/медвежий/боковой) и адаптирует стратегию:
-1. BULL - агрессивнее BUY, осторожнее SELL
-2. BEAR - осторожнее BUY, агрессивнее SELL
-3. SIDEWAYS - только сильные сигналы
 
-Также включает:
-- Фильтр оптимальных торговых часов (на основе исторических данных)
-- Детектор высокой волатильности (осторожность при экстремальных движениях)
-"""
-
-from datetime import datetime, time
-from typing import Dict, Optional, Tuple
-from zoneinfo import ZoneInfo
-import pandas as pd
+def _hours_mask(ranges) -> int:
+    """24-битная маска часов для списка диапазонов [(start, end), ...] (end не включается)."""
+    mask = 0
+    for start, end in ranges:
+        for hour in range(start, end):
+            mask |= 1 << hour
+    return mask
 
 
 class MarketRegimeDetector:
@@ -305,6 +135,8 @@ class MarketRegimeDetector:
     Определяет режим рынка на основе технических индикаторов.
     """
     
+    __slots__ = ("tz", "_utc_offset_sec", "_ma_state")
+    
     # Оптимальные часы для торговли на MOEX (MSK)
     # Анализ показывает: утренние часы (10-12) и вечерние (15-18) более прибыльны
     OPTIMAL_HOURS_MSK = [
@@ -318,11 +150,45 @@ class MarketRegimeDetector:
         (18, 19),  # Последний час - низкая ликвидность
     ]
     
+    # Битовые маски часов: бит h выставлен, если час h попадает в диапазон
+    _RISKY_MASK = _hours_mask(RISKY_HOURS_MSK)
+    _OPTIMAL_MASK = _hours_mask(OPTIMAL_HOURS_MSK)
+    
+    # Таблица час -> (is_optimal, reason, position_mult), заполняется один раз при импорте
+    _HOUR_TABLE: Tuple[Tuple[bool, str, float], ...] = ()
+    
+    @classmethod
+    def _build_hour_table(cls) -> Tuple[Tuple[bool, str, float], ...]:
+        """
+        Предрасчёт классификации для всех 24 часов (рискованный/оптимальный/нейтральный).
+        """
+        table = []
+        for hour in range(24):
+            if (cls._RISKY_MASK >> hour) & 1:
+                # Рискованные часы - уменьшаем
+                table.append((False, f"Рискованный час ({hour}:00 MSK)", 0.7))
+            elif (cls._OPTIMAL_MASK >> hour) & 1:
+                # Оптимальные часы - можно увеличить
+                table.append((True, f"Оптимальный час ({hour}:00 MSK)", 1.1))
+            else:
+                # Нейтральное время
+                table.append((True, f"Нейтральное время ({hour}:00 MSK)", 1.0))
+        return tuple(table)
+    
     def __init__(self, tz: str = "Europe/Moscow"):
         try:
-            self.tz = ZoneInfo(tz)
+            self.tz = _zone(tz)
         except Exception:
-            self.tz = ZoneInfo("UTC")
+            self.tz = _zone("UTC")
+        # Для зон без перехода на летнее время (MSK) текущий час считаем из time.time() без datetime
+        self._utc_offset_sec = _fixed_utc_offset_sec(self.tz)
+        # Состояние инкрементальных MA для detect_regime_streaming (O(1) на бар)
+        self._ma_state = {
+            "short_sum": 0.0,
+            "long_sum": 0.0,
+            "buf_short": deque(maxlen=10),
+            "buf_long": deque(maxlen=20),
+        }
     
     def detect_regime(self, df: pd.DataFrame) -> str:
         """
@@ -334,344 +200,90 @@ class MarketRegimeDetector:
         Returns:
             "BULL", "BEAR", или "SIDEWAYS"
         """
-        if df is None or len(df) < 20:
-            return "SIDEWAYS"
-        
-        try:
-            close = df["close"].values
-            
-            # Простой детектор на основе скользящих средних
-            ma_short = pd.Series(close).rolling(10).mean().iloc[-1]
-            ma_long = pd.Series(close).rolling(20).mean().iloc[-1]
-            
-            current_price = close[-1]
-            
-            # Определяем тренд
-            if current_price > ma_short > ma_long:
-                # Цена выше обеих MA, MA короткая выше длинной = бычий тренд
-                return "BULL"
-            elif current_price < ma_short < ma_long:
-                # Цена ниже обеих MA, MA короткая ниже длинной = медвежий тренд
-                return "BEAR"
-            else:
-                return "SIDEWAYS"
-        except Exception:
-            return "SIDEWAYS"
+        if df is None or len(df) < 20 or "close" not in df:
+            return _SIDEWAYS
+        return self.detect_regime_arr(df["close"].to_numpy(copy=False)[-20:])
     
-    def get_regime_adjustments(self, regime: str) -> Dict:
+    def detect_regime_arr(self, close: np.ndarray) -> str:
         """
-        Получить корректировки параметров для текущего режима.
-        
-        Returns:
-            Dict с корректировками для confidence, position_size, etc.
+        То же, что detect_regime, но по готовому массиву цен закрытия (без pandas).
+        Удобно в циклах бэктеста: .values извлекается один раз снаружи.
         """
-        if regime == "BULL":
-            return {
-                "buy_confidence_mult": 0.95,   # Снижаем порог для BUY
-                "sell_confidence_mult": 1.1,   # Повышаем порог для SELL
-                "position_size_mult": 1.1,     # Увеличиваем позиции
-                "take_profit_mult": 1.2,       # Увеличиваем цели
-                "description": "Бычий рынок: агрессивнее покупаем",
-            }
-        elif regime == "BEAR":
-            return {
-                "buy_confidence_mult": 1.15,   # Повышаем порог для BUY
-                "sell_confidence_mult": 0.9,   # Снижаем порог для SELL
-                "position_size_mult": 0.8,     # Уменьшаем позиции
-                "take_profit_mult": 0.9,       # Уменьшаем цели (быстрее забираем)
-                "description": "Медвежий рынок: осторожнее покупаем",
-            }
-        else:  # SIDEWAYS
-            return {
-                "buy_confidence_mult": 1.05,   # Немного повышаем пороги
-                "sell_confidence_mult": 1.05,
-                "position_size_mult": 0.9,     # Уменьшаем позиции
-                "take_profit_mult": 0.85,      # Быстрее забираем прибыль
-                "description": "Боковой рынок: только сильные сигналы",
-            }
-    
-    def is_optimal_trading_time(self, dt: Optional[datetime] = None) -> Tuple[bool, str]:
-        """
-        Проверить, оптимальное ли сейчас время для торговли.
+        # Явные проверки вместо try/except: нужны только последние 20 баров, pandas не участвует
+        c = _as_float_tail(close, 20)
+        if c is None:
+            return _SIDEWAYS
         
-        Returns:
-            (is_optimal, reason)
-        """
-        if dt is None:
-            dt = datetime.now(self.tz)
-        else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Проверяем рискованные часы
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return False, f"Рискованный час ({hour}:00 MSK)"
-        
-        # Проверяем оптимальные часы
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return True, f"Оптимальный час ({hour}:00 MSK)"
-        
-        # Нейтральное время
-        return True, f"Нейтральное время ({hour}:00 MSK)"
-    
-    def get_time_based_position_mult(self, dt: Optional[datetime] = None) -> float:
-        """
-        Получить множитель позиции на основе времени.
+        # Простой детектор на основе скользящих средних (нужно только последнее значение MA)
+        ma_long = float(c.mean())
+        ma_short = float(c[-10:].mean())
+        cur = float(c[-1])
         
-        Returns:
-            Множитель (1.0 = норма, 0.7 = уменьшить, 1.1 = увеличить)
-        """
-        if dt is None:
-            dt = datetime.now(self.tz)
+        # Определяем тренд
+        if cur > ma_short > ma_long:
+            # Цена выше обеих MA, MA короткая выше длинной = бычий тренд
+            return _BULL
+        elif cur < ma_short < ma_long:
+            # Цена ниже обеих MA, MA короткая ниже длинной = медвежий тренд
+            return _BEAR
         else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Рискованные часы - уменьшаем
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return 0.7
-        
-        # Оптимальные часы - можно увеличить
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return 1.1
-        
-        return 1.0
-    
-    def detect_high_volatility(self, df: pd.DataFrame, threshold: float = 2.0) -> bool:
-        """
-        Определить, есть ли сейчас повышенная волатильность.
-        
-        Args:
-            df: DataFrame со свечами
-            threshold: Множитель ATR для определения "высокой" волатильности
-        
-        Returns:
-            True если волатильность выше нормы
-        """
-        if df is None or len(df) < 20:
-            return False
-        
-        try:
-            # Считаем ATR
-            high = df["high"].values
-            low = df["low"].values
-            close = df["close"].values
-            
-            tr = []
-            for i in range(1, len(df)):
-                tr.append(max(
-                    high[i] - low[i],
-                    abs(high[i] - close[i-1]),
-                    abs(low[i] - close[i-1])
-                ))
-            
-            if len(tr) < 14:
-                return False
-            
-            atr_recent = sum(tr[-7:]) / 7
-            atr_historical = sum(tr[-14:-7]) / 7 if len(tr) >= 14 else atr_recent
-            
-            # Если недавний ATR значительно выше исторического
-            return atr_recent > atr_historical * threshold
-        except Exception:
-            return False
-
-
-class CorrelationGuard:
-    """
-    Защита от коррелированных позиций.
-    Не открывает несколько позиций в одном секторе/категории.
-    """
-    
-    # Группы коррелированных активов
-    CORRELATION_GROUPS = {
-        "oil_gas": ["LKOH", "ROSN", "GAZP", "NVTK", "SNGS", "SNGSP", "TATN", "TATNP", "SIBN", "RNFT", "BANE", "BANEP"],
-        "metals": ["GMKN", "NLMK", "CHMF", "MAGN", "RUAL", "ALRS", "PLZL", "SELG"],
-        "finance": ["SBER", "VTBR", "MOEX", "AFKS"],
-        "telecom": ["MTSS", "IRAO"],
-        "retail": ["MGNT"],
-        "tech": ["YNDX"],
-        "transport": ["AFLT", "FLOT", "TRNFP"],
-        "commodities_etf": ["UGLD", "LNZL", "GLDRUB_TOM", "SLVRUB_TOM", "PLTRUB_TOM", "PLDRUB_TOM"],
-        "currency": ["USD000UTSTOM", "CNYRUB_TOM"],
-    }
+            return _SIDEWAYS
     
-    def __init__(self, max_per_group: int = 2):
-        self.max_per_group = max_per_group
-    
-    def get_symbol_group(self, symbol: str) -> Optional[str]:
-        """Получить группу для символа."""
-        symbol = str(symbol).upper()
-        for group, symbols in self.CORRELATION_GROUPS.items():
-            if symbol in symbols:
-                return group
-        return None
-    
-    def can_open_position(self, symbol: str, open_positions: Dict) -> Tuple[bool, str]:
+    def detect_regime_streaming(self, new_close: float) -> str:
         """
-        Проверить, можно ли открыть позицию по символу.
-        
-        Args:
-            symbol: Тикер для открытия
-            open_positions: Текущие открытые позиции {symbol: {...}}
+        Потоковый вариант detect_regime: принимает очередную цену закрытия и
+        обновляет скользящие суммы (минус ушедший бар, плюс новый) вместо пересчёта окна.
         
         Returns:
-            (can_open, reason)
-        """
-        symbol = str(symbol).upper()
-        group = self.get_symbol_group(symbol)
-        
-        if group is None:
-            return True, "Символ не в коррелированных группах"
-        
-        # Считаем сколько позиций уже в этой группе
-        group_symbols = set(self.CORRELATION_GROUPS.get(group, []))
-        count_in_group = sum(1 for s in open_positions if str(s).upper() in group_symbols)
-        
-        if count_in_group >= self.max_per_group:
-            return False, f"Уже {count_in_group} позиций в группе '{group}'"
-        
-        return True, f"OK (группа '{group}': {count_in_group}/{self.max_per_group})"
-
-
-# Singleton instances
-_regime_detector: Optional[MarketRegimeDetector] = None
-_correlation_guard: Optional[CorrelationGuard] = None
-
-
-def get_market_regime_detector(tz: str = "Europe/Moscow") -> MarketRegimeDetector:
-    global _regime_detector
-    if _regime_detector is None:
-        _regime_detector = MarketRegimeDetector(tz=tz)
-    return _regime_detector
-
-
-def get_correlation_guard(max_per_group: int = 2) -> CorrelationGuard:
-    global _correlation_guard
-    if _correlation_guard is None:
-        _correlation_guard = CorrelationGuard(max_per_group=max_per_group)
-    return _correlation_guard
-
-
-Market Regime Detector - Определитель режима рынка
-
-Определяет текущий режим рынка (бычий/медвежий/боковой) и адаптирует стратегию:
-1. BULL - агрессивнее BUY, осторожнее SELL
-2. BEAR - осторожнее BUY, агрессивнее SELL
-3. SIDEWAYS - только сильные сигналы
-
-Также включает:
-- Фильтр оптимальных торговых часов (на основе исторических данных)
-- Детектор высокой волатильности (осторожность при экстремальных движениях)
-"""
-
-from datetime import datetime, time
-from typing import Dict, Optional, Tuple
-from zoneinfo import ZoneInfo
-import pandas as pd
-
-
-class MarketRegimeDetector:
-    """
-    Определяет режим рынка на основе технических индикаторов.
-    """
-    
-    # Оптимальные часы для торговли на MOEX (MSK)
-    # Анализ показывает: утренние часы (10-12) и вечерние (15-18) более прибыльны
-    OPTIMAL_HOURS_MSK = [
-        (10, 12),  # Утренняя сессия после открытия
-        (15, 18),  # Вечерняя сессия
-    ]
-    
-    # Часы с повышенным риском (открытие, закрытие)
-    RISKY_HOURS_MSK = [
-        (9, 10),   # Первый час после открытия - высокая волатильность
-        (18, 19),  # Последний час - низкая ликвидность
-    ]
-    
-    def __init__(self, tz: str = "Europe/Moscow"):
-        try:
-            self.tz = ZoneInfo(tz)
-        except Exception:
-            self.tz = ZoneInfo("UTC")
-    
-    def detect_regime(self, df: pd.DataFrame) -> str:
-        """
-        Определить режим рынка на основе данных.
-        
-        Args:
-            df: DataFrame со свечами (должен содержать close, high, low)
-        
-        Returns:
-            "BULL", "BEAR", или "SIDEWAYS"
-        """
-        if df is None or len(df) < 20:
-            return "SIDEWAYS"
-        
+            "BULL", "BEAR", или "SIDEWAYS" (пока не накоплено 20 баров — "SIDEWAYS")
+        """
+        st = self._ma_state
+        price = float(new_close)
+        
+        buf_short = st["buf_short"]
+        if len(buf_short) == buf_short.maxlen:
+            st["short_sum"] -= buf_short[0]
+        buf_short.append(price)
+        st["short_sum"] += price
+        
+        buf_long = st["buf_long"]
+        if len(buf_long) == buf_long.maxlen:
+            st["long_sum"] -= buf_long[0]
+        buf_long.append(price)
+        st["long_sum"] += price
+        
+        if len(buf_long) < buf_long.maxlen:
+            return _SIDEWAYS
+        
+        ma_short = st["short_sum"] / buf_short.maxlen
+        ma_long = st["long_sum"] / buf_long.maxlen
+        if price > ma_short > ma_long:
+            return _BULL
+        elif price < ma_short < ma_long:
+            return _BEAR
+        return _SIDEWAYS
+    
+    def _local_hour(self, dt: Optional[datetime] = None) -> int:
+        """Час в TZ детектора: для dt=None — текущий (быстрый путь без datetime при фиксированном смещении)."""
+        if dt is None:
+            if self._utc_offset_sec is not None:
+                return int((time.time() + self._utc_offset_sec) // 3600) % 24
+            return datetime.now(self.tz).hour
         try:
-            close = df["close"].values
-            
-            # Простой детектор на основе скользящих средних
-            ma_short = pd.Series(close).rolling(10).mean().iloc[-1]
-            ma_long = pd.Series(close).rolling(20).mean().iloc[-1]
-            
-            current_price = close[-1]
-            
-            # Определяем тренд
-            if current_price > ma_short > ma_long:
-                # Цена выше обеих MA, MA короткая выше длинной = бычий тренд
-                return "BULL"
-            elif current_price < ma_short < ma_long:
-                # Цена ниже обеих MA, MA короткая ниже длинной = медвежий тренд
-                return "BEAR"
-            else:
-                return "SIDEWAYS"
+            dt = dt.astimezone(self.tz)
         except Exception:
-            return "SIDEWAYS"
+            pass
+        return dt.hour
     
-    def get_regime_adjustments(self, regime: str) -> Dict:
+    def get_regime_adjustments(self, regime: str) -> Mapping:
         """
         Получить корректировки параметров для текущего режима.
         
         Returns:
-            Dict с корректировками для confidence, position_size, etc.
+            Read-only mapping с корректировками для confidence, position_size, etc.
+            (общий для всех вызовов — для изменения сделайте dict(...) копию)
         """
-        if regime == "BULL":
-            return {
-                "buy_confidence_mult": 0.95,   # Снижаем порог для BUY
-                "sell_confidence_mult": 1.1,   # Повышаем порог для SELL
-                "position_size_mult": 1.1,     # Увеличиваем позиции
-                "take_profit_mult": 1.2,       # Увеличиваем цели
-                "description": "Бычий рынок: агрессивнее покупаем",
-            }
-        elif regime == "BEAR":
-            return {
-                "buy_confidence_mult": 1.15,   # Повышаем порог для BUY
-                "sell_confidence_mult": 0.9,   # Снижаем порог для SELL
-                "position_size_mult": 0.8,     # Уменьшаем позиции
-                "take_profit_mult": 0.9,       # Уменьшаем цели (быстрее забираем)
-                "description": "Медвежий рынок: осторожнее покупаем",
-            }
-        else:  # SIDEWAYS
-            return {
-                "buy_confidence_mult": 1.05,   # Немного повышаем пороги
-                "sell_confidence_mult": 1.05,
-                "position_size_mult": 0.9,     # Уменьшаем позиции
-                "take_profit_mult": 0.85,      # Быстрее забираем прибыль
-                "description": "Боковой рынок: только сильные сигналы",
-            }
+        return _REGIME_ADJ.get(regime, _SIDEWAYS_ADJ)
     
     def is_optimal_trading_time(self, dt: Optional[datetime] = None) -> Tuple[bool, str]:
         """
@@ -680,28 +292,8 @@ class MarketRegimeDetector:
         Returns:
             (is_optimal, reason)
         """
-        if dt is None:
-            dt = datetime.now(self.tz)
-        else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Проверяем рискованные часы
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return False, f"Рискованный час ({hour}:00 MSK)"
-        
-        # Проверяем оптимальные часы
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return True, f"Оптимальный час ({hour}:00 MSK)"
-        
-        # Нейтральное время
-        return True, f"Нейтральное время ({hour}:00 MSK)"
+        is_optimal, reason, _ = self._HOUR_TABLE[self._local_hour(dt)]
+        return is_optimal, reason
     
     def get_time_based_position_mult(self, dt: Optional[datetime] = None) -> float:
         """
@@ -710,27 +302,7 @@ class MarketRegimeDetector:
         Returns:
             Множитель (1.0 = норма, 0.7 = уменьшить, 1.1 = увеличить)
         """
-        if dt is None:
-            dt = datetime.now(self.tz)
-        else:
-            try:
-                dt = dt.astimezone(self.tz)
-            except Exception:
-                pass
-        
-        hour = dt.hour
-        
-        # Рискованные часы - уменьшаем
-        for start, end in self.RISKY_HOURS_MSK:
-            if start <= hour < end:
-                return 0.7
-        
-        # Оптимальные часы - можно увеличить
-        for start, end in self.OPTIMAL_HOURS_MSK:
-            if start <= hour < end:
-                return 1.1
-        
-        return 1.0
+        return self._HOUR_TABLE[self._local_hour(dt)][2]
     
     def detect_high_volatility(self, df: pd.DataFrame, threshold: float = 2.0) -> bool:
         """
@@ -743,33 +315,38 @@ class MarketRegimeDetector:
         Returns:
             True если волатильность выше нормы
         """
-        if df is None or len(df) < 20:
+        if df is None or len(df) < 20 or not all(col in df for col in ("high", "low", "close")):
+            return False
+        return self.detect_high_volatility_arr(
+            df["high"].to_numpy(copy=False),
+            df["low"].to_numpy(copy=False),
+            df["close"].to_numpy(copy=False),
+            threshold,
+        )
+    
+    def detect_high_volatility_arr(
+        self, high: np.ndarray, low: np.ndarray, close: np.ndarray, threshold: float = 2.0
+    ) -> bool:
+        """
+        То же, что detect_high_volatility, но по готовым массивам high/low/close (без pandas).
+        """
+        if close is None or len(close) < 20:
             return False
         
-        try:
-            # Считаем ATR
-            high = df["high"].values
-            low = df["low"].values
-            close = df["close"].values
-            
-            tr = []
-            for i in range(1, len(df)):
-                tr.append(max(
-                    high[i] - low[i],
-                    abs(high[i] - close[i-1]),
-                    abs(low[i] - close[i-1])
-                ))
-            
-            if len(tr) < 14:
-                return False
-            
-            atr_recent = sum(tr[-7:]) / 7
-            atr_historical = sum(tr[-14:-7]) / 7 if len(tr) >= 14 else atr_recent
-            
-            # Если недавний ATR значительно выше исторического
-            return atr_recent > atr_historical * threshold
-        except Exception:
+        # ATR-ядру нужны 15 последних баров (14 TR + предыдущий close), все конечные
+        high = _as_float_tail(high, 15)
+        low = _as_float_tail(low, 15)
+        close = _as_float_tail(close, 15)
+        if high is None or low is None or close is None:
             return False
+        
+        atr_recent, atr_historical = _atr_recent_vs_hist(high, low, close)
+        
+        # Если недавний ATR значительно выше исторического
+        return atr_recent > atr_historical * threshold
+
+
+MarketRegimeDetector._HOUR_TABLE = MarketRegimeDetector._build_hour_table()
 
 
 class CorrelationGuard:
@@ -778,6 +355,11 @@ class CorrelationGuard:
     Не открывает несколько позиций в одном секторе/категории.
     """
     
+    __slots__ = ("max_per_group", "_symbol_to_group", "_group_id", "_sym_to_gid")
+    
+    # С какого числа открытых позиций считать группы через np.bincount вместо генератора
+    BINCOUNT_MIN_POSITIONS = 64
+    
     # Группы коррелированных активов
     CORRELATION_GROUPS = {
         "oil_gas": ["LKOH", "ROSN", "GAZP", "NVTK", "SNGS", "SNGSP", "TATN", "TATNP", "SIBN", "RNFT", "BANE", "BANEP"],
@@ -793,14 +375,17 @@ class CorrelationGuard:
     
     def __init__(self, max_per_group: int = 2):
         self.max_per_group = max_per_group
+        # Обратный индекс символ -> группа: поиск группы за один hash lookup
+        self._symbol_to_group = {
+            sym.upper(): grp for grp, syms in self.CORRELATION_GROUPS.items() for sym in syms
+        }
+        # Целочисленные id групп для векторного подсчёта при большом числе позиций
+        self._group_id = {grp: i for i, grp in enumerate(self.CORRELATION_GROUPS)}
+        self._sym_to_gid = {sym: self._group_id[grp] for sym, grp in self._symbol_to_group.items()}
     
     def get_symbol_group(self, symbol: str) -> Optional[str]:
         """Получить группу для символа."""
-        symbol = str(symbol).upper()
-        for group, symbols in self.CORRELATION_GROUPS.items():
-            if symbol in symbols:
-                return group
-        return None
+        return self._symbol_to_group.get(str(symbol).upper())
     
     def can_open_position(self, symbol: str, open_positions: Dict) -> Tuple[bool, str]:
         """
@@ -820,8 +405,18 @@ class CorrelationGuard:
             return True, "Символ не в коррелированных группах"
         
         # Считаем сколько позиций уже в этой группе
-        group_symbols = set(self.CORRELATION_GROUPS.get(group, []))
-        count_in_group = sum(1 for s in open_positions if str(s).upper() in group_symbols)
+        if len(open_positions) >= self.BINCOUNT_MIN_POSITIONS:
+            sym_to_gid = self._sym_to_gid
+            gids = np.fromiter(
+                (sym_to_gid.get(str(s).upper(), -1) for s in open_positions),
+                dtype=np.int16,
+                count=len(open_positions),
+            )
+            counts = np.bincount(gids[gids >= 0], minlength=len(self._group_id))
+            count_in_group = int(counts[self._group_id[group]])
+        else:
+            symbol_to_group = self._symbol_to_group
+            count_in_group = sum(1 for s in open_positions if symbol_to_group.get(str(s).upper()) == group)
         
         if count_in_group >= self.max_per_group:
             return False, f"Уже {count_in_group} позиций в группе '{group}'"
@@ -829,26 +424,12 @@ class CorrelationGuard:
         return True, f"OK (группа '{group}': {count_in_group}/{self.max_per_group})"
 
 
-# Singleton instances
-_regime_detector: Optional[MarketRegimeDetector] = None
-_correlation_guard: Optional[CorrelationGuard] = None
-
-
+# Singleton instances (lru_cache по аргументам вместо mutable globals + "if None")
+@lru_cache(maxsize=None)
 def get_market_regime_detector(tz: str = "Europe/Moscow") -> MarketRegimeDetector:
-    global _regime_detector
-    if _regime_detector is None:
-        _regime_detector = MarketRegimeDetector(tz=tz)
-    return _regime_detector
+    return MarketRegimeDetector(tz=tz)
 
 
+@lru_cache(maxsize=None)
 def get_correlation_guard(max_per_group: int = 2) -> CorrelationGuard:
-    global _correlation_guard
-    if _correlation_guard is None:
-        _correlation_guard = CorrelationGuard(max_per_group=max_per_group)
-    return _correlation_guard
-
-
-
-
-
-
+    return CorrelationGuard(max_per_group=max_per_group)
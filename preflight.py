@@ -14,7 +14,9 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import hashlib
 import sys
+import time
 from datetime import datetime, timezone
 
 from config import (
@@ -30,55 +32,73 @@ from config import (
     ENABLE_TRADING,
     AUTO_START,
 )
+from state_store import load_json, save_json_atomic
 
+# Строка списка тикеров не меняется во время работы — собираем один раз при импорте
+_SYMBOLS_JOINED = ", ".join(SYMBOLS)
 
-def _ok(msg: str) -> None:
-    print(f"✓ {msg}")
+# Кэш успешной проверки API: повторный preflight с тем же конфигом не импортирует SDK
+PREFLIGHT_CACHE_PATH = "state/preflight_cache.json"
 
+# Строки текущего запуска (для сохранения в кэш и повторного вывода)
+_lines: list[str] = []
 
-def _warn(msg: str) -> None:
-    print(f"⚠ {msg}")
 
+def _emit(line: str) -> None:
+    _lines.append(line)
+    print(line)
 
-def _fail(msg: str) -> None:
-    print(f"✗ {msg}")
 
+def _ok(msg: str) -> None:
+    _emit(f"✓ {msg}")
 
-async def _main_async(args: argparse.Namespace) -> int:
-    print("=" * 70)
-    print("PREFLIGHT: проверка перед запуском торгового бота")
-    print("=" * 70)
-    print(f"Время (UTC): {datetime.now(timezone.utc).isoformat().replace('+00:00','Z')}")
-    print("")
 
-    # 1) Базовые настройки
-    if BROKER != "tinvest":
-        _fail(f"BROKER={BROKER}. Для песочницы должен быть BROKER=tinvest")
-        return 2
-    _ok(f"BROKER={BROKER}")
+def _warn(msg: str) -> None:
+    _emit(f"⚠ {msg}")
 
-    if not TINVEST_TOKEN or "your_" in str(TINVEST_TOKEN).lower() or "example" in str(TINVEST_TOKEN).lower():
-        _fail("TINVEST_TOKEN не задан или содержит примерное значение")
-        return 2
-    _ok("TINVEST_TOKEN задан")
 
-    _ok(f"TINVEST_SANDBOX={TINVEST_SANDBOX}")
-    if TINVEST_SANDBOX:
-        if TINVEST_GRPC_TARGET:
-            _ok(f"TINVEST_GRPC_TARGET={TINVEST_GRPC_TARGET}")
-        else:
-            _warn("TINVEST_GRPC_TARGET не задан (это ок, SDK возьмёт дефолт для песочницы)")
+def _fail(msg: str) -> None:
+    _emit(f"✗ {msg}")
+
+
+def _env_hash(args: argparse.Namespace) -> str:
+    key = (
+        BROKER,
+        TINVEST_TOKEN,
+        TINVEST_SANDBOX,
+        TINVEST_GRPC_TARGET,
+        tuple(SYMBOLS),
+        BAR_INTERVAL,
+        HISTORY_LOOKBACK,
+        str(args.history_period),
+    )
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+
+def _load_cached_api_check(env_hash: str, ttl_sec: float) -> list[str] | None:
+    cache = load_json(PREFLIGHT_CACHE_PATH) or {}
+    entry = cache.get(env_hash)
+    if not isinstance(entry, dict):
+        return None
+    try:
+        age = time.time() - float(entry.get("ts", 0))
+    except (TypeError, ValueError):
+        return None
+    if age < 0 or age > ttl_sec:
+        return None
+    lines = entry.get("lines")
+    return lines if isinstance(lines, list) else None
 
-    _ok(f"ENABLE_TRADING={ENABLE_TRADING} (это флаг реальных ордеров в main.py)")
-    _ok(f"AUTO_START={AUTO_START} (входы BUY после старта)")
 
-    if not SYMBOLS:
-        _fail("SYMBOLS пустой")
-        return 2
-    _ok(f"SYMBOLS={', '.join(SYMBOLS)}")
-    _ok(f"BAR_INTERVAL={BAR_INTERVAL}, HISTORY_LOOKBACK={HISTORY_LOOKBACK}")
+def _save_api_check(env_hash: str, lines: list[str]) -> None:
+    try:
+        save_json_atomic(PREFLIGHT_CACHE_PATH, {env_hash: {"ts": time.time(), "lines": lines}})
+    except Exception:
+        pass
 
-    # 2) Проверка SDK и T-Invest API
+
+async def _check_tinvest_api(args: argparse.Namespace) -> int:
+    """SDK + аккаунт/позиции/котировка/история первого символа. 0 — ок, иначе код выхода."""
     try:
         from tinvest_api import TInvestAPI  # noqa
     except Exception as e:
@@ -97,34 +117,39 @@ async def _main_async(args: argparse.Namespace) -> int:
         return 2
     _ok("TInvestAPI инициализирован")
 
-    # account/portfolio/positions
-    try:
-        info = api.get_account_info()
-        if not info:
-            _warn("get_account_info вернул пусто")
-        else:
-            _ok(f"account_info: equity={info.get('equity')} cash={info.get('cash')} currency={info.get('currency','RUB')}")
-    except Exception as e:
-        _fail(f"get_account_info ошибка: {e}")
+    # account/positions/котировка/история первого символа — независимые сетевые вызовы,
+    # SDK синхронный, поэтому запускаем их параллельно в потоках
+    sym0 = SYMBOLS[0]
+    info, pos, px, df = await asyncio.gather(
+        asyncio.to_thread(api.get_account_info),
+        asyncio.to_thread(api.get_positions),
+        asyncio.to_thread(api.get_current_price, sym0),
+        asyncio.to_thread(api.get_historical_data, sym0, period=str(args.history_period), interval="1d"),
+        return_exceptions=True,
+    )
+
+    if isinstance(info, Exception):
+        _fail(f"get_account_info ошибка: {info}")
         return 2
+    if not info:
+        _warn("get_account_info вернул пусто")
+    else:
+        _ok(f"account_info: equity={info.get('equity')} cash={info.get('cash')} currency={info.get('currency','RUB')}")
 
-    try:
-        pos = api.get_positions() or []
-        _ok(f"positions: найдено {len(pos)}")
-    except Exception as e:
-        _fail(f"get_positions ошибка: {e}")
+    if isinstance(pos, Exception):
+        _fail(f"get_positions ошибка: {pos}")
         return 2
+    _ok(f"positions: найдено {len(pos or [])}")
 
-    # quotes + small history for the first symbol
-    sym0 = SYMBOLS[0]
-    try:
-        px = api.get_current_price(sym0)
+    if isinstance(px, Exception):
+        _warn(f"get_current_price({sym0}) ошибка: {px}")
+    else:
         _ok(f"price({sym0})={px}")
-    except Exception as e:
-        _warn(f"get_current_price({sym0}) ошибка: {e}")
 
+    if isinstance(df, Exception):
+        _fail(f"get_historical_data({sym0}) ошибка: {df}")
+        return 2
     try:
-        df = api.get_historical_data(sym0, period=str(args.history_period), interval="1d")
         if df is None or df.empty:
             _warn(f"historical({sym0}) пусто для period={args.history_period}")
         else:
@@ -133,6 +158,57 @@ async def _main_async(args: argparse.Namespace) -> int:
         _fail(f"get_historical_data({sym0}) ошибка: {e}")
         return 2
 
+    return 0
+
+
+async def _main_async(args: argparse.Namespace) -> int:
+    print("=" * 70)
+    print("PREFLIGHT: проверка перед запуском торгового бота")
+    print("=" * 70)
+    print(f"Время (UTC): {datetime.now(timezone.utc).isoformat().replace('+00:00','Z')}")
+    print("")
+
+    # 1) Базовые настройки
+    if BROKER != "tinvest":
+        _fail(f"BROKER={BROKER}. Для песочницы должен быть BROKER=tinvest")
+        return 2
+    _ok(f"BROKER={BROKER}")
+
+    if not TINVEST_TOKEN or "your_" in str(TINVEST_TOKEN).lower() or "example" in str(TINVEST_TOKEN).lower():
+        _fail("TINVEST_TOKEN не задан или содержит примерное значение")
+        return 2
+    _ok("TINVEST_TOKEN задан")
+
+    _ok(f"TINVEST_SANDBOX={TINVEST_SANDBOX}")
+    if TINVEST_SANDBOX:
+        if TINVEST_GRPC_TARGET:
+            _ok(f"TINVEST_GRPC_TARGET={TINVEST_GRPC_TARGET}")
+        else:
+            _warn("TINVEST_GRPC_TARGET не задан (это ок, SDK возьмёт дефолт для песочницы)")
+
+    _ok(f"ENABLE_TRADING={ENABLE_TRADING} (это флаг реальных ордеров в main.py)")
+    _ok(f"AUTO_START={AUTO_START} (входы BUY после старта)")
+
+    if not SYMBOLS:
+        _fail("SYMBOLS пустой")
+        return 2
+    _ok(f"SYMBOLS={_SYMBOLS_JOINED}")
+    _ok(f"BAR_INTERVAL={BAR_INTERVAL}, HISTORY_LOOKBACK={HISTORY_LOOKBACK}")
+
+    # 2) Проверка SDK и T-Invest API (успешный результат кэшируется на --cache-ttl секунд)
+    env_hash = _env_hash(args)
+    cached = None if args.force else _load_cached_api_check(env_hash, float(args.cache_ttl))
+    if cached is not None:
+        for line in cached:
+            print(line)
+        _ok(f"T-Invest API: результат из кэша {PREFLIGHT_CACHE_PATH} (--force для полной проверки)")
+    else:
+        api_start = len(_lines)
+        rc = await _check_tinvest_api(args)
+        if rc != 0:
+            return rc
+        _save_api_check(env_hash, _lines[api_start:])
+
     # 3) Telegram (опционально)
     if args.telegram:
         if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
@@ -145,7 +221,7 @@ async def _main_async(args: argparse.Namespace) -> int:
                 if not tg.bot:
                     _warn("TelegramBot не инициализировался (tg.bot=None)")
                 else:
-                    await tg.send_message("✅ Preflight OK. Бот готов к запуску в песочнице.", parse_mode=None)
+                    await tg.send_message("✅ Preflight OK. Бот готов к запуску в песочнице.", parse_mode=None, wait=True)
                     _ok("Telegram: тестовое сообщение отправлено")
             except Exception as e:
                 _warn(f"Telegram: ошибка отправки: {e}")
@@ -161,6 +237,8 @@ def main() -> int:
     p = argparse.ArgumentParser()
     p.add_argument("--telegram", action="store_true", help="Отправить тестовое сообщение в Telegram")
     p.add_argument("--history-period", default="1y", help="Период для теста истории (например 5d/1mo/1y)")
+    p.add_argument("--cache-ttl", type=float, default=300, help="Сколько секунд доверять кэшу успешной проверки API")
+    p.add_argument("--force", action="store_true", help="Игнорировать кэш и проверить T-Invest API заново")
     args = p.parse_args()
     return asyncio.run(_main_async(args))
 
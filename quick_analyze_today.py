@@ -1,188 +1,108 @@
 #!/usr/bin/env python3
 import json
+import os
 import sys
 from datetime import datetime, timezone
-from collections import defaultdict
+from collections import defaultdict, deque
 
-sys.stdout.reconfigure(encoding='utf-8')
-
-audit_path = "audit_logs/trades_audit.jsonl"
-
-# Сегодняшний день в UTC
-now = datetime.now(timezone.utc)
-today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-print("=" * 80)
-print("АНАЛИЗ РЕШЕНИЙ БОТА ЗА СЕГОДНЯ")
-print("=" * 80)
-print(f"Период: с {today_start.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-print(f"Текущее время: {now.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-print()
-
-decisions = []
-skips = []
-trades = []
-
-try:
-    with open(audit_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                event = json.loads(line.strip())
-                ts_str = event.get("ts_utc", "")
-                if not ts_str:
-                    continue
-                
-                if ts_str.endswith("Z"):
-                    ts_str = ts_str[:-1] + "+00:00"
-                event_dt = datetime.fromisoformat(ts_str)
-                
-                if event_dt < today_start:
-                    continue
-                
-                event_type = event.get("event", "")
-                if event_type == "decision":
-                    decisions.append(event)
-                elif event_type == "skip":
-                    skips.append(event)
-                elif event_type == "trade" and event.get("action") == "BUY":
-                    trades.append(event)
-            except:
-                continue
-except Exception as e:
-    print(f"ERROR: {e}")
-    sys.exit(1)
-
-print(f"Найдено событий:")
-print(f"  - Решений (decision): {len(decisions)}")
-print(f"  - Пропусков (skip): {len(skips)}")
-print(f"  - Покупок (trade BUY): {len(trades)}")
-print()
-
-# Решения с BUY сигналами
-buy_decisions = [d for d in decisions if d.get("details", {}).get("strategy_should_buy") == True]
-print(f"Решений с сигналом BUY: {len(buy_decisions)}")
-print()
-
-# Причины пропуска
-skip_reasons = defaultdict(int)
-for skip in skips:
-    reason = skip.get("skip_reason", "unknown")
-    skip_reasons[reason] += 1
-
-if skip_reasons:
-    print("Причины пропуска:")
-    for reason, count in sorted(skip_reasons.items(), key=lambda x: -x[1]):
-        print(f"  {reason}: {count}")
-    print()
-
-# Упущенные возможности (упрощенно)
-if buy_decisions:
-    print("Символы с сигналами BUY:")
-    for bd in buy_decisions[-10:]:  # Последние 10
-        sym = bd.get("symbol", "")
-        conf = float(bd.get("confidence", 0) or 0)
-        rsi = bd.get("rsi")
-        print(f"  {sym}: confidence={conf:.3f}, RSI={rsi}")
-
-print()
-print("=" * 80)
-
-import json
-import sys
-from datetime import datetime, timezone
-from collections import defaultdict
+from audit_logger import iter_jsonl_lines
 
 sys.stdout.reconfigure(encoding='utf-8')
 
 audit_path = "audit_logs/trades_audit.jsonl"
-
-# Сегодняшний день в UTC
-now = datetime.now(timezone.utc)
-today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-print("=" * 80)
-print("АНАЛИЗ РЕШЕНИЙ БОТА ЗА СЕГОДНЯ")
-print("=" * 80)
-print(f"Период: с {today_start.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-print(f"Текущее время: {now.strftime('%Y-%m-%d %H:%M:%S')} UTC")
-print()
-
-decisions = []
-skips = []
-trades = []
-
-try:
-    with open(audit_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                event = json.loads(line.strip())
-                ts_str = event.get("ts_utc", "")
-                if not ts_str:
-                    continue
-                
-                if ts_str.endswith("Z"):
-                    ts_str = ts_str[:-1] + "+00:00"
-                event_dt = datetime.fromisoformat(ts_str)
-                
-                if event_dt < today_start:
-                    continue
-                
-                event_type = event.get("event", "")
-                if event_type == "decision":
-                    decisions.append(event)
-                elif event_type == "skip":
-                    skips.append(event)
-                elif event_type == "trade" and event.get("action") == "BUY":
-                    trades.append(event)
-            except:
+# Смещение первой строки текущего дня (UTC): "YYYY-MM-DD\noffset"
+offset_path = "audit_logs/.today_offset"
+SEEK_CHUNK = 64 * 1024
+
+
+def _line_dt(line: bytes):
+    """datetime события из строки audit-лога (None, если строку не разобрать)"""
+    try:
+        ts_str = json.loads(line).get("ts_utc", "")
+    except (ValueError, AttributeError):
+        return None
+    if not ts_str:
+        return None
+    if ts_str[-1] == "Z":
+        ts_str = ts_str[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(ts_str)
+    except (ValueError, TypeError):
+        return None
+
+
+def _load_today_offset(day: str, size: int):
+    """Смещение из sidecar-файла, если оно записано для этого же дня и не выходит за размер лога"""
+    try:
+        with open(offset_path, "r", encoding="utf-8") as f:
+            saved_day, saved_offset = f.read().split()[:2]
+        offset = int(saved_offset)
+    except (OSError, ValueError):
+        return None
+    if saved_day != day or offset < 0 or offset > size:
+        return None
+    return offset
+
+
+def _is_day_start(f, offset: int, day_start) -> bool:
+    """
+    Проверка сохранённого смещения: это начало строки, строка на нём — уже текущий день,
+    а предыдущая строка (если есть) — ещё предыдущий. rotate_audit_logs.py обрезает начало лога
+    на месте, и после этого старое смещение указывает в середину сегодняшних данных.
+    """
+    if offset > 0:
+        back = min(offset, SEEK_CHUNK)
+        f.seek(offset - back)
+        before = f.read(back)
+        if not before.endswith(b"\n"):
+            return False
+        prev_start = before.rfind(b"\n", 0, len(before) - 1) + 1
+        if prev_start == 0 and back < offset:
+            return False  # предыдущая строка длиннее окна — не проверить, ищем заново
+        prev_dt = _line_dt(before[prev_start:])
+        if prev_dt is None or prev_dt >= day_start:
+            return False
+    f.seek(offset)
+    line = f.readline()
+    if not line:
+        return True  # сегодняшних событий ещё нет после этого места
+    dt = _line_dt(line)
+    return dt is not None and dt >= day_start
+
+
+def _save_today_offset(day: str, offset: int) -> None:
+    try:
+        tmp = offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{day}\n{offset}")
+        os.replace(tmp, offset_path)
+    except OSError:
+        pass
+
+
+def _find_scan_start(f, size: int, day_start) -> int:
+    """
+    Позиция начала строки не позже первого события текущего дня.
+    Идём от конца файла назад, удваивая окно (64KB, 128KB, ...), пока первая полная строка окна не окажется раньше day_start.
+    """
+    window = SEEK_CHUNK
+    while window < size:
+        pos = size - window
+        f.seek(pos - 1)
+        f.readline()  # дочитываем неполную строку (если pos попал в её середину)
+        while True:
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            dt = _line_dt(line)
+            if dt is None:
                 continue
-except Exception as e:
-    print(f"ERROR: {e}")
-    sys.exit(1)
-
-print(f"Найдено событий:")
-print(f"  - Решений (decision): {len(decisions)}")
-print(f"  - Пропусков (skip): {len(skips)}")
-print(f"  - Покупок (trade BUY): {len(trades)}")
-print()
-
-# Решения с BUY сигналами
-buy_decisions = [d for d in decisions if d.get("details", {}).get("strategy_should_buy") == True]
-print(f"Решений с сигналом BUY: {len(buy_decisions)}")
-print()
-
-# Причины пропуска
-skip_reasons = defaultdict(int)
-for skip in skips:
-    reason = skip.get("skip_reason", "unknown")
-    skip_reasons[reason] += 1
-
-if skip_reasons:
-    print("Причины пропуска:")
-    for reason, count in sorted(skip_reasons.items(), key=lambda x: -x[1]):
-        print(f"  {reason}: {count}")
-    print()
-
-# Упущенные возможности (упрощенно)
-if buy_decisions:
-    print("Символы с сигналами BUY:")
-    for bd in buy_decisions[-10:]:  # Последние 10
-        sym = bd.get("symbol", "")
-        conf = float(bd.get("confidence", 0) or 0)
-        rsi = bd.get("rsi")
-        print(f"  {sym}: confidence={conf:.3f}, RSI={rsi}")
-
-print()
-print("=" * 80)
-
-import json
-import sys
-from datetime import datetime, timezone
-from collections import defaultdict
-
-sys.stdout.reconfigure(encoding='utf-8')
-
-audit_path = "audit_logs/trades_audit.jsonl"
+            if dt < day_start:
+                return line_start
+            break
+        window *= 2
+    return 0
 
 # Сегодняшний день в UTC
 now = datetime.now(timezone.utc)
@@ -200,31 +120,45 @@ skips = []
 trades = []
 
 try:
-    with open(audit_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                event = json.loads(line.strip())
-                ts_str = event.get("ts_utc", "")
-                if not ts_str:
-                    continue
-                
-                if ts_str.endswith("Z"):
-                    ts_str = ts_str[:-1] + "+00:00"
-                event_dt = datetime.fromisoformat(ts_str)
-                
-                if event_dt < today_start:
-                    continue
-                
-                event_type = event.get("event", "")
-                if event_type == "decision":
-                    decisions.append(event)
-                elif event_type == "skip":
-                    skips.append(event)
-                elif event_type == "trade" and event.get("action") == "BUY":
-                    trades.append(event)
-            except:
+    today_key = today_start.strftime("%Y-%m-%d")
+    with open(audit_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        start_offset = _load_today_offset(today_key, size)
+        cached = start_offset is not None and _is_day_start(f, start_offset, today_start)
+        if not cached:
+            start_offset = _find_scan_start(f, size, today_start)
+    first_today_offset = None
+    # Общий с report_today_trades mmap-итератор строк audit-лога (с байтовыми смещениями)
+    for line_offset, line in iter_jsonl_lines(audit_path, start_offset):
+        try:
+            event = json.loads(line)
+            ts_str = event.get("ts_utc", "")
+            if not ts_str:
+                continue
+            
+            if ts_str[-1] == "Z":
+                ts_str = ts_str[:-1] + "+00:00"
+            event_dt = datetime.fromisoformat(ts_str)
+            
+            if event_dt < today_start:
                 continue
-except Exception as e:
+            if first_today_offset is None:
+                first_today_offset = line_offset
+            
+            event_type = event.get("event", "")
+            if event_type == "decision":
+                decisions.append(event)
+            elif event_type == "skip":
+                skips.append(event)
+            elif event_type == "trade" and event.get("action") == "BUY":
+                trades.append(event)
+        except (json.JSONDecodeError, ValueError, TypeError, AttributeError):
+            # битая строка / не-объект JSON / нестандартный ts_utc
+            continue
+    # Следующий запуск за этот день сразу начнёт с первой сегодняшней строки
+    if not cached and first_today_offset is not None:
+        _save_today_offset(today_key, first_today_offset)
+except OSError as e:
     print(f"ERROR: {e}")
     sys.exit(1)
 
@@ -235,8 +169,14 @@ print(f"  - Покупок (trade BUY): {len(trades)}")
 print()
 
 # Решения с BUY сигналами
-buy_decisions = [d for d in decisions if d.get("details", {}).get("strategy_should_buy") == True]
-print(f"Решений с сигналом BUY: {len(buy_decisions)}")
+# Считаем за один проход и храним только последние 10 — полный список не нужен
+buy_decisions_count = 0
+buy_decisions = deque(maxlen=10)
+for d in decisions:
+    if d.get("details", {}).get("strategy_should_buy") == True:
+        buy_decisions_count += 1
+        buy_decisions.append(d)
+print(f"Решений с сигналом BUY: {buy_decisions_count}")
 print()
 
 # Причины пропуска
@@ -254,7 +194,7 @@ if skip_reasons:
 # Упущенные возможности (упрощенно)
 if buy_decisions:
     print("Символы с сигналами BUY:")
-    for bd in buy_decisions[-10:]:  # Последние 10
+    for bd in buy_decisions:  # Последние 10
         sym = bd.get("symbol", "")
         conf = float(bd.get("confidence", 0) or 0)
         rsi = bd.get("rsi")
@@ -262,8 +202,3 @@ if buy_decisions:
 
 print()
 print("=" * 80)
-
-
-
-
-
@@ -5,6 +5,7 @@
 Используется, когда сделки были выполнены, но не записаны в audit-лог из-за ошибок
 """
 
+import io
 import re
 import os
 from datetime import datetime
@@ -13,10 +14,27 @@ from zoneinfo import ZoneInfo
 MSK_TZ = ZoneInfo("Europe/Moscow")
 LOG_FILE = "logs/trading_bot.log"
 
+# Строка начинается с timestamp — якорь ^ даёт движку быстро отбросить неподходящие строки
+_TRADE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*Ордер размещен: (BUY|SELL) (\d+) (\w+)')
+_EQUITY_RE = re.compile(r'equity[=:]?\s*([\d.]+)', re.I)
+_CASH_RE = re.compile(r'cash[=:]?\s*([\d.]+)', re.I)
+
+# Разделители отчета (с переводом строки)
+_LINE_EQ = "=" * 100 + "\n"
+_LINE_DASH = "-" * 100 + "\n"
+
+def _fast_parse(ts: str) -> datetime:
+    """"YYYY-MM-DD HH:MM:SS" (MSK) -> datetime без strptime: формат фиксирован и уже проверен regex"""
+    return datetime(
+        int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+        int(ts[11:13]), int(ts[14:16]), int(ts[17:19]),
+        tzinfo=MSK_TZ,
+    )
+
 def parse_trade_from_log(line: str) -> dict:
     """Парсит строку лога с информацией о размещении ордера"""
     # Формат: "2026-01-23 07:20:35,714 - tinvest_api - INFO - Ордер размещен: BUY 5 LNZL (order_id: ...)"
-    match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*Ордер размещен: (BUY|SELL) (\d+) (\w+)', line)
+    match = _TRADE_RE.match(line)
     if not match:
         return None
     
@@ -24,9 +42,8 @@ def parse_trade_from_log(line: str) -> dict:
     
     # Парсим время (логи в MSK)
     try:
-        dt = datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-        dt = dt.replace(tzinfo=MSK_TZ)
-    except:
+        dt = _fast_parse(time_str)
+    except ValueError:
         return None
     
     qty = int(qty_str)
@@ -40,31 +57,6 @@ def parse_trade_from_log(line: str) -> dict:
         "qty_shares": qty,  # Предполагаем lot=1, если нет информации
     }
 
-def get_account_info_from_logs(log_file: str, target_time: datetime) -> dict:
-    """Получает информацию о балансе из логов около указанного времени"""
-    equity = None
-    cash = None
-    
-    # Ищем строки с equity/cash около времени сделки
-    time_pattern = target_time.strftime("%Y-%m-%d %H:%M")
-    
-    try:
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                if time_pattern in line:
-                    # Ищем equity в строке
-                    equity_match = re.search(r'equity[=:]?\s*([\d.]+)', line, re.I)
-                    if equity_match:
-                        equity = float(equity_match.group(1))
-                    
-                    cash_match = re.search(r'cash[=:]?\s*([\d.]+)', line, re.I)
-                    if cash_match:
-                        cash = float(cash_match.group(1))
-    except:
-        pass
-    
-    return {"equity": equity or 0, "cash": cash or 0}
-
 def main():
     today_msk = datetime.now(MSK_TZ).date()
     print(f"Поиск сделок за {today_msk} (МСК) в логах...")
@@ -74,10 +66,30 @@ def main():
         return
     
     trades = []
+    # Баланс по минутам ("YYYY-MM-DD HH:MM" -> последнее значение в этой минуте)
+    # за один проход по логу вместо перечитывания файла на каждую сделку
+    equity_by_minute = {}
+    cash_by_minute = {}
     
     # Читаем логи и ищем размещения ордеров
     with open(LOG_FILE, 'r', encoding='utf-8') as f:
         for line in f:
+            minute_key = line[:16]
+            # Быстрая проверка подстрок до запуска regex (поиск без учёта регистра)
+            line_lower = line.lower()
+            equity_match = _EQUITY_RE.search(line) if "equity" in line_lower else None
+            if equity_match:
+                try:
+                    equity_by_minute[minute_key] = float(equity_match.group(1))
+                except ValueError:
+                    pass
+            cash_match = _CASH_RE.search(line) if "cash" in line_lower else None
+            if cash_match:
+                try:
+                    cash_by_minute[minute_key] = float(cash_match.group(1))
+                except ValueError:
+                    pass
+            
             if "Ордер размещен:" not in line:
                 continue
             
@@ -89,17 +101,18 @@ def main():
             if trade["datetime"].date() != today_msk:
                 continue
             
-            # Получаем информацию о балансе
-            account_info = get_account_info_from_logs(LOG_FILE, trade["datetime"])
-            trade["equity"] = account_info["equity"]
-            trade["cash"] = account_info["cash"]
-            
             # Пытаемся найти цену из следующих строк лога
             trade["price"] = 0  # Будет заполнено из других источников
             trade["amount"] = 0
             
             trades.append(trade)
     
+    # Баланс для сделки — только из строк той же минуты, что и сделка (иначе 0, как раньше)
+    for trade in trades:
+        minute_key = trade["datetime"].strftime("%Y-%m-%d %H:%M")
+        trade["equity"] = equity_by_minute.get(minute_key) or 0
+        trade["cash"] = cash_by_minute.get(minute_key) or 0
+    
     if not trades:
         print(f"\n⚠️ Сделок за {today_msk} не найдено в логах.")
         return
@@ -107,54 +120,60 @@ def main():
     # Сортируем по времени
     trades.sort(key=lambda x: x["datetime"])
     
-    # Формируем отчет
-    report = []
-    report.append("=" * 100)
-    report.append(f"ОТЧЕТ ПО ОПЕРАЦИЯМ ЗА {today_msk} (МСК)")
-    report.append("(на основе логов trading_bot.log)")
-    report.append("=" * 100)
-    report.append("")
-    report.append("⚠️ ВНИМАНИЕ: Данные из логов. Детальная информация (цены, суммы) может быть неполной.")
-    report.append("")
-    
-    # Статистика
-    buy_trades = [t for t in trades if t["action"] == "BUY"]
-    sell_trades = [t for t in trades if t["action"] == "SELL"]
-    
-    report.append("ОБЩАЯ СТАТИСТИКА:")
-    report.append(f"  Покупок: {len(buy_trades)}")
-    report.append(f"  Продаж: {len(sell_trades)}")
-    report.append(f"  Всего операций: {len(trades)}")
-    report.append("")
+    # Формируем отчет: строки сразу пишем в буфер (каждая уже с "\n"), без списка и финального join
+    out = io.StringIO()
+    w = out.write
+    w(_LINE_EQ)
+    w(f"ОТЧЕТ ПО ОПЕРАЦИЯМ ЗА {today_msk} (МСК)\n")
+    w("(на основе логов trading_bot.log)\n")
+    w(_LINE_EQ)
+    w("\n")
+    w("⚠️ ВНИМАНИЕ: Данные из логов. Детальная информация (цены, суммы) может быть неполной.\n")
+    w("\n")
+    
+    # Статистика (один проход вместо двух списков)
+    buy_count = sell_count = 0
+    for t in trades:
+        action = t["action"]
+        if action == "BUY":
+            buy_count += 1
+        elif action == "SELL":
+            sell_count += 1
+    
+    w("ОБЩАЯ СТАТИСТИКА:\n")
+    w(f"  Покупок: {buy_count}\n")
+    w(f"  Продаж: {sell_count}\n")
+    w(f"  Всего операций: {len(trades)}\n")
+    w("\n")
     
     # Детали операций
-    report.append("ДЕТАЛИ ПО ОПЕРАЦИЯМ:")
-    report.append("-" * 100)
-    report.append(f"{'Время (МСК)':<12} {'Операция':<12} {'Символ':<20} {'Кол-во (лоты)':<15} {'Баланс':<15}")
-    report.append("-" * 100)
+    w("ДЕТАЛИ ПО ОПЕРАЦИЯМ:\n")
+    w(_LINE_DASH)
+    w(f"{'Время (МСК)':<12} {'Операция':<12} {'Символ':<20} {'Кол-во (лоты)':<15} {'Баланс':<15}\n")
+    w(_LINE_DASH)
     
     for t in trades:
         action_str = "🟢 ПОКУПКА" if t["action"] == "BUY" else "🔴 ПРОДАЖА"
         equity_str = f"{t['equity']:,.2f} RUB" if t['equity'] > 0 else "N/A"
         
-        report.append(
+        w(
             f"{t['time']:<12} "
             f"{action_str:<12} "
             f"{t['symbol']:<20} "
             f"{t['qty_lots']:<15} "
-            f"{equity_str:<15}"
+            f"{equity_str:<15}\n"
         )
     
-    report.append("-" * 100)
-    report.append("")
-    report.append("ПРИМЕЧАНИЕ:")
-    report.append("  Для получения полной информации (цены, суммы, прибыль/убыток)")
-    report.append("  необходимо исправить ошибку записи в audit-лог и перезапустить бота.")
-    report.append("")
-    report.append("=" * 100)
+    w(_LINE_DASH)
+    w("\n")
+    w("ПРИМЕЧАНИЕ:\n")
+    w("  Для получения полной информации (цены, суммы, прибыль/убыток)\n")
+    w("  необходимо исправить ошибку записи в audit-лог и перезапустить бота.\n")
+    w("\n")
+    w("=" * 100)
     
     # Выводим отчет
-    report_text = "\n".join(report)
+    report_text = out.getvalue()
     print("\n" + report_text)
     
     # Сохраняем
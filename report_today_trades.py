@@ -5,26 +5,29 @@
 Показывает покупки, продажи, прибыли/убытки и баланс кошелька
 """
 
-import json
+import io
 import os
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
-from typing import List, Dict, Optional
-from collections import defaultdict
+from typing import List, Dict, Optional, Tuple
+
+from audit_logger import iter_trade_events
 
 # Пути к файлам
 AUDIT_LOG_PATH = "audit_logs/trades_audit.jsonl"
 MSK_TZ = ZoneInfo("Europe/Moscow")
 
+# Разделители отчета (с переводом строки)
+_LINE_EQ = "=" * 80 + "\n"
+_LINE_DASH = "-" * 80 + "\n"
+
 
 def parse_timestamp(ts_str: str) -> datetime:
     """Парсит timestamp из audit-лога в datetime"""
     try:
         # Формат: "2026-01-23T09:17:25.963334+00:00" или "2026-01-23T09:17:25.963334Z"
-        if ts_str.endswith('Z'):
-            dt = datetime.fromisoformat(ts_str.replace('Z', '+00:00'))
-        else:
-            dt = datetime.fromisoformat(ts_str)
+        # (fromisoformat в Python 3.11+ понимает суффикс Z)
+        dt = datetime.fromisoformat(ts_str)
         # Конвертируем в MSK
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=timezone.utc)
@@ -34,9 +37,10 @@ def parse_timestamp(ts_str: str) -> datetime:
         return datetime.now(MSK_TZ)
 
 
-def is_today_msk(dt: datetime) -> bool:
-    """Проверяет, что дата относится к сегодня (по МСК)"""
-    today_msk = datetime.now(MSK_TZ).date()
+def is_today_msk(dt: datetime, today_msk: Optional[date] = None) -> bool:
+    """Проверяет, что дата относится к сегодня (по МСК); today_msk можно передать, чтобы не вызывать now() на каждую сделку"""
+    if today_msk is None:
+        today_msk = datetime.now(MSK_TZ).date()
     return dt.date() == today_msk
 
 
@@ -45,71 +49,64 @@ def calculate_trade_amount(qty_lots: int, lot: int, price: float) -> float:
     return float(qty_lots) * float(lot) * float(price)
 
 
-def load_trades_today() -> List[Dict]:
-    """Загружает все сделки за сегодня из audit-лога"""
+def load_trades_today(now_msk: Optional[datetime] = None) -> List[Dict]:
+    """Загружает все сделки за сегодня из audit-лога (now_msk — текущее время МСК, если уже вычислено)"""
     if not os.path.exists(AUDIT_LOG_PATH):
         print(f"ОШИБКА: Файл {AUDIT_LOG_PATH} не найден")
         return []
     
     trades = []
-    today_start = datetime.now(MSK_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = datetime.now(MSK_TZ).replace(hour=23, minute=59, second=59, microsecond=999999)
+    if now_msk is None:
+        now_msk = datetime.now(MSK_TZ)
+    today_msk = now_msk.date()
+    today_start = now_msk.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Границы сегодняшнего дня МСК: iter_trade_events (mmap) отсекает не-trade строки и чужие дни
+    # по сырому ts_utc еще до JSON-парсинга
+    day_end = today_start + timedelta(days=1)
     
     try:
-        with open(AUDIT_LOG_PATH, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
+        for event in iter_trade_events(AUDIT_LOG_PATH, today_start, day_end):
+            try:
+                ts_utc = event.get("ts_utc", "")
+                if not ts_utc:
                     continue
                 
-                try:
-                    event = json.loads(line)
-                    if event.get("event") != "trade":
-                        continue
-                    
-                    ts_utc = event.get("ts_utc", "")
-                    if not ts_utc:
-                        continue
-                    
-                    dt_msk = parse_timestamp(ts_utc)
-                    
-                    # Проверяем, что это сегодня
-                    if not is_today_msk(dt_msk):
-                        continue
-                    
-                    action = event.get("action", "").upper()
-                    if action not in ["BUY", "SELL"]:
-                        continue
-                    
-                    symbol = event.get("symbol", "")
-                    qty_lots = int(event.get("qty_lots", 0) or 0)
-                    lot = int(event.get("lot", 1) or 1)
-                    price = float(event.get("price", 0) or 0)
-                    equity = float(event.get("equity", 0) or 0)
-                    cash = float(event.get("cash", 0) or 0)
-                    
-                    trade_amount = calculate_trade_amount(qty_lots, lot, price)
-                    
-                    trades.append({
-                        "timestamp": dt_msk,
-                        "symbol": symbol,
-                        "action": action,
-                        "qty_lots": qty_lots,
-                        "lot": lot,
-                        "qty_shares": qty_lots * lot,
-                        "price": price,
-                        "trade_amount": trade_amount,
-                        "equity": equity,
-                        "cash": cash,
-                        "reason": event.get("reason", ""),
-                        "order_id": event.get("order", {}).get("order_id", "") if isinstance(event.get("order"), dict) else "",
-                    })
-                except json.JSONDecodeError as e:
-                    print(f"Ошибка парсинга JSON в строке {line_num}: {e}")
+                dt_msk = parse_timestamp(ts_utc)
+                
+                # Проверяем, что это сегодня
+                if dt_msk.date() != today_msk:
                     continue
-                except Exception as e:
-                    print(f"Ошибка обработки строки {line_num}: {e}")
+                
+                action = event.get("action", "").upper()
+                if action not in ["BUY", "SELL"]:
                     continue
+                
+                symbol = event.get("symbol", "")
+                qty_lots = int(event.get("qty_lots", 0) or 0)
+                lot = int(event.get("lot", 1) or 1)
+                price = float(event.get("price", 0) or 0)
+                equity = float(event.get("equity", 0) or 0)
+                cash = float(event.get("cash", 0) or 0)
+                
+                trade_amount = calculate_trade_amount(qty_lots, lot, price)
+                
+                trades.append({
+                    "timestamp": dt_msk,
+                    "symbol": symbol,
+                    "action": action,
+                    "qty_lots": qty_lots,
+                    "lot": lot,
+                    "qty_shares": qty_lots * lot,
+                    "price": price,
+                    "trade_amount": trade_amount,
+                    "equity": equity,
+                    "cash": cash,
+                    "reason": event.get("reason", ""),
+                    "order_id": event.get("order", {}).get("order_id", "") if isinstance(event.get("order"), dict) else "",
+                })
+            except Exception as e:
+                print(f"Ошибка обработки сделки {event.get('ts_utc', '')} {event.get('symbol', '')}: {e}")
+                continue
     
     except Exception as e:
         print(f"ОШИБКА при чтении файла: {e}")
@@ -120,40 +117,49 @@ def load_trades_today() -> List[Dict]:
     return trades
 
 
-def calculate_pnl(trades: List[Dict]) -> Dict[str, Dict]:
-    """Вычисляет прибыль/убыток для каждой позиции"""
-    positions = defaultdict(list)  # symbol -> список операций
+def calculate_pnl(trades: List[Dict]) -> Tuple[List[Tuple[str, Dict]], float]:
+    """
+    Вычисляет прибыль/убыток для каждой позиции.
+    Возвращает (список (symbol, data), отсортированный по символу; суммарный P/L).
+    """
+    # Один проход с накопителями по символу: [buy_n, sell_n, buy_amt, sell_amt, buy_shr, sell_shr]
+    acc = {}
+    for t in trades:
+        a = acc.get(t["symbol"])
+        if a is None:
+            a = acc[t["symbol"]] = [0, 0, 0.0, 0.0, 0, 0]
+        action = t["action"]
+        if action == "BUY":
+            a[0] += 1
+            a[2] += t["trade_amount"]
+            a[4] += t["qty_shares"]
+        elif action == "SELL":
+            a[1] += 1
+            a[3] += t["trade_amount"]
+            a[5] += t["qty_shares"]
     
-    for trade in trades:
-        symbol = trade["symbol"]
-        positions[symbol].append(trade)
-    
-    pnl_data = {}
-    
-    for symbol, symbol_trades in positions.items():
-        buy_trades = [t for t in symbol_trades if t["action"] == "BUY"]
-        sell_trades = [t for t in symbol_trades if t["action"] == "SELL"]
-        
-        # Вычисляем среднюю цену покупки и продажи
-        total_buy_amount = sum(t["trade_amount"] for t in buy_trades)
-        total_buy_shares = sum(t["qty_shares"] for t in buy_trades)
-        avg_buy_price = total_buy_amount / total_buy_shares if total_buy_shares > 0 else 0
+    items = []
+    total_pnl = 0.0
+    for symbol in sorted(acc):
+        buy_count, sell_count, total_buy_amount, total_sell_amount, total_buy_shares, total_sell_shares = acc[symbol]
         
-        total_sell_amount = sum(t["trade_amount"] for t in sell_trades)
-        total_sell_shares = sum(t["qty_shares"] for t in sell_trades)
-        avg_sell_price = total_sell_amount / total_sell_shares if total_sell_shares > 0 else 0
+        # Средняя цена покупки и продажи
+        avg_buy_price = total_buy_amount / total_buy_shares if total_buy_shares > 0 else 0.0
+        avg_sell_price = total_sell_amount / total_sell_shares if total_sell_shares > 0 else 0.0
         
-        # Прибыль/убыток
+        # Прибыль/убыток (только если были и покупки, и продажи)
         if total_sell_shares > 0 and total_buy_shares > 0:
-            pnl = total_sell_amount - (avg_buy_price * total_sell_shares)
-            pnl_percent = (pnl / (avg_buy_price * total_sell_shares) * 100) if avg_buy_price > 0 else 0
+            cost = avg_buy_price * total_sell_shares
+            pnl = total_sell_amount - cost
+            pnl_percent = (pnl / cost * 100) if cost > 0 else 0.0
         else:
-            pnl = 0
-            pnl_percent = 0
+            pnl = 0.0
+            pnl_percent = 0.0
+        total_pnl += pnl
         
-        pnl_data[symbol] = {
-            "buy_count": len(buy_trades),
-            "sell_count": len(sell_trades),
+        items.append((symbol, {
+            "buy_count": buy_count,
+            "sell_count": sell_count,
             "total_buy_amount": total_buy_amount,
             "total_sell_amount": total_sell_amount,
             "total_buy_shares": total_buy_shares,
@@ -162,107 +168,123 @@ def calculate_pnl(trades: List[Dict]) -> Dict[str, Dict]:
             "avg_sell_price": avg_sell_price,
             "pnl": pnl,
             "pnl_percent": pnl_percent,
-        }
+        }))
     
-    return pnl_data
+    return items, total_pnl
 
 
-def format_report(trades: List[Dict], pnl_data: Dict[str, Dict]) -> str:
+def format_report(
+    trades: List[Dict],
+    pnl_items: List[Tuple[str, Dict]],
+    total_pnl: float,
+    today_str: Optional[str] = None,
+) -> str:
     """Форматирует отчет"""
     if not trades:
         return "За сегодня сделок не было."
     
-    today_str = datetime.now(MSK_TZ).strftime("%Y-%m-%d")
-    report = []
-    report.append("=" * 80)
-    report.append(f"ОТЧЕТ ПО ОПЕРАЦИЯМ ЗА {today_str} (МСК)")
-    report.append("=" * 80)
-    report.append("")
+    if today_str is None:
+        today_str = datetime.now(MSK_TZ).strftime("%Y-%m-%d")
+    # Строки пишем сразу в буфер (каждая уже с "\n"), без списка и финального join
+    out = io.StringIO()
+    w = out.write
+    w(_LINE_EQ)
+    w(f"ОТЧЕТ ПО ОПЕРАЦИЯМ ЗА {today_str} (МСК)\n")
+    w(_LINE_EQ)
+    w("\n")
     
     # Общая статистика
-    buy_trades = [t for t in trades if t["action"] == "BUY"]
-    sell_trades = [t for t in trades if t["action"] == "SELL"]
+    # Один проход: количество и суммы покупок/продаж без промежуточных списков
+    buy_count = sell_count = 0
+    total_buy_amount = total_sell_amount = 0.0
+    for t in trades:
+        action = t["action"]
+        if action == "BUY":
+            buy_count += 1
+            total_buy_amount += t["trade_amount"]
+        elif action == "SELL":
+            sell_count += 1
+            total_sell_amount += t["trade_amount"]
     
-    total_buy_amount = sum(t["trade_amount"] for t in buy_trades)
-    total_sell_amount = sum(t["trade_amount"] for t in sell_trades)
-    total_pnl = sum(pnl_data[s]["pnl"] for s in pnl_data.keys())
-    
-    report.append("ОБЩАЯ СТАТИСТИКА:")
-    report.append(f"  Покупок: {len(buy_trades)}")
-    report.append(f"  Продаж: {len(sell_trades)}")
-    report.append(f"  Всего операций: {len(trades)}")
-    report.append(f"  Сумма покупок: {total_buy_amount:,.2f} RUB")
-    report.append(f"  Сумма продаж: {total_sell_amount:,.2f} RUB")
-    report.append(f"  Общая прибыль/убыток: {total_pnl:,.2f} RUB ({total_pnl/total_buy_amount*100:.2f}%)" if total_buy_amount > 0 else f"  Общая прибыль/убыток: {total_pnl:,.2f} RUB")
-    report.append("")
+    w("ОБЩАЯ СТАТИСТИКА:\n")
+    w(f"  Покупок: {buy_count}\n")
+    w(f"  Продаж: {sell_count}\n")
+    w(f"  Всего операций: {len(trades)}\n")
+    w(f"  Сумма покупок: {total_buy_amount:,.2f} RUB\n")
+    w(f"  Сумма продаж: {total_sell_amount:,.2f} RUB\n")
+    w(f"  Общая прибыль/убыток: {total_pnl:,.2f} RUB ({total_pnl/total_buy_amount*100:.2f}%)\n" if total_buy_amount > 0 else f"  Общая прибыль/убыток: {total_pnl:,.2f} RUB\n")
+    w("\n")
     
     # Детали по операциям
-    report.append("ДЕТАЛИ ПО ОПЕРАЦИЯМ:")
-    report.append("-" * 80)
-    report.append(f"{'Время (МСК)':<20} {'Операция':<8} {'Символ':<15} {'Кол-во':<10} {'Цена':<12} {'Сумма':<15} {'Баланс':<15}")
-    report.append("-" * 80)
+    w("ДЕТАЛИ ПО ОПЕРАЦИЯМ:\n")
+    w(_LINE_DASH)
+    w(f"{'Время (МСК)':<20} {'Операция':<8} {'Символ':<15} {'Кол-во':<10} {'Цена':<12} {'Сумма':<15} {'Баланс':<15}\n")
+    w(_LINE_DASH)
     
     for trade in trades:
-        time_str = trade["timestamp"].strftime("%H:%M:%S")
         action_str = "🟢 ПОКУПКА" if trade["action"] == "BUY" else "🔴 ПРОДАЖА"
-        symbol = trade["symbol"]
         qty_str = f"{trade['qty_shares']} шт"
-        price_str = f"{trade['price']:,.2f}"
         amount_str = f"{trade['trade_amount']:,.2f} RUB"
         equity_str = f"{trade['equity']:,.2f} RUB"
-        
-        report.append(f"{time_str:<20} {action_str:<8} {symbol:<15} {qty_str:<10} {price_str:<12} {amount_str:<15} {equity_str:<15}")
+        # Вся строка — одно f-выражение
+        w(
+            f"{trade['timestamp'].strftime('%H:%M:%S'):<20} "
+            f"{action_str:<8} "
+            f"{trade['symbol']:<15} "
+            f"{qty_str:<10} "
+            f"{trade['price']:<12,.2f} "
+            f"{amount_str:<15} "
+            f"{equity_str:<15}\n"
+        )
     
-    report.append("-" * 80)
-    report.append("")
+    w(_LINE_DASH)
+    w("\n")
     
     # Прибыль/убыток по символам
-    if pnl_data:
-        report.append("ПРИБЫЛЬ/УБЫТОК ПО СИМВОЛАМ:")
-        report.append("-" * 80)
-        report.append(f"{'Символ':<15} {'Покупок':<10} {'Продаж':<10} {'Покупка':<15} {'Продажа':<15} {'P/L':<15} {'P/L %':<10}")
-        report.append("-" * 80)
+    if pnl_items:
+        w("ПРИБЫЛЬ/УБЫТОК ПО СИМВОЛАМ:\n")
+        w(_LINE_DASH)
+        w(f"{'Символ':<15} {'Покупок':<10} {'Продаж':<10} {'Покупка':<15} {'Продажа':<15} {'P/L':<15} {'P/L %':<10}\n")
+        w(_LINE_DASH)
         
-        for symbol in sorted(pnl_data.keys()):
-            data = pnl_data[symbol]
-            pnl_str = f"{data['pnl']:,.2f} RUB"
+        for symbol, data in pnl_items:
+            pnl = data['pnl']
+            pnl_str = f"{'✅' if pnl >= 0 else '❌'} {pnl:,.2f} RUB"
             pnl_percent_str = f"{data['pnl_percent']:.2f}%"
             
-            if data['pnl'] >= 0:
-                pnl_str = f"✅ {pnl_str}"
-            else:
-                pnl_str = f"❌ {pnl_str}"
-            
-            report.append(
+            w(
                 f"{symbol:<15} "
                 f"{data['buy_count']:<10} "
                 f"{data['sell_count']:<10} "
                 f"{data['total_buy_amount']:>14,.2f} "
                 f"{data['total_sell_amount']:>14,.2f} "
                 f"{pnl_str:<15} "
-                f"{pnl_percent_str:<10}"
+                f"{pnl_percent_str:<10}\n"
             )
         
-        report.append("-" * 80)
-        report.append("")
+        w(_LINE_DASH)
+        w("\n")
     
     # Баланс на момент последней операции
     if trades:
         last_trade = trades[-1]
-        report.append("БАЛАНС НА МОМЕНТ ПОСЛЕДНЕЙ ОПЕРАЦИИ:")
-        report.append(f"  Капитал (equity): {last_trade['equity']:,.2f} RUB")
-        report.append(f"  Наличные (cash): {last_trade['cash']:,.2f} RUB")
-        report.append("")
+        w("БАЛАНС НА МОМЕНТ ПОСЛЕДНЕЙ ОПЕРАЦИИ:\n")
+        w(f"  Капитал (equity): {last_trade['equity']:,.2f} RUB\n")
+        w(f"  Наличные (cash): {last_trade['cash']:,.2f} RUB\n")
+        w("\n")
     
-    report.append("=" * 80)
+    w("=" * 80)
     
-    return "\n".join(report)
+    return out.getvalue()
 
 
 def main():
     """Главная функция"""
     print("Загрузка сделок за сегодня...")
-    trades = load_trades_today()
+    # Текущее время МСК вычисляем один раз и передаем дальше
+    now_msk = datetime.now(MSK_TZ)
+    today_str = now_msk.strftime("%Y-%m-%d")
+    trades = load_trades_today(now_msk)
     
     if not trades:
         print("За сегодня сделок не найдено.")
@@ -271,15 +293,14 @@ def main():
     print(f"Найдено сделок: {len(trades)}")
     print("Вычисление прибыли/убытка...")
     
-    pnl_data = calculate_pnl(trades)
+    pnl_items, total_pnl = calculate_pnl(trades)
     
     print("Формирование отчета...")
-    report = format_report(trades, pnl_data)
+    report = format_report(trades, pnl_items, total_pnl, today_str)
     
     print("\n" + report)
     
     # Сохраняем в файл
-    today_str = datetime.now(MSK_TZ).strftime("%Y-%m-%d")
     output_file = f"reports/report_today_{today_str}.txt"
     os.makedirs("reports", exist_ok=True)
     
@@ -4,6 +4,8 @@
 """
 import logging
 from typing import Dict
+
+import numpy as np
 from config import (
     MAX_POSITION_SIZE, STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT,
     INITIAL_CAPITAL, RISK_PER_TRADE
@@ -15,13 +17,31 @@ logger = logging.getLogger(__name__)
 class RiskManager:
     """Класс для управления рисками"""
     
+    __slots__ = (
+        "max_position_size",
+        "stop_loss_percent",
+        "take_profit_percent",
+        "initial_capital",
+        "risk_per_trade",
+        "_sl_mult",
+        "_tp_mult",
+    )
+    
+    # Параметры из config читаются один раз при создании класса, а не в каждом __init__
+    _CFG = (MAX_POSITION_SIZE, STOP_LOSS_PERCENT, TAKE_PROFIT_PERCENT, INITIAL_CAPITAL, RISK_PER_TRADE)
+    
     def __init__(self):
         """Инициализация менеджера рисков"""
-        self.max_position_size = MAX_POSITION_SIZE
-        self.stop_loss_percent = STOP_LOSS_PERCENT
-        self.take_profit_percent = TAKE_PROFIT_PERCENT
-        self.initial_capital = INITIAL_CAPITAL
-        self.risk_per_trade = RISK_PER_TRADE
+        (
+            self.max_position_size,
+            self.stop_loss_percent,
+            self.take_profit_percent,
+            self.initial_capital,
+            self.risk_per_trade,
+        ) = self._CFG
+        # Множители уровней считаются один раз, а не на каждой проверке
+        self._sl_mult = 1.0 - self.stop_loss_percent
+        self._tp_mult = 1.0 + self.take_profit_percent
     
     def calculate_position_size(self, account_equity: float, price: float, confidence: float = 1.0) -> int:
         """
@@ -79,23 +99,78 @@ class RiskManager:
         qty = min(qty_by_risk, qty_cap) if qty_cap > 0 else qty_by_risk
         return max(0, qty)
     
+    def calculate_position_sizes_by_risk(
+        self,
+        account_equity: float,
+        prices,
+        stop_prices,
+        confidences,
+        risk_per_trade: float | None = None,
+    ) -> np.ndarray:
+        """
+        Пакетная версия calculate_position_size_by_risk для массива кандидатов.
+
+        prices/stop_prices/confidences — массивы одинаковой длины (или скаляр для confidences).
+        Возвращает np.ndarray[int64] с количеством акций, поэлементно совпадающий со скалярным методом
+        (включая fallback на calculate_position_size при невалидном стопе).
+        """
+        rp = self.risk_per_trade if risk_per_trade is None else float(risk_per_trade)
+        rp = max(0.0, rp)
+        equity = float(account_equity)
+
+        prices = np.asarray(prices, dtype=np.float64)
+        stops = np.asarray(stop_prices, dtype=np.float64)
+        conf_raw = np.broadcast_to(np.asarray(confidences, dtype=np.float64), prices.shape)
+        conf = np.clip(conf_raw, 0.0, 1.0)
+
+        stop_dist = np.abs(prices - stops)
+        stop_dist = np.where(np.isfinite(stop_dist), stop_dist, 0.0)
+        valid_stop = stop_dist > 0
+        price_ok = prices > 0
+        safe_prices = np.where(price_ok, prices, 1.0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # риск-бюджет с учетом уверенности
+            risk_budget = equity * rp * conf
+            qty_by_risk = np.where(
+                valid_stop & (risk_budget > 0),
+                np.trunc(risk_budget / np.where(valid_stop, stop_dist, 1.0)),
+                0.0,
+            ).astype(np.int64)
+
+            # ограничение по максимальной доле капитала
+            qty_cap = np.where(price_ok, np.trunc(equity * self.max_position_size / safe_prices), 0.0).astype(np.int64)
+            qty = np.where(qty_cap > 0, np.minimum(qty_by_risk, qty_cap), qty_by_risk)
+            qty = np.maximum(0, qty)
+
+            # fallback для невалидного стопа — как calculate_position_size (минимум 1 акция)
+            adjusted = np.minimum(self.max_position_size * conf_raw, self.max_position_size)
+            qty_fallback = np.maximum(1, np.trunc(equity * adjusted / safe_prices).astype(np.int64))
+
+        return np.where(valid_stop, qty, qty_fallback)
+
     def calculate_stop_loss(self, entry_price: float) -> float:
         """Рассчитать цену стоп-лосса"""
-        return entry_price * (1 - self.stop_loss_percent)
+        return entry_price * self._sl_mult
     
     def calculate_take_profit(self, entry_price: float) -> float:
         """Рассчитать цену тейк-профита"""
-        return entry_price * (1 + self.take_profit_percent)
+        return entry_price * self._tp_mult
+    
+    def precompute_levels(self, entry_price: float) -> tuple[float, float]:
+        """
+        Рассчитать (стоп-лосс, тейк-профит) один раз при открытии позиции.
+        Вызывающий код хранит их в позиции и дальше сравнивает цену напрямую.
+        """
+        return entry_price * self._sl_mult, entry_price * self._tp_mult
     
     def check_stop_loss(self, entry_price: float, current_price: float) -> bool:
         """Проверить, сработал ли стоп-лосс"""
-        stop_loss_price = self.calculate_stop_loss(entry_price)
-        return current_price <= stop_loss_price
+        return current_price <= entry_price * self._sl_mult
     
     def check_take_profit(self, entry_price: float, current_price: float) -> bool:
         """Проверить, сработал ли тейк-профит"""
-        take_profit_price = self.calculate_take_profit(entry_price)
-        return current_price >= take_profit_price
+        return current_price >= entry_price * self._tp_mult
     
     def validate_trade(self, account_equity: float, price: float, qty: int) -> Dict:
         """
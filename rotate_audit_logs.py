@@ -2,10 +2,22 @@ from __future__ import annotations
 
 import csv
 import json
+import mmap
 import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable
+from typing import Callable
+
+# orjson (опционально) разбирает строки без ts_utc в разы быстрее stdlib json
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -13,7 +25,26 @@ AUDIT_DIR = BASE_DIR / "audit_logs"
 JSONL_PATH = AUDIT_DIR / "trades_audit.jsonl"
 CSV_PATH = AUDIT_DIR / "trades_audit.csv"
 
+# JSONL читается блоками по 1 MiB; ts_utc достаётся из сырых байтов без полного json.loads
+_JSONL_CHUNK = 1 << 20
+# Логи до 256 MiB при полном проходе читаются целиком в память (один split вместо блоков)
+_JSONL_INMEM_MAX = 256 * (1 << 20)
+_TS_UTC_RE = re.compile(rb'"ts_utc"\s*:\s*"([^"]+)"')
+# Каноничное UTC-время без суффикса зоны: такие строки сравниваются с cutoff как строки, без datetime
+_ISO_UTC_BODY_RE = re.compile(r"\d{4}-\d{2}-\d{2}T(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:\.\d+)?")
+
+# JSONL и CSV ротируются параллельно — итоговые строки печатаются под общей блокировкой
+_PRINT_LOCK = threading.Lock()
+
+
+def _report(msg: str) -> None:
+    with _PRINT_LOCK:
+        print(msg)
+
 
+# Один и тот же ts_utc встречается в логе многократно (несколько событий в одну секунду/цикл):
+# повторные строки берутся из кэша, размер ограничен
+@lru_cache(maxsize=65536)
 def _parse_ts_utc(value: str) -> datetime | None:
     if not value:
         return None
@@ -21,49 +52,251 @@ def _parse_ts_utc(value: str) -> datetime | None:
     if not v:
         return None
     try:
-        if v.endswith("Z"):
-            v = v[:-1] + "+00:00"
+        # Быстрый путь: AuditLogger пишет UTC с суффиксом "Z" или "+00:00" — конвертация зоны не нужна
+        if v[-1] == "Z" or v.endswith("+00:00"):
+            dt = datetime.fromisoformat(v[:-1] if v[-1] == "Z" else v[:-6])
+            if dt.tzinfo is not None:
+                return None  # два смещения подряд — некорректная строка
+            return dt.replace(tzinfo=timezone.utc)
         return datetime.fromisoformat(v).astimezone(timezone.utc)
     except Exception:
         return None
 
 
+def _loads_line(line: bytes):
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass  # NaN/Infinity, большие целые — stdlib json их принимает, решение должно совпадать
+    return json.loads(line)
+
+
+def _make_keep(cutoff: datetime) -> Callable[[str], bool]:
+    """
+    Решение "оставить запись" по строке времени.
+
+    Для UTC-строк ("...Z" / "...+00:00") решает день YYYY-MM-DD: все дни до дня cutoff удаляются,
+    все после — остаются; полный разбор нужен только для дня, на который приходится cutoff.
+    Результат по дню кэшируется — за окно хранения набирается лишь несколько десятков ключей.
+    Внутри дня cutoff каноничные строки сравниваются лексикографически по "YYYY-MM-DDTHH:MM:SS";
+    datetime строится только при совпадении секунды с cutoff или для нестандартного формата.
+    """
+    cutoff_utc = cutoff.astimezone(timezone.utc)
+    cutoff_day = cutoff_utc.date().isoformat()
+    cutoff_sec = cutoff_utc.strftime("%Y-%m-%dT%H:%M:%S")
+    day_cache: dict[str, bool | None] = {}
+
+    def keep(ts_raw: str) -> bool:
+        v = ts_raw.strip()
+        if len(v) >= 10 and (v[-1] == "Z" or v.endswith("+00:00")):
+            day = v[:10]
+            try:
+                decided = day_cache[day]
+            except KeyError:
+                try:
+                    datetime.strptime(day, "%Y-%m-%d")
+                except ValueError:
+                    decided = None
+                else:
+                    decided = None if day == cutoff_day else day > cutoff_day
+                day_cache[day] = decided
+            if decided is not None:
+                return decided
+            if day == cutoff_day:
+                body = v[:-1] if v[-1] == "Z" else v[:-6]
+                if _ISO_UTC_BODY_RE.fullmatch(body):
+                    sec = body[:19]
+                    if sec != cutoff_sec:
+                        return sec > cutoff_sec
+        ts = _parse_ts_utc(v)
+        return ts is None or ts >= cutoff
+
+    return keep
+
+
 def _get_cutoff(days: int) -> datetime:
     now_utc = datetime.now(timezone.utc)
     return now_utc - timedelta(days=int(days))
 
 
+def _next_line_start(mm: mmap.mmap, pos: int, size: int) -> int:
+    """Начало первой строки, начинающейся не раньше pos"""
+    if pos <= 0:
+        return 0
+    if pos >= size:
+        return size
+    if mm[pos - 1] == 0x0A:
+        return pos
+    nl = mm.find(b"\n", pos)
+    return size if nl == -1 else nl + 1
+
+
+def _find_cutoff_offset(mm: mmap.mmap, size: int, keep: Callable[[str], bool]) -> int:
+    """
+    Бинарный поиск начала первой строки, которую нужно оставить (файл упорядочен по ts_utc).
+    Строки без ts_utc относятся к ближайшей следующей строке с ts_utc.
+    """
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        pos = _next_line_start(mm, mid, size)
+        is_old = False
+        while pos < size:
+            nl = mm.find(b"\n", pos)
+            end = size if nl == -1 else nl
+            m = _TS_UTC_RE.search(mm, pos, end)
+            if m is not None:
+                if not keep(m.group(1).decode("utf-8", "replace")):
+                    is_old = True
+                    lo = min(end + 1, size)  # последняя строка без перевода строки
+                break
+            pos = end + 1
+        if not is_old:
+            hi = mid
+    return _next_line_start(mm, lo, size)
+
+
+def _rotate_jsonl_sorted(path: Path, cutoff: datetime) -> bool:
+    """
+    Быстрая ротация упорядоченного append-only лога: ищем границу бинарным поиском и копируем
+    только хвост [offset:] одним куском (os.sendfile, где доступен), без построчной записи.
+    Голова и хвост сверяются по сырым ts_utc; если порядок нарушен (или есть битые/пустые строки,
+    строки без ts_utc) — возвращает False, и используется полный проход _rotate_jsonl_scan.
+    """
+    keep = _make_keep(cutoff)
+    with path.open("rb") as src:
+        size = os.fstat(src.fileno()).st_size
+        if size == 0:
+            return False
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = _find_cutoff_offset(mm, size, keep)
+
+            # Голова целиком должна удаляться
+            dropped = 0
+            pos = 0
+            while pos < offset:
+                nl = mm.find(b"\n", pos, offset)
+                end = offset if nl == -1 else nl
+                m = _TS_UTC_RE.search(mm, pos, end)
+                if m is None or keep(m.group(1).decode("utf-8", "replace")):
+                    return False
+                dropped += 1
+                pos = end + 1
+
+            # Хвост копируется как есть: в нём не должно быть строк, которые полный проход удалил бы.
+            # Каждая строка должна иметь свежий ts_utc; пустые строки, строки только с "ts"
+            # и старые записи не по порядку — в полный проход (проверка по сырым байтам, без JSON)
+            pos = offset
+            while pos < size:
+                nl = mm.find(b"\n", pos)
+                end = size if nl == -1 else nl
+                m = _TS_UTC_RE.search(mm, pos, end)
+                if m is None or not keep(m.group(1).decode("utf-8", "replace")):
+                    return False
+                pos = end + 1
+
+            kept = 0
+            for chunk_start in range(offset, size, _JSONL_CHUNK):
+                kept += mm[chunk_start:min(size, chunk_start + _JSONL_CHUNK)].count(b"\n")
+            ends_with_nl = mm[size - 1] == 0x0A
+            if offset < size and not ends_with_nl:
+                kept += 1
+
+            if dropped:
+                tmp_path = path.with_suffix(path.suffix + ".tmp")
+                with tmp_path.open("wb") as dst:
+                    remaining = size - offset
+                    if hasattr(os, "sendfile"):
+                        sent_pos = offset
+                        try:
+                            while remaining > 0:
+                                sent = os.sendfile(dst.fileno(), src.fileno(), sent_pos, remaining)
+                                if sent <= 0:
+                                    break
+                                sent_pos += sent
+                                remaining -= sent
+                        except OSError:
+                            pass  # ФС/платформа не поддерживает sendfile для файлов — докопируем ниже
+                    if remaining > 0:
+                        # Без sendfile (Windows): потоковое копирование блоками, без среза всего хвоста в память
+                        dst.seek(size - offset - remaining)
+                        dst.truncate()
+                        src.seek(size - remaining)
+                        shutil.copyfileobj(src, dst, length=_JSONL_CHUNK)
+                    if offset < size and not ends_with_nl:
+                        dst.write(b"\n")
+
+    if dropped:
+        # mmap и файл уже закрыты (на Windows иначе replace не пройдёт)
+        tmp_path.replace(path)
+    _report(f"[JSONL] {path.name}: всего={dropped + kept}, осталось={kept}, удалено={dropped}")
+    return True
+
+
 def _rotate_jsonl(path: Path, cutoff: datetime) -> None:
     if not path.exists():
         return
+    if _rotate_jsonl_sorted(path, cutoff):
+        return
+    _rotate_jsonl_scan(path, cutoff)
+
 
+def _rotate_jsonl_scan(path: Path, cutoff: datetime) -> None:
     tmp_path = path.with_suffix(path.suffix + ".tmp")
     kept = 0
     total = 0
+    keep = _make_keep(cutoff)
 
-    with path.open("r", encoding="utf-8") as src, tmp_path.open(
-        "w", encoding="utf-8"
-    ) as dst:
-        for line in src:
-            total += 1
-            line = line.rstrip("\n")
-            if not line.strip():
-                continue
-            try:
-                obj = json.loads(line)
-            except Exception:
-                dst.write(line + "\n")
-                kept += 1
-                continue
+    def _keep_line(line: bytes) -> bool:
+        if not line.strip():
+            return False
+        m = _TS_UTC_RE.search(line)
+        if m is not None:
+            return keep(m.group(1).decode("utf-8", "replace"))
 
-            ts_raw = obj.get("ts_utc") or obj.get("ts") or ""
-            ts = _parse_ts_utc(str(ts_raw))
-            if ts is None or ts >= cutoff:
-                dst.write(json.dumps(obj, ensure_ascii=False) + "\n")
-                kept += 1
+        # ts_utc не найден в сырой строке (нет поля / только "ts" / null) — полный разбор
+        try:
+            obj = _loads_line(line)
+        except Exception:
+            return True
+
+        # Исходные байты без json.dumps: запись сохраняется как есть
+        ts_raw = obj.get("ts_utc") or obj.get("ts") or ""
+        return keep(str(ts_raw))
+
+    with path.open("rb") as src, tmp_path.open("wb") as dst:
+        if os.fstat(src.fileno()).st_size <= _JSONL_INMEM_MAX:
+            # Обычный размер лога: читаем целиком и пишем результат одной записью
+            lines = src.read().split(b"\n")
+            if not lines[-1]:
+                lines.pop()  # перевод строки в конце файла, а не пустая запись
+            total = len(lines)
+            kept_lines = [line for line in lines if _keep_line(line)]
+            kept = len(kept_lines)
+            if kept_lines:
+                kept_lines.append(b"")
+                dst.write(b"\n".join(kept_lines))
+        else:
+            tail = b""
+            while chunk := src.read(_JSONL_CHUNK):
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()  # неполная последняя строка — в следующий блок
+                for line in lines:
+                    total += 1
+                    if _keep_line(line):
+                        dst.write(line)
+                        dst.write(b"\n")
+                        kept += 1
+            if tail:
+                total += 1
+                if _keep_line(tail):
+                    dst.write(tail)
+                    dst.write(b"\n")
+                    kept += 1
 
     tmp_path.replace(path)
-    print(f"[JSONL] {path.name}: всего={total}, осталось={kept}, удалено={total - kept}")
+    _report(f"[JSONL] {path.name}: всего={total}, осталось={kept}, удалено={total - kept}")
 
 
 def _rotate_csv(path: Path, cutoff: datetime) -> None:
@@ -77,22 +310,30 @@ def _rotate_csv(path: Path, cutoff: datetime) -> None:
     with path.open("r", encoding="utf-8", newline="") as src, tmp_path.open(
         "w", encoding="utf-8", newline=""
     ) as dst:
-        reader = csv.DictReader(src)
-        fieldnames: Iterable[str] = reader.fieldnames or []
-        writer = csv.DictWriter(dst, fieldnames=fieldnames)
-        if fieldnames:
-            writer.writeheader()
-
-        for row in reader:
-            total += 1
-            ts_raw = row.get("ts_utc") or row.get("ts") or ""
-            ts = _parse_ts_utc(str(ts_raw))
-            if ts is None or ts >= cutoff:
-                writer.writerow(row)
-                kept += 1
+        # Построчно списками: индекс колонки времени находим один раз, без dict на каждую строку
+        reader = csv.reader(src)
+        writer = csv.writer(dst)
+        keep = _make_keep(cutoff)
+        header = next(reader, None)
+        if header:
+            writer.writerow(header)
+            n_cols = len(header)
+            idx_ts_utc = header.index("ts_utc") if "ts_utc" in header else None
+            idx_ts = header.index("ts") if "ts" in header else None
+
+            for row in reader:
+                if not row:
+                    continue  # пустые строки DictReader тоже пропускал
+                total += 1
+                if len(row) < n_cols:
+                    row += [""] * (n_cols - len(row))
+                ts_raw = (row[idx_ts_utc] if idx_ts_utc is not None else "") or (row[idx_ts] if idx_ts is not None else "")
+                if keep(ts_raw):
+                    writer.writerow(row)
+                    kept += 1
 
     tmp_path.replace(path)
-    print(f"[CSV] {path.name}: всего={total}, осталось={kept}, удалено={total - kept}")
+    _report(f"[CSV] {path.name}: всего={total}, осталось={kept}, удалено={total - kept}")
 
 
 def main() -> None:
@@ -103,8 +344,14 @@ def main() -> None:
 
     AUDIT_DIR.mkdir(parents=True, exist_ok=True)
 
-    _rotate_jsonl(JSONL_PATH, cutoff)
-    _rotate_csv(CSV_PATH, cutoff)
+    # Файлы независимы, работа в основном дисковая — запускаем обе ротации в потоках
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [
+            ex.submit(_rotate_jsonl, JSONL_PATH, cutoff),
+            ex.submit(_rotate_csv, CSV_PATH, cutoff),
+        ]
+        for fut in futures:
+            fut.result()  # пробрасываем исключения из потоков
 
 
 if __name__ == "__main__":
@@ -14,137 +14,61 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import sys
+import time
 from datetime import datetime, timezone
+from types import SimpleNamespace
 
 from config import BROKER, TINVEST_SANDBOX, TINVEST_TOKEN
-
-
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--type", default="all", choices=["all", "share", "etf", "currency", "bond"], help="Instrument type to search")
-    ap.add_argument("--query", required=True, help="Substring to search in ticker/name (case-insensitive)")
-    ap.add_argument("--limit", type=int, default=50, help="Max results to print")
-    args = ap.parse_args()
-
-    # Windows-консоли иногда не UTF‑8 → защитимся
+from state_store import load_json, save_json_atomic
+
+# Кэш справочников инструментов (shares/etfs/currencies/bonds): повторный поиск не качает списки заново
+INSTRUMENTS_CACHE_PATH = "state/instruments_cache_{kind}_{sandbox}.json"
+# Поля, которые нужны для match()/pack()
+_CACHED_FIELDS = ("ticker", "name", "figi", "lot", "currency", "trading_status")
+
+
+def _instrument_fields(it) -> dict:
+    out = {}
+    for f in _CACHED_FIELDS:
+        v = getattr(it, f, None)
+        if f == "trading_status" and v is not None:
+            v = str(v)
+        elif f == "lot" and v is not None:
+            try:
+                v = int(v)
+            except Exception:
+                v = None
+        elif v is not None:
+            v = str(v)
+        out[f] = v
+    return out
+
+
+def _cached_instruments(kind: str, fetch_fn, ttl_sec: float, force: bool = False) -> list:
+    """
+    Список инструментов типа kind (SimpleNamespace с полями _CACHED_FIELDS).
+    Свежий (моложе ttl_sec) кэш в state/ используется без обращения к API; иначе fetch_fn() и запись кэша.
+    """
+    path = INSTRUMENTS_CACHE_PATH.format(kind=kind, sandbox=int(bool(TINVEST_SANDBOX)))
+    if not force:
+        cache = load_json(path) or {}
+        try:
+            age = time.time() - float(cache.get("ts", 0))
+        except (TypeError, ValueError):
+            age = -1
+        items = cache.get("instruments")
+        if 0 <= age <= ttl_sec and isinstance(items, list):
+            return [SimpleNamespace(**d) for d in items if isinstance(d, dict)]
+
+    resp = fetch_fn()
+    items = [_instrument_fields(it) for it in (getattr(resp, "instruments", []) or [])]
     try:
-        sys.stdout.reconfigure(encoding="utf-8")
-        sys.stderr.reconfigure(encoding="utf-8")
+        save_json_atomic(path, {"ts": time.time(), "instruments": items})
     except Exception:
         pass
-
-    if BROKER != "tinvest":
-        raise SystemExit("BROKER must be tinvest for this script")
-    if not TINVEST_TOKEN:
-        raise SystemExit("TINVEST_TOKEN is empty")
-
-    try:
-        from tinvest_api import TInvestAPI  # type: ignore
-    except Exception as e:
-        raise SystemExit(f"Cannot import TInvestAPI: {e}")
-
-    api = TInvestAPI(sandbox=bool(TINVEST_SANDBOX))
-    if not getattr(api, "client", None):
-        raise SystemExit("TInvestAPI not initialized (client=None)")
-
-    if getattr(api, "TINVEST_SDK_TYPE", "official") != "official":
-        # В tinvest_api.py это глобальная константа, но проверим безопасно
-        pass
-
-    q = str(args.query).strip().upper()
-    if not q:
-        raise SystemExit("query is empty")
-
-    # Подключимся напрямую к official client через внутренний helper
-    if not hasattr(api, "_create_official_client"):
-        raise SystemExit("TInvestAPI has no _create_official_client()")
-
-    def match(it) -> bool:
-        t = str(getattr(it, "ticker", "") or "").upper()
-        n = str(getattr(it, "name", "") or "").upper()
-        return (q in t) or (q in n)
-
-    def pack(it, typ: str) -> str:
-        ticker = str(getattr(it, "ticker", "") or "")
-        name = str(getattr(it, "name", "") or "")
-        figi = str(getattr(it, "figi", "") or "")
-        lot = getattr(it, "lot", None)
-        try:
-            lot_i = int(lot) if lot is not None else 1
-        except Exception:
-            lot_i = 1
-        cur = str(getattr(it, "currency", "") or "")
-        st = getattr(it, "trading_status", None)
-        st_s = str(st) if st is not None else ""
-        return f"{ticker:14}  {typ:8}  lot={lot_i:<4}  cur={cur:4}  status={st_s:12}  figi={figi}  name={name}"
-
-    printed = 0
-    print("=" * 110)
-    print("SEARCH INSTRUMENTS (T-Invest)")
-    print("=" * 110)
-    print(f"utc: {datetime.now(timezone.utc).isoformat().replace('+00:00','Z')}")
-    print(f"sandbox: {TINVEST_SANDBOX}")
-    print(f"type: {args.type}  query: {args.query}")
-    print("-" * 110)
-
-    try:
-        with api._create_official_client() as client:  # type: ignore
-            targets = []
-            if args.type in ("all", "share"):
-                targets.append(("share", lambda: client.instruments.shares()))
-            if args.type in ("all", "etf"):
-                targets.append(("etf", lambda: client.instruments.etfs()))
-            if args.type in ("all", "currency"):
-                targets.append(("currency", lambda: client.instruments.currencies()))
-            if args.type in ("all", "bond"):
-                targets.append(("bond", lambda: client.instruments.bonds()))
-
-            for typ, fn in targets:
-                try:
-                    resp = fn()
-                except Exception:
-                    continue
-                for it in getattr(resp, "instruments", []) or []:
-                    if not match(it):
-                        continue
-                    print(pack(it, typ))
-                    printed += 1
-                    if printed >= int(args.limit):
-                        print("-" * 110)
-                        print(f"limit reached: {printed}")
-                        return 0
-    except Exception as e:
-        raise SystemExit(f"search failed: {e}")
-
-    print("-" * 110)
-    print(f"found: {printed}")
-    return 0
-
-
-if __name__ == "__main__":
-    raise SystemExit(main())
-
-
-
-
-Зачем: валюта/драгметаллы/ETF могут иметь тикеры, отличающиеся от "ожидаемых".
-Скрипт помогает быстро найти реальные tickers/FIGI.
-
-Примеры:
-  python search_instruments.py --type currency --query EUR
-  python search_instruments.py --type currency --query RUB
-  python search_instruments.py --type etf --query GOLD
-  python search_instruments.py --type etf --query GLD
-"""
-
-from __future__ import annotations
-
-import argparse
-import sys
-from datetime import datetime, timezone
-
-from config import BROKER, TINVEST_SANDBOX, TINVEST_TOKEN
+    return [SimpleNamespace(**d) for d in items]
 
 
 def main() -> int:
@@ -152,6 +76,8 @@ def main() -> int:
     ap.add_argument("--type", default="all", choices=["all", "share", "etf", "currency", "bond"], help="Instrument type to search")
     ap.add_argument("--query", required=True, help="Substring to search in ticker/name (case-insensitive)")
     ap.add_argument("--limit", type=int, default=50, help="Max results to print")
+    ap.add_argument("--cache-ttl", type=float, default=3600, help="Seconds to trust the on-disk instruments cache")
+    ap.add_argument("--force", action="store_true", help="Ignore the instruments cache and download lists again")
     args = ap.parse_args()
 
     # Windows-консоли иногда не UTF‑8 → защитимся
@@ -187,11 +113,6 @@ def main() -> int:
     if not hasattr(api, "_create_official_client"):
         raise SystemExit("TInvestAPI has no _create_official_client()")
 
-    def match(it) -> bool:
-        t = str(getattr(it, "ticker", "") or "").upper()
-        n = str(getattr(it, "name", "") or "").upper()
-        return (q in t) or (q in n)
-
     def pack(it, typ: str) -> str:
         ticker = str(getattr(it, "ticker", "") or "")
         name = str(getattr(it, "name", "") or "")
@@ -216,25 +137,37 @@ def main() -> int:
     print("-" * 110)
 
     try:
-        with api._create_official_client() as client:  # type: ignore
+        # Клиент открывается лениво — только если какого-то списка нет в кэше
+        with contextlib.ExitStack() as stack:
+            client_box = []
+
+            def get_client():
+                if not client_box:
+                    client_box.append(stack.enter_context(api._create_official_client()))  # type: ignore
+                return client_box[0]
+
             targets = []
             if args.type in ("all", "share"):
-                targets.append(("share", lambda: client.instruments.shares()))
+                targets.append(("share", lambda: get_client().instruments.shares()))
             if args.type in ("all", "etf"):
-                targets.append(("etf", lambda: client.instruments.etfs()))
+                targets.append(("etf", lambda: get_client().instruments.etfs()))
             if args.type in ("all", "currency"):
-                targets.append(("currency", lambda: client.instruments.currencies()))
+                targets.append(("currency", lambda: get_client().instruments.currencies()))
             if args.type in ("all", "bond"):
-                targets.append(("bond", lambda: client.instruments.bonds()))
+                targets.append(("bond", lambda: get_client().instruments.bonds()))
 
             for typ, fn in targets:
                 try:
-                    resp = fn()
+                    instruments = _cached_instruments(typ, fn, float(args.cache_ttl), force=bool(args.force))
                 except Exception:
                     continue
-                for it in getattr(resp, "instruments", []) or []:
-                    if not match(it):
-                        continue
+                # Фильтр одним list comprehension; name приводится к верхнему регистру,
+                # только если q не нашёлся в тикере
+                matched = [
+                    it for it in instruments
+                    if q in (it.ticker or "").upper() or q in (it.name or "").upper()
+                ]
+                for it in matched:
                     print(pack(it, typ))
                     printed += 1
                     if printed >= int(args.limit):
@@ -251,5 +184,3 @@ def main() -> int:
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
-
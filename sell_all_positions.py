@@ -4,31 +4,35 @@
 """
 import sys
 import logging
+import logging.handlers
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from broker_api import BrokerAPI
 from config import TINVEST_SANDBOX, BROKER, ENABLE_TRADING
 
-# Настройка логирования
+# Настройка логирования: записи копятся в MemoryHandler и выводятся пачкой
+# (сбрасываются явно, при заполнении буфера или сразу на ERROR)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_buffer = logging.handlers.MemoryHandler(capacity=64, target=_stream_handler)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.StreamHandler()
+        _log_buffer
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Канонизация тикеров (импорт один раз при загрузке модуля, а не на каждый вызов)
+try:
+    from tinvest_api import TICKER_CANONICAL_MAP  # type: ignore
+except Exception:
+    TICKER_CANONICAL_MAP = {}
+
 def _canon_symbol(sym: str) -> str:
     """Канонизация символа"""
     s = str(sym or "").strip().upper()
-    if not s:
-        return s
-    try:
-        from tinvest_api import TICKER_CANONICAL_MAP
-        result = str(TICKER_CANONICAL_MAP.get(s, s)).strip().upper()
-        return result
-    except Exception:
-        return s
+    return str(TICKER_CANONICAL_MAP.get(s, s)).strip().upper() if s else s
 
 def _ensure_ticker_not_figi(symbol: str, broker_api) -> str:
     """Убедиться, что symbol является тикером, а не FIGI"""
@@ -86,12 +90,14 @@ def sell_all_positions():
     logger.info(f"📊 Найдено позиций: {len(positions)}")
     logger.info("")
     
-    # Подтверждение
-    print("\n" + "=" * 60)
-    print("⚠️  ВНИМАНИЕ: Вы собираетесь продать ВСЕ позиции!")
-    print("=" * 60)
-    print(f"Количество позиций: {len(positions)}")
-    print("\nСписок позиций для продажи:")
+    # Подтверждение: список собираем целиком и выводим одной записью
+    lines = [
+        "\n" + "=" * 60,
+        "⚠️  ВНИМАНИЕ: Вы собираетесь продать ВСЕ позиции!",
+        "=" * 60,
+        f"Количество позиций: {len(positions)}",
+        "\nСписок позиций для продажи:",
+    ]
     for i, pos in enumerate(positions, 1):
         symbol = pos.get('symbol', '?')
         qty_lots = pos.get('qty_lots', pos.get('qty', 0)) or 0
@@ -99,9 +105,13 @@ def sell_all_positions():
         current_price = pos.get('current_price', 0) or 0
         qty_shares = float(qty_lots) * float(lot)
         total_value = float(current_price) * float(qty_shares) if current_price > 0 else 0
-        print(f"  {i}. {symbol}: {qty_lots} лот(ов) (лот={lot}) = {qty_shares:.0f} акций @ {current_price:.2f} = {total_value:.2f} RUB")
+        lines.append(f"  {i}. {symbol}: {qty_lots} лот(ов) (лот={lot}) = {qty_shares:.0f} акций @ {current_price:.2f} = {total_value:.2f} RUB")
+    lines.append("\n" + "=" * 60)
     
-    print("\n" + "=" * 60)
+    # Накопленные логи должны появиться до списка и вопроса
+    _log_buffer.flush()
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
     response = input("Продолжить продажу всех позиций? (yes/no): ").strip().lower()
     
     if response not in ['yes', 'y', 'да', 'д']:
@@ -112,6 +122,23 @@ def sell_all_positions():
     logger.info("🚀 Начинаем продажу...")
     logger.info("")
     
+    # Тикеры и детали инструментов готовим заранее: по одному запросу на уникальный тикер,
+    # запросы идут параллельно, а не по очереди внутри цикла продажи
+    symbol_for_api_map = {}
+    for pos in positions:
+        symbol = pos.get('symbol', '?')
+        try:
+            qty_lots = int(pos.get('qty_lots', pos.get('qty', 0)) or 0)
+        except (TypeError, ValueError):
+            continue
+        if qty_lots > 0 and symbol not in symbol_for_api_map:
+            symbol_for_api_map[symbol] = _ensure_ticker_not_figi(symbol, broker)
+    unique_symbols = list(dict.fromkeys(symbol_for_api_map.values()))
+    instr_map = {}
+    if unique_symbols:
+        with ThreadPoolExecutor(max_workers=min(8, len(unique_symbols))) as pool:
+            instr_map = dict(zip(unique_symbols, pool.map(broker.get_instrument_details, unique_symbols)))
+    
     # Продаем каждую позицию
     success_count = 0
     error_count = 0
@@ -133,10 +160,10 @@ def sell_all_positions():
             logger.info(f"📤 {i}. Продажа {symbol}: {qty_lots} лот(ов) (лот={lot}) = {qty_shares:.0f} акций @ {current_price:.2f} RUB")
             
             # Убеждаемся, что symbol является тикером, а не FIGI
-            symbol_for_api = _ensure_ticker_not_figi(symbol, broker)
+            symbol_for_api = symbol_for_api_map.get(symbol) or _ensure_ticker_not_figi(symbol, broker)
             
-            # Получаем детали инструмента (для проверки)
-            instrument = broker.get_instrument_details(symbol_for_api)
+            # Детали инструмента (для проверки) — из заранее собранного instr_map
+            instrument = instr_map.get(symbol_for_api)
             if instrument:
                 ticker = instrument.get('ticker', symbol_for_api)
                 logger.info(f"   Инструмент: {ticker} (FIGI: {instrument.get('figi', 'N/A')})")
@@ -160,6 +187,9 @@ def sell_all_positions():
             logger.error(f"❌ Ошибка при продаже {pos.get('symbol', '?')}: {e}", exc_info=True)
             error_count += 1
             logger.info("")
+        finally:
+            # Прогресс выводим пачкой по каждой позиции (ордер может идти несколько секунд)
+            _log_buffer.flush()
     
     # Итоги
     logger.info("=" * 60)
@@ -174,6 +204,7 @@ def sell_all_positions():
         logger.info("✅ Заявки на продажу размещены успешно!")
         logger.info("   Проверьте статус заявок в портфеле или через брокера")
     
+    _log_buffer.flush()
     return success_count > 0
 
 if __name__ == "__main__":
@@ -1,9 +1,47 @@
 from __future__ import annotations
 
 import json
+import math
 import os
 from typing import Any, Optional
 
+# orjson (опционально) сериализует в разы быстрее stdlib json
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+# Человекочитаемые state-файлы (indent=2) — только по запросу: STATE_PRETTY=1
+STATE_PRETTY = os.getenv("STATE_PRETTY", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _has_nonfinite(obj: Any) -> bool:
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(_has_nonfinite(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_has_nonfinite(v) for v in obj)
+    return False
+
+
+def _dumps(data: dict[str, Any]) -> bytes:
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if STATE_PRETTY:
+            opts |= orjson.OPT_INDENT_2
+        try:
+            out = orjson.dumps(data, option=opts)
+            # orjson пишет NaN/Infinity как null, stdlib json — как NaN/Infinity (и так же читает обратно).
+            # Обходим данные только если в выводе вообще есть null.
+            if b"null" not in out or not _has_nonfinite(data):
+                return out
+        except TypeError:
+            pass  # нестандартные типы — пусть разбирается stdlib json (как раньше)
+    if STATE_PRETTY:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
 def load_json(path: str) -> Optional[dict[str, Any]]:
     try:
@@ -15,20 +53,41 @@ def load_json(path: str) -> Optional[dict[str, Any]]:
         return None
 
 
-def save_json_atomic(path: str, data: dict[str, Any]) -> None:
+def save_json_atomic(path: str, data: dict[str, Any], durable: bool = False) -> None:
+    """
+    Атомарная запись JSON (tmp + os.replace).
+
+    durable=False (по умолчанию) — без fsync: для частых сохранений состояния достаточно атомарности.
+    durable=True — fsync файла и родительского каталога (переживает падение ОС/питания).
+    """
     d = os.path.dirname(path)
     if d:
         os.makedirs(d, exist_ok=True)
+    payload = _dumps(data)
     tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    # Одна запись целиком через буфер 64KB
+    with open(tmp, "wb", buffering=1 << 16) as f:
+        f.write(payload)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
     os.replace(tmp, path)
+    if durable:
+        _fsync_dir(d or ".")
 
 
-
-
-
-
-
-
-
+def _fsync_dir(d: str) -> None:
+    # На Windows каталог так не открыть — там достаточно fsync самого файла
+    flags = getattr(os, "O_DIRECTORY", None)
+    if flags is None:
+        return
+    try:
+        fd = os.open(d, os.O_RDONLY | flags)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -20,6 +20,7 @@
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, List
 
@@ -27,8 +28,37 @@ import pandas as pd
 
 from trading_strategy import TradingStrategy
 
-
-@dataclass
+# Последний базовый анализ TradingStrategy: (data, ta, ключ, результат).
+# Ансамбль прогоняет hybrid/trend/mean на одном и том же DataFrame — индикаторы считаются один раз.
+# Ссылка на data хранится, чтобы id(data) не мог достаться другому DataFrame, пока запись жива.
+_last_base: tuple | None = None
+
+
+def _coerce_analysis(x) -> Dict:
+    """Результат анализа -> dict со строковым signal (нормализуем один раз на месте вызова, а не в каждой стратегии)"""
+    if not isinstance(x, dict):
+        x = x.to_dict() if hasattr(x, "to_dict") else {}
+    sig = x.get("signal")
+    if not isinstance(sig, str):
+        x["signal"] = "hold" if sig is None or isinstance(sig, pd.Series) else str(sig)
+    return x
+
+
+def _analyze_base(ta: TradingStrategy, data: pd.DataFrame) -> Dict:
+    """TradingStrategy.analyze(data) с кэшем на последний DataFrame; возвращает копию (стратегии правят результат)"""
+    global _last_base
+    if data.empty:
+        return _coerce_analysis(ta.analyze(data))
+    key = (len(data), data.index[-1], data["Close"].iat[-1] if "Close" in data.columns else None)
+    cached = _last_base  # один снимок: запись может смениться из пула ансамбля
+    if cached is not None and cached[0] is data and cached[1] is ta and cached[2] == key:
+        return dict(cached[3])
+    base = _coerce_analysis(ta.analyze(data))
+    _last_base = (data, ta, key, base)
+    return dict(base)
+
+
+@dataclass(slots=True)  # без __dict__ на экземпляр (Python 3.10+)
 class StrategyResult:
     signal: str
     confidence: float
@@ -60,6 +90,24 @@ class StrategyResult:
         }
 
 
+def _make_result(signal: str, confidence: float, buy: int, sell: int, base: Dict, macd_hist) -> Dict:
+    """Итог стратегии в формате StrategyResult.to_dict(), сразу dict-литералом (без промежуточного dataclass)"""
+    return {
+        "signal": signal,
+        "confidence": float(confidence),
+        "buy_signals": buy,
+        "sell_signals": sell,
+        "trend": base.get("trend"),
+        "atr": base.get("atr"),
+        "rsi": base.get("rsi"),
+        "ma_short": base.get("ma_short"),
+        "ma_long": base.get("ma_long"),
+        "macd": base.get("macd"),
+        "macd_signal": base.get("macd_signal"),
+        "macd_hist": macd_hist,
+    }
+
+
 class BaseStrategy:
     name = "base"
 
@@ -68,39 +116,39 @@ class BaseStrategy:
 
     def should_buy(self, analysis: Dict, min_confidence: float = 0.55) -> bool:
         # Общие "фильтры безопасности" (чтобы не покупать на вершине/в падающем ножe)
-        rsi = analysis.get("rsi")
-        trend = analysis.get("trend")
-        macd_hist = analysis.get("macd_hist")
-        macd_hist_prev = analysis.get("macd_hist_prev")
+        get = analysis.get
+        rsi = get("rsi")
+        trend = get("trend")
+        macd_hist = get("macd_hist")
+        macd_hist_prev = get("macd_hist_prev")
+        # analyze() отдаёт числа (float/np.float64) или None: нечисловое значение = нет данных, без try/float()
+        if not isinstance(rsi, (int, float)):
+            rsi = None
+        if not isinstance(macd_hist, (int, float)):
+            macd_hist = None
+        if not isinstance(macd_hist_prev, (int, float)):
+            macd_hist_prev = None
 
         # Не покупаем на перекупленности (в GAZP это давало стопы)
-        if rsi is not None:
-            try:
-                if float(rsi) > 68:
-                    return False
-            except Exception:
-                pass
+        if rsi is not None and rsi > 68:
+            return False
 
         # Не покупаем против падающего тренда
         if trend == "down":
             return False
 
         # В боковике не покупаем при отрицательном импульсе
-        if trend == "sideways" and macd_hist is not None:
-            try:
-                if float(macd_hist) < 0:
-                    # Разрешаем mean-reversion вход в боковике только на перепроданности.
-                    # Иначе bot часто "пилится" на шуме.
-                    if rsi is None or float(rsi) > 35:
-                        return False
-
-                    # Доп. защита от "падающего ножа": если импульс ухудшается — не покупаем.
-                    if macd_hist_prev is not None and float(macd_hist) < float(macd_hist_prev):
-                        return False
-            except Exception:
-                pass
-
-        return analysis.get("signal") == "buy" and float(analysis.get("confidence", 0.0) or 0.0) >= float(min_confidence)
+        if trend == "sideways" and macd_hist is not None and macd_hist < 0:
+            # Разрешаем mean-reversion вход в боковике только на перепроданности.
+            # Иначе bot часто "пилится" на шуме.
+            if rsi is None or rsi > 35:
+                return False
+
+            # Доп. защита от "падающего ножа": если импульс ухудшается — не покупаем.
+            if macd_hist_prev is not None and macd_hist < macd_hist_prev:
+                return False
+
+        return get("signal") == "buy" and float(get("confidence", 0.0) or 0.0) >= float(min_confidence)
 
     def should_sell(self, analysis: Dict, min_confidence: float = 0.5) -> bool:
         return analysis.get("signal") == "sell" and analysis.get("confidence", 0.0) >= min_confidence
@@ -114,11 +162,11 @@ class HybridStrategy(BaseStrategy):
 
     name = "hybrid"
 
-    def __init__(self):
-        self._impl = TradingStrategy()
+    def __init__(self, ta: TradingStrategy | None = None):
+        self._impl = ta or TradingStrategy()
 
     def analyze(self, data: pd.DataFrame) -> Dict:
-        return self._impl.analyze(data)
+        return _analyze_base(self._impl, data)
 
     def should_buy(self, analysis: Dict, min_confidence: float = 0.55) -> bool:
         return self._impl.should_buy(analysis, min_confidence=min_confidence)
@@ -135,34 +183,13 @@ class TrendFollowingStrategy(BaseStrategy):
 
     name = "trend"
 
-    def __init__(self):
-        self._ta = TradingStrategy()
+    def __init__(self, ta: TradingStrategy | None = None):
+        self._ta = ta or TradingStrategy()
 
     def analyze(self, data: pd.DataFrame) -> Dict:
-        base = self._ta.analyze(data)
-        # Если base - не словарь, преобразуем его
-        if not isinstance(base, dict):
-            if hasattr(base, 'to_dict'):
-                base = base.to_dict()
-            elif hasattr(base, '__dict__'):
-                base = dict(base.__dict__)
-            else:
-                base = dict(base) if hasattr(base, 'get') else {}
-        
-        # Получаем signal безопасно (может быть Series или другой тип)
-        base_signal = base.get("signal")
-        if isinstance(base_signal, pd.Series):
-            base_signal = str(base_signal.iloc[-1]) if len(base_signal) > 0 else "hold"
-        elif hasattr(base_signal, '__iter__') and not isinstance(base_signal, str):
-            # Если это итерируемый объект, но не строка
-            try:
-                base_signal = str(list(base_signal)[-1]) if len(list(base_signal)) > 0 else "hold"
-            except:
-                base_signal = "hold"
-        elif base_signal is None:
-            base_signal = "hold"
-        else:
-            base_signal = str(base_signal)
+        # _analyze_base уже вернул dict со строковым signal
+        base = _analyze_base(self._ta, data)
+        base_signal = base["signal"]
         
         # Если данных мало — возвращаем base
         if base.get("confidence", 0.0) == 0.0 and base_signal == "hold":
@@ -203,35 +230,9 @@ class TrendFollowingStrategy(BaseStrategy):
                 conf = max(conf, base.get("confidence", 0.0))
 
         if buy > sell and conf >= 0.55:
-            return StrategyResult(
-                signal="buy",
-                confidence=conf,
-                buy_signals=buy,
-                sell_signals=sell,
-                trend=trend,
-                atr=base.get("atr"),
-                rsi=base.get("rsi"),
-                ma_short=base.get("ma_short"),
-                ma_long=base.get("ma_long"),
-                macd=base.get("macd"),
-                macd_signal=base.get("macd_signal"),
-                macd_hist=macd_hist,
-            ).to_dict()
+            return _make_result("buy", conf, buy, sell, base, macd_hist)
         if sell > buy and conf >= 0.5:
-            return StrategyResult(
-                signal="sell",
-                confidence=conf,
-                buy_signals=buy,
-                sell_signals=sell,
-                trend=trend,
-                atr=base.get("atr"),
-                rsi=base.get("rsi"),
-                ma_short=base.get("ma_short"),
-                ma_long=base.get("ma_long"),
-                macd=base.get("macd"),
-                macd_signal=base.get("macd_signal"),
-                macd_hist=macd_hist,
-            ).to_dict()
+            return _make_result("sell", conf, buy, sell, base, macd_hist)
 
         # Если стратегия не уверена — hold
         base["signal"] = "hold"
@@ -247,18 +248,18 @@ class MeanReversionStrategy(BaseStrategy):
 
     name = "mean"
 
-    def __init__(self):
-        self._ta = TradingStrategy()
+    def __init__(self, ta: TradingStrategy | None = None):
+        self._ta = ta or TradingStrategy()
 
     def analyze(self, data: pd.DataFrame) -> Dict:
         if data.empty or len(data) < 50:
             return {"signal": "hold", "confidence": 0.0}
 
-        # Используем базовые индикаторы из TradingStrategy
-        base = self._ta.analyze(data)
-        # Если base - не словарь, преобразуем его
-        if not isinstance(base, dict):
-            base = dict(base) if hasattr(base, 'get') else {}
+        # Используем базовые индикаторы из TradingStrategy.
+        # Пропускать расчёт при "нейтральном" RSI нельзя: SELL даёт и отрицательный MACD вне up-тренда
+        # (в ансамбле это вето на BUY). Hold возвращает base целиком — backtest.py читает из него rsi/macd/atr.
+        # В ансамбле base приходит из общего кэша _analyze_base и отдельно не пересчитывается.
+        base = _analyze_base(self._ta, data)
         
         rsi = base.get("rsi")
         macd_hist = base.get("macd_hist")
@@ -286,35 +287,9 @@ class MeanReversionStrategy(BaseStrategy):
             conf = max(conf, 0.6)
 
         if buy > sell and conf >= 0.55:
-            return StrategyResult(
-                signal="buy",
-                confidence=conf,
-                buy_signals=buy,
-                sell_signals=sell,
-                trend=trend,
-                atr=base.get("atr"),
-                rsi=rsi,
-                ma_short=base.get("ma_short"),
-                ma_long=base.get("ma_long"),
-                macd=base.get("macd"),
-                macd_signal=base.get("macd_signal"),
-                macd_hist=macd_hist,
-            ).to_dict()
+            return _make_result("buy", conf, buy, sell, base, macd_hist)
         if sell > buy and conf >= 0.5:
-            return StrategyResult(
-                signal="sell",
-                confidence=conf,
-                buy_signals=buy,
-                sell_signals=sell,
-                trend=trend,
-                atr=base.get("atr"),
-                rsi=rsi,
-                ma_short=base.get("ma_short"),
-                ma_long=base.get("ma_long"),
-                macd=base.get("macd"),
-                macd_signal=base.get("macd_signal"),
-                macd_hist=macd_hist,
-            ).to_dict()
+            return _make_result("sell", conf, buy, sell, base, macd_hist)
 
         base["signal"] = "hold"
         base["confidence"] = 0.0
@@ -334,15 +309,35 @@ class EnsembleStrategy(BaseStrategy):
 
     name = "ensemble"
 
+    # Пул для независимых стратегий на длинной истории (pandas rolling/ewm отпускают GIL)
+    PARALLEL_MIN_BARS = 1000
+    _executor: ThreadPoolExecutor | None = None
+
     def __init__(self, strategies: List[BaseStrategy] | None = None):
-        self.strategies = strategies or [HybridStrategy(), TrendFollowingStrategy(), MeanReversionStrategy()]
+        # Стандартный набор делит один базовый анализ (см. _analyze_base) — после первого расчёта
+        # остальные стратегии работают с кэшем, параллелить нечего. Пул — только для переданного набора.
+        self._parallel = bool(strategies) and len(strategies) > 1
+        if not strategies:
+            # Один TradingStrategy на всех: базовый анализ считается один раз (см. _analyze_base)
+            ta = TradingStrategy()
+            strategies = [HybridStrategy(ta), TrendFollowingStrategy(ta), MeanReversionStrategy(ta)]
+        self.strategies = strategies
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="ensemble")
+        return cls._executor
 
     def analyze(self, data: pd.DataFrame) -> Dict:
-        # Собираем анализы по именам стратегий
+        # Собираем анализы по именам стратегий (порядок — как в self.strategies)
+        if self._parallel and len(data) >= self.PARALLEL_MIN_BARS:
+            analyses = list(self._get_executor().map(lambda s: s.analyze(data), self.strategies))
+        else:
+            analyses = [s.analyze(data) for s in self.strategies]
         by_name: Dict[str, Dict] = {}
         best_conf = 0.0
-        for s in self.strategies:
-            a = s.analyze(data)
+        for s, a in zip(self.strategies, analyses):
             by_name[getattr(s, "name", s.__class__.__name__).lower()] = a
             best_conf = max(best_conf, float(a.get("confidence", 0.0) or 0.0))
 
@@ -351,43 +346,22 @@ class EnsembleStrategy(BaseStrategy):
         trend = by_name.get("trend", {"signal": "hold", "confidence": 0.0})
         mean = by_name.get("mean", {"signal": "hold", "confidence": 0.0})
 
-        # Безопасное получение signal (может быть Series)
-        def safe_get_signal(d: Dict) -> str:
-            if not isinstance(d, dict):
-                if hasattr(d, 'to_dict'):
-                    d = d.to_dict()
-                elif hasattr(d, '__dict__'):
-                    d = dict(d.__dict__)
-                else:
-                    return "hold"
-            sig = d.get("signal")
-            if isinstance(sig, pd.Series):
-                sig = str(sig.iloc[-1]) if len(sig) > 0 else "hold"
-            elif hasattr(sig, '__iter__') and not isinstance(sig, str):
-                try:
-                    sig = str(list(sig)[-1]) if len(list(sig)) > 0 else "hold"
-                except:
-                    sig = "hold"
-            elif sig is None:
-                sig = "hold"
-            else:
-                sig = str(sig)
-            return sig
-        
-        hybrid_signal = safe_get_signal(hybrid)
-        trend_signal = safe_get_signal(trend)
-        mean_signal = safe_get_signal(mean)
+        # Анализы стратегий — dict со строковым signal (см. _coerce_analysis)
+        hybrid_signal = str(hybrid.get("signal") or "hold")
+        trend_signal = str(trend.get("signal") or "hold")
+        mean_signal = str(mean.get("signal") or "hold")
 
         # Считаем голоса (для информации/логов)
         sigs = [hybrid_signal, trend_signal, mean_signal]
-        buy_votes = sum(1 for s in sigs if s == "buy")
-        sell_votes = sum(1 for s in sigs if s == "sell")
+        buy_votes = sigs.count("buy")
+        sell_votes = sigs.count("sell")
 
         # "Veto-only ансамбль":
         # - берем сигнал ТОЛЬКО от hybrid
         # - trend/mean могут только запретить BUY, если они считают, что это SELL/опасно
         # Это устраняет ситуацию, когда ансамбль ухудшает результат относительно hybrid.
-        base = dict(hybrid)
+        # hybrid — свежий dict от HybridStrategy.analyze (копия из _analyze_base), его можно править на месте
+        base = hybrid
         base["subsignals"] = {"hybrid": hybrid_signal, "trend": trend_signal, "mean": mean_signal}
         base["buy_signals"] = buy_votes
         base["sell_signals"] = sell_votes
@@ -415,16 +389,31 @@ class EnsembleStrategy(BaseStrategy):
     # BaseStrategy.should_buy уже содержит эти фильтры, поэтому ничего не переопределяем.
 
 
+# Режим (и его синонимы) -> класс стратегии
+_ALIASES: Dict[str, type] = {
+    "hybrid": HybridStrategy,
+    "default": HybridStrategy,
+    "trend": TrendFollowingStrategy,
+    "trend_follow": TrendFollowingStrategy,
+    "trendfollowing": TrendFollowingStrategy,
+    "mean": MeanReversionStrategy,
+    "mean_reversion": MeanReversionStrategy,
+    "reversion": MeanReversionStrategy,
+    "ensemble": EnsembleStrategy,
+    "meta": EnsembleStrategy,
+    "vote": EnsembleStrategy,
+}
+# Стратегии не хранят состояния между вызовами — один экземпляр на класс
+_SINGLETON_CACHE: Dict[type, BaseStrategy] = {}
+
+
 def get_strategy(mode: str) -> BaseStrategy:
-    m = (mode or "hybrid").strip().lower()
-    if m in ("hybrid", "default"):
-        return HybridStrategy()
-    if m in ("trend", "trend_follow", "trendfollowing"):
-        return TrendFollowingStrategy()
-    if m in ("mean", "mean_reversion", "reversion"):
-        return MeanReversionStrategy()
-    if m in ("ensemble", "meta", "vote"):
-        return EnsembleStrategy()
-    raise ValueError(f"Unknown strategy mode: {mode}")
+    cls = _ALIASES.get((mode or "hybrid").strip().lower())
+    if cls is None:
+        raise ValueError(f"Unknown strategy mode: {mode}")
+    inst = _SINGLETON_CACHE.get(cls)
+    if inst is None:
+        inst = _SINGLETON_CACHE[cls] = cls()
+    return inst
 
 
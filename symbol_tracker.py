@@ -11,24 +11,62 @@ Symbol Performance Tracker - Адаптивный трекер производ
 - MGNT: 0 take_profit vs 3 stop = плохой символ
 """
 
+import atexit
+import heapq
 import json
 import os
+import threading
+import time
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 from collections import defaultdict
 
+import numpy as np
+
+# orjson (опционально) — быстрее stdlib json на загрузке снимка и строках журнала
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+from state_store import save_json_atomic
+
+# Полный снимок состояния пишется раз в SNAPSHOT_EVERY сделок и при выходе,
+# между снимками каждая сделка дописывается одной строкой в журнал (*.ndjson)
+SNAPSHOT_EVERY = 50
+
+# Устаревшие сделки удаляются из trades пачкой, когда их набирается PRUNE_SLACK:
+# статистика всё равно считается по окну lookback, хвост за окном на неё не влияет
+PRUNE_SLACK = 50
+
 
 class SymbolTracker:
     """
     Трекер производительности символов.
-    Сохраняет состояние между перезапусками.
+    Сохраняет состояние между перезапусками: снимок state_path + журнал сделок после него (log_path).
     """
     
     def __init__(self, state_path: str = "state/symbol_performance.json", lookback_days: int = 14):
         self.state_path = state_path
+        self.log_path = os.path.splitext(state_path)[0] + ".ndjson"
         self.lookback_days = lookback_days
+        # Сделок, записанных ЭТИМ процессом и ещё не попавших в снимок. Доигранные из журнала строки
+        # не считаются: процесс, который только читает статистику (analyze_*), не должен при выходе
+        # перезаписывать снимок и очищать журнал работающего бота
+        self._unsaved = 0
+        # Колонки сделок по символу для get_symbol_stats: (ts datetime64[us], pnl float64, ts упорядочен);
+        # строятся лениво из trades и сбрасываются в record_trade
+        self._arrays: Dict[str, tuple] = {}
+        # Кэш get_symbol_stats: symbol -> ((версия, минута расчёта), stats); версия растёт в record_trade
+        self._version: Dict[str, int] = defaultdict(int)
+        self._stats_cache: Dict[str, tuple] = {}
+        self._cutoff_cache: Optional[tuple] = None  # (минута, значение _current_cutoff)
+        # record_trade идёт из пула потоков main.py, статистика читается из торгового цикла
+        self._lock = threading.RLock()
         self._ensure_dir()
         self.data = self._load()
+        atexit.register(self._flush)
     
     def _ensure_dir(self):
         dir_path = os.path.dirname(self.state_path)
@@ -36,22 +74,105 @@ class SymbolTracker:
             os.makedirs(dir_path, exist_ok=True)
     
     def _load(self) -> Dict:
+        data = None
         if os.path.exists(self.state_path):
             try:
-                with open(self.state_path, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                with open(self.state_path, "rb") as f:
+                    data = _loads(f.read())
             except Exception:
                 pass
-        return {"symbols": {}, "last_update": None}
+        if not isinstance(data, dict):
+            data = {"symbols": {}, "last_update": None}
+        data.setdefault("symbols", {})
+        self._replay_log(data)
+        return data
+    
+    def _replay_log(self, data: Dict):
+        """Доигрывает сделки из журнала, записанные после снимка (seq больше сохранённого)"""
+        if not os.path.exists(self.log_path):
+            return
+        cutoff = self._current_cutoff()[1]
+        last_seq = int(data.get("seq", 0) or 0)
+        line = b""
+        try:
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        rec = _loads(line)
+                        seq = int(rec.pop("seq"))
+                        symbol = str(rec.pop("symbol")).upper()
+                    except Exception:
+                        continue  # оборванная последняя строка после падения
+                    if seq <= last_seq:
+                        continue  # уже в снимке (упали между снимком и очисткой журнала)
+                    sym_data = self._apply_trade(data, symbol, rec)
+                    if rec.get("ts", "") < cutoff:
+                        sym_data["trades"].pop()
+                    last_seq = seq
+            if line and not line.endswith(b"\n"):
+                # Оборванная строка не должна склеиться со следующей записью
+                with open(self.log_path, "ab") as f:
+                    f.write(b"\n")
+        except Exception:
+            pass
+        data["seq"] = last_seq
     
     def _save(self):
+        """Полный снимок состояния; журнал после него очищается"""
         try:
             self.data["last_update"] = datetime.utcnow().isoformat()
-            with open(self.state_path, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            save_json_atomic(self.state_path, self.data)
+            open(self.log_path, "w", encoding="utf-8").close()
+            self._unsaved = 0
         except Exception:
             pass
     
+    def _flush(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+    
+    def _append_log(self, rec: Dict):
+        try:
+            with open(self.log_path, "ab") as f:
+                f.write(_dumps_line(rec))
+        except Exception:
+            # Журнал недоступен — сохраняем сразу снимком, чтобы не потерять сделку
+            self._save()
+            return
+        self._unsaved += 1
+        if self._unsaved >= SNAPSHOT_EVERY:
+            self._save()
+    
+    @staticmethod
+    def _apply_trade(data: Dict, symbol: str, entry: Dict) -> Dict:
+        """Добавляет сделку в состояние символа и обновляет счётчики; возвращает данные символа"""
+        # Один поиск символа; новый dict создаётся только для нового символа (setdefault строил бы его каждый раз)
+        symbols = data["symbols"]
+        sym_data = symbols.get(symbol)
+        if sym_data is None:
+            sym_data = symbols[symbol] = {
+                "trades": [],
+                "total_pnl": 0.0,
+                "wins": 0,
+                "losses": 0,
+                "streak": 0,  # положительный = серия побед, отрицательный = серия поражений
+            }
+        
+        pnl = entry["pnl"]
+        sym_data["trades"].append(entry)
+        sym_data["total_pnl"] += pnl
+        
+        # Обновляем streak
+        streak = sym_data["streak"]
+        if pnl > 0:
+            sym_data["wins"] += 1
+            sym_data["streak"] = max(1, streak + 1) if streak >= 0 else 1
+        else:
+            sym_data["losses"] += 1
+            sym_data["streak"] = min(-1, streak - 1) if streak <= 0 else -1
+        return sym_data
+    
     def record_trade(self, symbol: str, pnl: float, reason: str, confidence: float = 0.0):
         """
         Записывает результат сделки.
@@ -63,39 +184,33 @@ class SymbolTracker:
             confidence: Уверенность при входе (для анализа)
         """
         symbol = str(symbol).upper()
-        if symbol not in self.data["symbols"]:
-            self.data["symbols"][symbol] = {
-                "trades": [],
-                "total_pnl": 0.0,
-                "wins": 0,
-                "losses": 0,
-                "streak": 0,  # положительный = серия побед, отрицательный = серия поражений
-            }
-        
         entry = {
             "ts": datetime.utcnow().isoformat(),
             "pnl": float(pnl),
             "reason": str(reason),
             "confidence": float(confidence),
         }
+        with self._lock:
+            self._record_locked(symbol, entry)
+    
+    def _record_locked(self, symbol: str, entry: Dict):
+        """Тело record_trade (под self._lock)"""
+        sym_data = self._apply_trade(self.data, symbol, entry)
         
-        sym_data = self.data["symbols"][symbol]
-        sym_data["trades"].append(entry)
-        sym_data["total_pnl"] += float(pnl)
-        
-        # Обновляем streak
-        if pnl > 0:
-            sym_data["wins"] += 1
-            sym_data["streak"] = max(1, sym_data["streak"] + 1) if sym_data["streak"] >= 0 else 1
-        else:
-            sym_data["losses"] += 1
-            sym_data["streak"] = min(-1, sym_data["streak"] - 1) if sym_data["streak"] <= 0 else -1
-        
-        # Храним только последние N дней
-        cutoff = (datetime.utcnow() - timedelta(days=self.lookback_days)).isoformat()
-        sym_data["trades"] = [t for t in sym_data["trades"] if t["ts"] >= cutoff]
+        # Храним только последние N дней. Сделки дописываются в хронологическом порядке,
+        # поэтому устаревшие — это префикс списка: граница бинарным поиском, удаление на месте
+        # и только когда префикс дорос до PRUNE_SLACK (а не сдвиг списка на каждой сделке)
+        cutoff = self._current_cutoff()[1]
+        trades = sym_data["trades"]
+        if len(trades) > PRUNE_SLACK and trades[PRUNE_SLACK - 1]["ts"] < cutoff:
+            del trades[:bisect_left(trades, cutoff, key=lambda t: t["ts"])]
+        self._arrays.pop(symbol, None)
+        self._version[symbol] += 1
         
-        self._save()
+        # Одна строка в журнал вместо перезаписи всего файла (снимок — раз в SNAPSHOT_EVERY сделок)
+        seq = int(self.data.get("seq", 0) or 0) + 1
+        self.data["seq"] = seq
+        self._append_log({"seq": seq, "symbol": symbol, **entry})
     
     def get_symbol_stats(self, symbol: str) -> Dict:
         """
@@ -104,25 +219,49 @@ class SymbolTracker:
         Returns:
             Dict с полями: win_rate, avg_pnl, streak, recent_trades, risk_factor
         """
-        symbol = str(symbol).upper()
-        sym_data = self.data["symbols"].get(symbol, {})
-        
-        trades = sym_data.get("trades", [])
-        wins = sym_data.get("wins", 0)
-        losses = sym_data.get("losses", 0)
-        total = wins + losses
-        streak = sym_data.get("streak", 0)
-        total_pnl = sym_data.get("total_pnl", 0.0)
-        
-        # Только недавние сделки (lookback период)
-        cutoff = (datetime.utcnow() - timedelta(days=self.lookback_days)).isoformat()
-        recent = [t for t in trades if t["ts"] >= cutoff]
-        recent_wins = sum(1 for t in recent if t["pnl"] > 0)
-        recent_losses = sum(1 for t in recent if t["pnl"] <= 0)
-        recent_total = recent_wins + recent_losses
+        with self._lock:
+            return self._stats_for(str(symbol).upper(), self._current_cutoff())
+    
+    def _current_cutoff(self) -> tuple:
+        """
+        Граница окна lookback: (минута UTC, cutoff ISO-строкой, cutoff datetime64[us]).
+        Считается раз в минуту — для окна в lookback_days дней такой точности достаточно.
+        """
+        minute = int(time.time()) // 60
+        cached = self._cutoff_cache
+        if cached is not None and cached[0] == minute:
+            return cached[1]
+        now_min = datetime.utcfromtimestamp(minute * 60)
+        cutoff_dt = now_min - timedelta(days=self.lookback_days)
+        value = (now_min, cutoff_dt.isoformat(), np.datetime64(cutoff_dt, "us"))
+        self._cutoff_cache = (minute, value)
+        return value
+    
+    def _stats_for(self, symbol: str, cutoff: tuple) -> Dict:
+        """get_symbol_stats для уже нормализованного symbol и готовой границы окна (_current_cutoff)"""
+        # Окно lookback считаем с точностью до минуты: повторные вызовы в пределах минуты
+        # (блокировка/размер позиции/порог confidence за один тик) берут готовый результат
+        cache_key = (self._version[symbol], cutoff[0])
+        cached = self._stats_cache.get(symbol)
+        if cached is not None and cached[0] == cache_key:
+            return dict(cached[1])
+        
+        get = self.data["symbols"].get(symbol, {}).get
+        trades = get("trades", [])
+        streak = get("streak", 0)
+        total_pnl = get("total_pnl", 0.0)
+        
+        # Только недавние сделки (lookback период): одна маска по колонке времени вместо циклов по dict
+        ts_arr, pnl_arr, is_sorted = self._trade_arrays(symbol, trades)
+        if is_sorted:
+            recent_pnl = pnl_arr[int(np.searchsorted(ts_arr, cutoff[2], side="left")):]
+        else:
+            recent_pnl = pnl_arr[ts_arr >= cutoff[2]]
+        recent_total = int(recent_pnl.size)
+        recent_wins = int(np.count_nonzero(recent_pnl > 0))
         
         win_rate = recent_wins / recent_total if recent_total > 0 else 0.5
-        avg_pnl = sum(t["pnl"] for t in recent) / recent_total if recent_total > 0 else 0.0
+        avg_pnl = float(recent_pnl.sum()) / recent_total if recent_total > 0 else 0.0
         
         # Risk factor: 1.0 = нормальный, <1.0 = уменьшить размер, >1.0 = увеличить
         risk_factor = 1.0
@@ -142,7 +281,7 @@ class SymbolTracker:
         elif streak <= -3:
             risk_factor *= 0.7  # Холодная серия
         
-        return {
+        stats = {
             "symbol": symbol,
             "win_rate": win_rate,
             "avg_pnl": avg_pnl,
@@ -151,6 +290,26 @@ class SymbolTracker:
             "risk_factor": min(1.5, max(0.3, risk_factor)),  # Ограничиваем 0.3-1.5
             "total_pnl": total_pnl,
         }
+        self._stats_cache[symbol] = (cache_key, stats)
+        return dict(stats)
+    
+    def _trade_arrays(self, symbol: str, trades: List[Dict]) -> tuple:
+        # Длину фиксируем до построения: колонки и сохранённая длина должны описывать один и тот же список
+        n = len(trades)
+        cached = self._arrays.get(symbol)
+        if cached is not None and cached[0] is trades and cached[1] == n:
+            return cached[2]
+        rows = trades[:n]
+        ts_list = [t["ts"] for t in rows]
+        try:
+            ts_arr = np.array(ts_list, dtype="datetime64[us]")
+        except ValueError:
+            ts_arr = np.array([_to_datetime64(ts) for ts in ts_list], dtype="datetime64[us]")
+        # Упорядоченное время (обычный случай) — окно lookback находится searchsorted без маски
+        is_sorted = not np.isnat(ts_arr).any() and bool(np.all(ts_arr[1:] >= ts_arr[:-1]))
+        arrays = (ts_arr, np.array([t["pnl"] for t in rows], dtype=np.float64), is_sorted)
+        self._arrays[symbol] = (trades, n, arrays)
+        return arrays
     
     def get_confidence_adjustment(self, symbol: str) -> float:
         """
@@ -203,23 +362,47 @@ class SymbolTracker:
     
     def get_all_stats(self) -> List[Dict]:
         """Получить статистику по всем символам."""
-        return [self.get_symbol_stats(sym) for sym in self.data["symbols"].keys()]
+        # Граница окна одна на все символы
+        with self._lock:
+            cutoff = self._current_cutoff()
+            return [self._stats_for(sym, cutoff) for sym in list(self.data["symbols"].keys())]
     
     def get_best_symbols(self, top_n: int = 10) -> List[str]:
         """Получить список лучших символов по win_rate."""
         all_stats = self.get_all_stats()
         # Фильтруем символы с достаточным количеством сделок
         valid = [s for s in all_stats if s["recent_trades"] >= 2]
-        # Сортируем по win_rate и avg_pnl
-        sorted_stats = sorted(valid, key=lambda x: (x["win_rate"], x["avg_pnl"]), reverse=True)
-        return [s["symbol"] for s in sorted_stats[:top_n]]
+        # Лучшие по win_rate и avg_pnl: частичный отбор top_n без полной сортировки
+        best = heapq.nlargest(top_n, valid, key=lambda x: (x["win_rate"], x["avg_pnl"]))
+        return [s["symbol"] for s in best]
     
     def get_worst_symbols(self, bottom_n: int = 5) -> List[str]:
         """Получить список худших символов."""
         all_stats = self.get_all_stats()
         valid = [s for s in all_stats if s["recent_trades"] >= 3]
-        sorted_stats = sorted(valid, key=lambda x: (x["win_rate"], x["avg_pnl"]))
-        return [s["symbol"] for s in sorted_stats[:bottom_n]]
+        worst = heapq.nsmallest(bottom_n, valid, key=lambda x: (x["win_rate"], x["avg_pnl"]))
+        return [s["symbol"] for s in worst]
+
+
+def _loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _dumps_line(rec: Dict) -> bytes:
+    """Компактная строка журнала с переводом строки"""
+    if orjson is not None:
+        return orjson.dumps(rec, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _to_datetime64(ts) -> np.datetime64:
+    """ISO-строка сделки -> datetime64[us]; нераспознанное время — NaT (в окно lookback не попадает)"""
+    try:
+        return np.datetime64(ts, "us")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT", "us")
 
 
 # Singleton instance для использования в main.py
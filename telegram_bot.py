@@ -3,9 +3,15 @@ Telegram бот для уведомлений и управления торго
 """
 import logging
 import asyncio
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from operator import itemgetter
 from typing import Optional, Callable, Awaitable
 from datetime import datetime
-import pandas as pd
 
 try:
     from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
@@ -17,7 +23,7 @@ try:
         ContextTypes,
     )
     from telegram.request import HTTPXRequest
-    from telegram.error import BadRequest
+    from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter, TimedOut
     TELEGRAM_AVAILABLE = True
 except ImportError:
     TELEGRAM_AVAILABLE = False
@@ -27,6 +33,156 @@ from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 
 logger = logging.getLogger(__name__)
 
+if TELEGRAM_AVAILABLE:
+    class _SharedHTTPXRequest(HTTPXRequest):
+        """
+        HTTPXRequest с keep-alive пулом, общим для уведомлений (TelegramBot) и панели (TelegramControlPanel).
+        Application.shutdown() вызывает shutdown() у запросов своего Bot — общий пул при этом не закрываем
+        (иначе после перезапуска панели отвалятся уведомления); закрывается он только close_shared_request().
+        """
+
+        async def shutdown(self) -> None:
+            return
+
+        async def close(self) -> None:
+            await super().shutdown()
+
+
+# Повторы отправки: экспоненциальная пауза base*2**attempt с джиттером (не больше CAP секунд).
+# RetryAfter (429) ждём столько, сколько просит Telegram, но если это дольше CAP — сообщение отбрасываем,
+# чтобы очередь уведомлений не стояла
+SEND_MAX_RETRIES = 3
+SEND_BACKOFF_BASE = 1.0
+SEND_BACKOFF_CAP = 30.0
+SEND_BACKOFF_JITTER = 0.5
+
+# Лимиты Bot API: ~30 сообщений/с на бота и ~1 сообщение/с в один чат
+SEND_GLOBAL_RATE = 30.0
+SEND_CHAT_RATE = 1.0
+# Сколько ждать отправки очереди в close()
+SEND_DRAIN_TIMEOUT = 30.0
+# Лимит длины текста сообщения Telegram (для склейки очереди)
+TELEGRAM_MAX_TEXT = 4096
+
+# Пометка в конце сокращённого текста панели
+_TRUNC_SUFFIX = "\n\n⚠️ _Сообщение обрезано (превышен лимит Telegram)_"
+
+
+def _truncate(text: str, limit: int = 4000) -> str:
+    """Текст не длиннее limit символов: лишний хвост заменяется пометкой _TRUNC_SUFFIX."""
+    return text if len(text) <= limit else text[:limit - len(_TRUNC_SUFFIX)] + _TRUNC_SUFFIX
+
+
+class _TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд (используется одной корутиной-отправителем)."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._ts = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+def _retry_after_seconds(e) -> float:
+    """RetryAfter.retry_after: int секунд (или timedelta в новых версиях python-telegram-bot)."""
+    ra = getattr(e, "retry_after", 1)
+    try:
+        return float(ra.total_seconds())
+    except AttributeError:
+        return float(ra or 1)
+
+
+# Символы валют для уведомлений о сделках (остальные валюты — кодом)
+_CURRENCY_SYMBOLS = {"RUB": "₽", "USD": "$", "EUR": "€"}
+
+# Справка по /day: ответ на /day без аргументов и на кнопку "📅 Отчёт (/day)"
+DAY_USAGE_TEXT = (
+    "Использование:\n"
+    "- /day YYYY-MM-DD\n"
+    "- /day YYYY-MM-DD YYYY-MM-DD (диапазон)\n\n"
+    "Пример: /day 2026-01-02 2026-01-04"
+)
+DAY_HELP_MD = (
+    "📅 *Отчёт /day*\n\n"
+    "Команды:\n"
+    "- `/day YYYY-MM-DD`\n"
+    "- `/day YYYY-MM-DD YYYY-MM-DD`\n\n"
+    "После ввода диапазона бот спросит: вывести *по дням* или *среднее*.\n\n"
+    "Пример: `/day 2026-01-02 2026-01-04`"
+)
+
+# Кнопки выбора режима отчёта по диапазону (/day start end): (подпись, код режима в DAYR|start|end|mode)
+_DAYR_MODES = (
+    ("📆 По дням", "D"),
+    ("📈 Среднее за период", "A"),
+    ("📆+📈 По дням + среднее", "B"),
+)
+
+
+@lru_cache(maxsize=1)
+def _build_dayr_kb(start: str, end: str) -> "InlineKeyboardMarkup":
+    """Клавиатура режимов для периода; повторный /day с тем же периодом получает готовую разметку."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(label, callback_data=f"DAYR|{start}|{end}|{mode}")]
+        for label, mode in _DAYR_MODES
+    ])
+
+
+# Время для уведомлений: строка форматируется не чаще раза в секунду (пачка сделок за один тик)
+_ts_cache: tuple[int, str] = (0, "")
+
+
+def _now_str() -> str:
+    """Локальное время 'YYYY-MM-DD HH:MM:SS' (как datetime.now().strftime), с кэшем на секунду."""
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+    return _ts_cache[1]
+
+
+# Ключ сортировки строк позиций в format_account_status: стоимость пакета по рынку (посчитана заранее)
+_ROW_MARKET_VALUE = itemgetter(6)
+
+_shared_request = None
+_shared_request_lock = threading.Lock()
+
+
+def get_shared_request():
+    """Общий HTTPXRequest (создаётся один раз): TLS-соединения с api.telegram.org переиспользуются между отправками."""
+    global _shared_request
+    if not TELEGRAM_AVAILABLE:
+        return None
+    with _shared_request_lock:
+        if _shared_request is None:
+            _shared_request = _SharedHTTPXRequest(
+                connect_timeout=15,
+                read_timeout=30,
+                write_timeout=30,
+                pool_timeout=30,
+                connection_pool_size=16,
+            )
+        return _shared_request
+
+
+async def close_shared_request() -> None:
+    """Закрыть общий пул соединений (при остановке бота)."""
+    global _shared_request
+    with _shared_request_lock:
+        req, _shared_request = _shared_request, None
+    if req is not None:
+        await req.close()
+
 
 class TelegramBot:
     """Класс для работы с Telegram ботом"""
@@ -39,10 +195,18 @@ class TelegramBot:
             self.chat_id = int(chat_id_str) if chat_id_str.isdigit() else chat_id_str
         except:
             self.chat_id = chat_id_str
+        # Клавиатура неизменяемая — собираем один раз, а не на каждое нажатие кнопки
+        self._control_kb = self._make_control_keyboard() if TELEGRAM_AVAILABLE else None
+        # Исходящие сообщения идут через очередь и одну корутину-отправитель с лимитами Bot API
+        # (создаются лениво при первой отправке — нужен запущенный event loop)
+        self._out_queue: Optional[asyncio.Queue] = None
+        self._sender_task: Optional[asyncio.Task] = None
+        self._global_bucket = _TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_RATE)
+        self._chat_bucket = _TokenBucket(SEND_CHAT_RATE)
         
         if TELEGRAM_AVAILABLE and TELEGRAM_BOT_TOKEN:
             try:
-                self.bot = Bot(token=TELEGRAM_BOT_TOKEN)
+                self.bot = Bot(token=TELEGRAM_BOT_TOKEN, request=get_shared_request())
                 logger.info("Telegram бот инициализирован")
                 if not self.chat_id:
                     logger.warning("TELEGRAM_CHAT_ID не указан в .env файле")
@@ -52,40 +216,172 @@ class TelegramBot:
         else:
             logger.warning("Telegram бот не настроен (отсутствует токен)")
     
-    async def send_message(self, message: str, parse_mode: Optional[str] = None, reply_markup=None) -> bool:
-        """Отправить сообщение в Telegram"""
+    async def send_message(
+        self,
+        message: str,
+        parse_mode: Optional[str] = None,
+        reply_markup=None,
+        wait: bool = False,
+    ) -> bool:
+        """
+        Отправить сообщение в Telegram.
+
+        Сообщение ставится в очередь и уходит с учётом лимитов Bot API (подряд идущие сообщения
+        без кнопок склеиваются в одно). По умолчанию не ждём отправки и возвращаем True;
+        wait=True — дождаться отправки и вернуть её результат.
+        """
         if not self.bot or not self.chat_id:
             logger.debug(f"Telegram не настроен. Сообщение: {message}")
             return False
 
+        fut = asyncio.get_running_loop().create_future() if wait else None
+        self._ensure_sender()
+        self._out_queue.put_nowait((message, parse_mode, reply_markup, fut))
+        return await fut if fut is not None else True
+
+    def _ensure_sender(self) -> None:
+        """Запустить корутину-отправитель (заново — если её event loop завершился)."""
+        if self._sender_task is not None and not self._sender_task.done():
+            return
+        pending = []
+        if self._out_queue is not None:
+            while not self._out_queue.empty():
+                pending.append(self._out_queue.get_nowait())
+        self._out_queue = asyncio.Queue()
+        for item in pending:
+            self._out_queue.put_nowait(item)
+        self._sender_task = asyncio.get_running_loop().create_task(self._sender())
+
+    async def _sender(self) -> None:
+        queue = self._out_queue
+        carry = None  # уже взятое из очереди сообщение, которое не подошло для склейки
+        while True:
+            if carry is not None:
+                item, carry = carry, None
+            else:
+                item = await queue.get()
+            batch = [item]
+            ok = False
+            results = None  # результаты по сообщениям, если склейку пришлось разослать по одному
+            try:
+                text, parse_mode, reply_markup, _ = item
+                # Склеиваем подряд идущие сообщения без кнопок с той же разметкой (пачка сделок за тик)
+                if reply_markup is None:
+                    while not queue.empty():
+                        nxt = queue.get_nowait()
+                        if nxt[2] is not None or nxt[1] != parse_mode or len(text) + 2 + len(nxt[0]) > TELEGRAM_MAX_TEXT:
+                            carry = nxt
+                            break
+                        batch.append(nxt)
+                        text = f"{text}\n\n{nxt[0]}"
+                await self._global_bucket.acquire()
+                await self._chat_bucket.acquire()
+                sent = await self._send_now(text, parse_mode, reply_markup, split_on_bad_request=len(batch) > 1)
+                if sent is None:
+                    # Склейку отверг Telegram (обычно разметка одной из частей) — шлём по одному,
+                    # чтобы потерялось только сообщение с ошибкой
+                    logger.warning(f"Telegram: склеенное сообщение ({len(batch)} шт.) отклонено, отправляем по одному")
+                    results = []
+                    for b_text, b_mode, b_markup, _ in batch:
+                        await self._global_bucket.acquire()
+                        await self._chat_bucket.acquire()
+                        results.append(await self._send_now(b_text, b_mode, b_markup))
+                else:
+                    ok = sent
+            except Exception as e:
+                logger.error(f"Telegram: ошибка очереди отправки: {e}", exc_info=True)
+            finally:
+                for i, (_, _, _, fut) in enumerate(batch):
+                    if fut is not None and not fut.done():
+                        fut.set_result(results[i] if results is not None and i < len(results) else ok)
+                    queue.task_done()
+
+    async def _send_now(
+        self,
+        message: str,
+        parse_mode: Optional[str],
+        reply_markup,
+        split_on_bad_request: bool = False,
+    ) -> Optional[bool]:
+        """
+        Одна отправка с повторами (вызывается только из _sender).
+        split_on_bad_request=True (склеенное сообщение): на BadRequest вернуть None без записи в лог —
+        _sender разошлёт части по одной.
+        """
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            try:
+                await self.bot.send_message(
+                    chat_id=self.chat_id,
+                    text=message,
+                    parse_mode=parse_mode,
+                    reply_markup=reply_markup,
+                )
+                return True
+            except RetryAfter as e:
+                # Лимит запросов: повторяем не раньше, чем разрешил Telegram
+                delay = _retry_after_seconds(e)
+                if attempt >= SEND_MAX_RETRIES or delay > SEND_BACKOFF_CAP:
+                    self._log_send_error(e)
+                    return False
+                logger.warning(f"Telegram: лимит запросов, повтор через {delay:.0f}с")
+                await asyncio.sleep(delay)
+            except (TimedOut, NetworkError) as e:
+                # BadRequest — наследник NetworkError, но повтор его не исправит
+                if split_on_bad_request and isinstance(e, BadRequest):
+                    return None
+                if isinstance(e, BadRequest) or attempt >= SEND_MAX_RETRIES:
+                    self._log_send_error(e)
+                    return False
+                delay = min(SEND_BACKOFF_CAP, SEND_BACKOFF_BASE * 2 ** attempt * (1 + random.random() * SEND_BACKOFF_JITTER))
+                logger.warning(f"Telegram: сетевая ошибка ({e}), повтор {attempt + 1}/{SEND_MAX_RETRIES} через {delay:.1f}с")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # Неверный токен, бот заблокирован, чат не найден и т.п. — без повторов
+                self._log_send_error(e)
+                return False
+        return False
+
+    def _log_send_error(self, e: Exception) -> None:
+        error_msg = str(e)
+        logger.error(f"Ошибка отправки сообщения в Telegram: {error_msg}")
+
+        # Классы ошибок python-telegram-bot; текст (в нижнем регистре, один раз) — для BadRequest "chat not found"
+        low = error_msg.lower()
+        if isinstance(e, BadRequest) and "chat not found" in low:
+            logger.error("РЕШЕНИЕ: Chat not found - убедитесь, что:")
+            logger.error("  1. Вы написали боту первое сообщение")
+            logger.error("  2. Chat ID правильный (проверьте через @userinfobot)")
+            logger.error(f"  3. Текущий Chat ID: {self.chat_id}")
+        elif isinstance(e, InvalidToken) or "unauthorized" in low or "invalid token" in low:
+            logger.error("РЕШЕНИЕ: Неверный токен бота - проверьте TELEGRAM_BOT_TOKEN в .env")
+        elif isinstance(e, Forbidden):
+            logger.error("РЕШЕНИЕ: Бот заблокирован - разблокируйте бота в Telegram")
+
+    async def close(self):
+        """Дослать очередь сообщений и закрыть общий пул HTTP-соединений (после остановки панели управления)."""
+        task = self._sender_task
+        if task is not None and not task.done():
+            try:
+                await asyncio.wait_for(self._out_queue.join(), timeout=SEND_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Telegram: не все сообщения отправлены за {SEND_DRAIN_TIMEOUT:.0f}с при остановке")
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._sender_task = None
         try:
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode=parse_mode,
-                reply_markup=reply_markup,
-            )
-            return True
+            await close_shared_request()
         except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Ошибка отправки сообщения в Telegram: {error_msg}")
-
-            if "Chat not found" in error_msg or "chat not found" in error_msg.lower():
-                logger.error("РЕШЕНИЕ: Chat not found - убедитесь, что:")
-                logger.error("  1. Вы написали боту первое сообщение")
-                logger.error("  2. Chat ID правильный (проверьте через @userinfobot)")
-                logger.error(f"  3. Текущий Chat ID: {self.chat_id}")
-            elif "Unauthorized" in error_msg or "Invalid token" in error_msg:
-                logger.error("РЕШЕНИЕ: Неверный токен бота - проверьте TELEGRAM_BOT_TOKEN в .env")
-            elif "Forbidden" in error_msg:
-                logger.error("РЕШЕНИЕ: Бот заблокирован - разблокируйте бота в Telegram")
-
-            return False
+            logger.debug(f"Telegram: ошибка закрытия пула соединений: {e}")
 
     def build_control_keyboard(self) -> Optional[InlineKeyboardMarkup]:
         """Кнопки управления (inline)."""
-        if not TELEGRAM_AVAILABLE:
-            return None
+        return self._control_kb
+
+    @staticmethod
+    def _make_control_keyboard() -> "InlineKeyboardMarkup":
         keyboard = [
             [InlineKeyboardButton("▶️ Старт", callback_data="CTL_START"),
              InlineKeyboardButton("⏸ Стоп", callback_data="CTL_STOP")],
@@ -108,27 +404,30 @@ class TelegramBot:
         currency_symbol: Optional[str] = None,
         lot: Optional[int] = None,
         qty_shares: Optional[float] = None,
+        ts: Optional[datetime] = None,
     ) -> str:
-        """Форматировать уведомление о сделке (валюта/лоты учитываются)."""
+        """Форматировать уведомление о сделке (валюта/лоты учитываются); ts — время сделки, если уже известно."""
         emoji = "🟢" if action == "BUY" else "🔴"
         cur = (currency or "RUB").upper()
         if currency_symbol is None:
-            currency_symbol = {"RUB": "₽", "USD": "$", "EUR": "€"}.get(cur, cur + " ")
+            currency_symbol = _CURRENCY_SYMBOLS.get(cur, cur + " ")
 
-        message = f"{emoji} *{action}* {symbol}\n"
+        # Строки копим в списке и склеиваем один раз (без копирования растущей строки на каждом +=)
+        parts = [f"{emoji} *{action}* {symbol}\n"]
+        append = parts.append
         if lot and lot > 0:
-            message += f"Количество: {qty} лот(ов) (лот={lot})\n"
+            append(f"Количество: {qty} лот(ов) (лот={lot})\n")
             if qty_shares is not None:
-                message += f"Акций: {qty_shares:.0f}\n"
+                append(f"Акций: {qty_shares:.0f}\n")
         else:
-            message += f"Количество: {qty}\n"
+            append(f"Количество: {qty}\n")
 
-        message += f"Цена: {currency_symbol}{price:.2f} {cur}\n"
-        message += f"Сумма: {currency_symbol}{total:.2f} {cur}\n"
+        append(f"Цена: {currency_symbol}{price:.2f} {cur}\n")
+        append(f"Сумма: {currency_symbol}{total:.2f} {cur}\n")
         if reason:
-            message += f"Причина: {reason}\n"
-        message += f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        return message
+            append(f"Причина: {reason}\n")
+        append(f"Время: {ts.strftime('%Y-%m-%d %H:%M:%S') if ts is not None else _now_str()}")
+        return "".join(parts)
     
     def format_account_status(
         self,
@@ -140,100 +439,89 @@ class TelegramBot:
     ) -> str:
         """Форматировать статус счета"""
         currency = account_info.get("currency", "RUB") or "RUB"
-        message = "📊 *Статус счета*\n\n"
-        message += f"Капитал (equity): {account_info.get('equity', 0):.2f} {currency}\n"
-        message += f"Наличные (cash): {account_info.get('cash', 0):.2f} {currency}\n"
-        message += f"Покупательная способность: {account_info.get('buying_power', 0):.2f} {currency}\n\n"
+        # Строки копим в списке и склеиваем один раз в конце
+        parts = ["📊 *Статус счета*\n\n"]
+        append = parts.append
+        append(f"Капитал (equity): {account_info.get('equity', 0):.2f} {currency}\n")
+        append(f"Наличные (cash): {account_info.get('cash', 0):.2f} {currency}\n")
+        append(f"Покупательная способность: {account_info.get('buying_power', 0):.2f} {currency}\n\n")
         
         if positions:
             # Ограничиваем количество позиций для Telegram (лимит 4096 символов)
             # Показываем топ позиций по стоимости или P/L
             MAX_POSITIONS_IN_MESSAGE = 20
-            positions_to_show = positions[:MAX_POSITIONS_IN_MESSAGE] if len(positions) <= MAX_POSITIONS_IN_MESSAGE else sorted(
-                positions, 
-                key=lambda p: float(p.get("current_price", 0) or 0) * float(p.get("qty_shares", p.get("qty_lots", 0) or 0) * (p.get("lot", 1) or 1)),
-                reverse=True
-            )[:MAX_POSITIONS_IN_MESSAGE]
-            
-            message += f"*Открытые позиции:* ({len(positions_to_show)} из {len(positions)})\n"
-            if len(positions) > MAX_POSITIONS_IN_MESSAGE:
-                message += f"_Показаны топ-{MAX_POSITIONS_IN_MESSAGE} позиций по стоимости_\n"
-            
-            total_entry = 0.0
-            total_current = 0.0
-            for pos in positions_to_show:
-                qty_lots = pos.get("qty_lots", pos.get("qty", 0)) or 0
-                lot = pos.get("lot", 1) or 1
-                qty_shares = pos.get("qty_shares", None)
+
+            # Один проход по ВСЕМ позициям: суммы пакетов для строк и итоги считаем сразу
+            rows = []
+            total_entry_all = 0.0
+            total_current_all = 0.0
+            for pos in positions:
+                get = pos.get
+                qty_lots = get("qty_lots", get("qty", 0)) or 0
+                lot = get("lot", 1) or 1
+                qty_shares = get("qty_shares", None)
                 if qty_shares is None:
                     try:
                         qty_shares = float(qty_lots) * float(lot)
                     except Exception:
                         qty_shares = 0.0
+                shares = float(qty_shares or 0)
+                avg_entry = float(get("avg_entry_price", 0) or 0)
+                current_px = float(get("current_price", 0) or 0)
+                entry_total = avg_entry * shares
+                current_total = current_px * shares
+                total_entry_all += entry_total
+                total_current_all += current_total
+                rows.append((pos, qty_lots, lot, avg_entry, current_px, entry_total, current_total))
 
-                qty_lots = pos.get("qty_lots", pos.get("qty", 0))
-                lot = pos.get("lot", 1)
-
-                avg_entry = float(pos.get("avg_entry_price", 0) or 0)
-                current_px = float(pos.get("current_price", 0) or 0)
-
-                entry_total = avg_entry * float(qty_shares or 0)
-                current_total = current_px * float(qty_shares or 0)
-                total_entry += entry_total
-                total_current += current_total
+            if len(rows) > MAX_POSITIONS_IN_MESSAGE:
+                # Топ-N без полной сортировки: O(N log 20) вместо O(N log N), порядок как у sorted(...)[:N]
+                rows = heapq.nlargest(MAX_POSITIONS_IN_MESSAGE, rows, key=_ROW_MARKET_VALUE)
+            
+            append(f"*Открытые позиции:* ({len(rows)} из {len(positions)})\n")
+            if len(positions) > MAX_POSITIONS_IN_MESSAGE:
+                append(f"_Показаны топ-{MAX_POSITIONS_IN_MESSAGE} позиций по стоимости_\n")
+            
+            # qty_lots/lot — те же значения (с умолчаниями 0/1), что пошли в расчёт пакета
+            for pos, qty_lots, lot, avg_entry, current_px, entry_total, current_total in rows:
+                get = pos.get
 
                 pnl = current_total - entry_total if entry_total > 0 else 0.0
                 pnl_pct = (pnl / entry_total * 100.0) if entry_total > 0 else 0.0
                 pl_emoji = "🟢" if pnl >= 0 else "🔴"
 
-                sym = pos.get('symbol', '?')
-                message += f"{pl_emoji} {sym}: {qty_lots} лот(ов) (лот={lot})\n"
                 if avg_entry > 0:
-                    src = pos.get("entry_price_source", None)
-                    tsb = pos.get("entry_last_buy_ts_utc", "")
+                    src = get("entry_price_source", None)
+                    tsb = get("entry_last_buy_ts_utc", "")
                     src_s = " (из T‑Invest)" if src != "audit" else " (из audit‑лога)"
                     ts_s = f", buy_ts={tsb}" if (src == "audit" and tsb) else ""
-                    message += f"   Покупка: {avg_entry:.2f} {currency}{src_s}{ts_s} | Пакет (покупка): {entry_total:.2f} {currency}\n"
+                    buy_s = f"{avg_entry:.2f} {currency}{src_s}{ts_s} | Пакет (покупка): {entry_total:.2f} {currency}"
                 else:
-                    message += f"   Покупка: (нет данных)\n"
-                if current_px > 0:
-                    message += f"   Рынок: {current_px:.2f} {currency} | Пакет (рынок): {current_total:.2f} {currency}\n"
-                message += f"   P/L: {pnl:.2f} {currency} ({pnl_pct:.2f}%)\n"
+                    buy_s = "(нет данных)"
+                mkt_s = f"   Рынок: {current_px:.2f} {currency} | Пакет (рынок): {current_total:.2f} {currency}\n" if current_px > 0 else ""
+                # Вся позиция — одна строка-запись
+                append(
+                    f"{pl_emoji} {get('symbol', '?')}: {qty_lots} лот(ов) (лот={lot})\n"
+                    f"   Покупка: {buy_s}\n"
+                    f"{mkt_s}"
+                    f"   P/L: {pnl:.2f} {currency} ({pnl_pct:.2f}%)\n"
+                )
 
-            # Пересчитываем итоги по ВСЕМ позициям (не только показанным)
-            total_entry_all = 0.0
-            total_current_all = 0.0
-            for pos in positions:
-                qty_lots = pos.get("qty_lots", pos.get("qty", 0)) or 0
-                lot = pos.get("lot", 1) or 1
-                qty_shares = pos.get("qty_shares", None)
-                if qty_shares is None:
-                    try:
-                        qty_shares = float(qty_lots) * float(lot)
-                    except Exception:
-                        qty_shares = 0.0
-                avg_entry = float(pos.get("avg_entry_price", 0) or 0)
-                current_px = float(pos.get("current_price", 0) or 0)
-                entry_total = avg_entry * float(qty_shares or 0)
-                current_total = current_px * float(qty_shares or 0)
-                total_entry_all += entry_total
-                total_current_all += current_total
-            
             if total_entry_all > 0 or total_current_all > 0:
                 total_pnl = total_current_all - total_entry_all
                 total_pnl_pct = (total_pnl / total_entry_all * 100.0) if total_entry_all > 0 else 0.0
-                message += (
+                append(
                     f"\n*Итого по всем {len(positions)} позициям:*\n"
                     f"- Покупка (сумма): {total_entry_all:.2f} {currency}\n"
                     f"- Рынок (сумма): {total_current_all:.2f} {currency}\n"
                     f"- P/L: {total_pnl:.2f} {currency} ({total_pnl_pct:.2f}%)"
                 )
         else:
-            message += "Нет открытых позиций"
+            append("Нет открытых позиций")
 
         # Активные заявки (часто это причина, почему деньги списались, а позиций ещё нет)
         if open_orders:
-            message += "\n\n*Активные заявки:*\n"
+            append("\n\n*Активные заявки:*\n")
             for o in open_orders[:10]:
                 sym = o.get("symbol", "?")
                 oid = o.get("order_id", "")
@@ -243,14 +531,40 @@ class TelegramBot:
                 lot = o.get("lot", "")
                 price = o.get("price", 0)
                 price_s = f"{price:.2f} {currency}" if isinstance(price, (int, float)) and price else "market"
-                message += f"- {sym}: {side} {qty_lots} лот(ов) (лот={lot}) @ {price_s} | status={status} | id={oid}\n"
+                append(f"- {sym}: {side} {qty_lots} лот(ов) (лот={lot}) @ {price_s} | status={status} | id={oid}\n")
 
         # Статус последней заявки намеренно не показываем в "Портфеле" (по требованию пользователя).
 
         # recent_operations выводим только там, где это действительно "История сделок".
         # В портфеле этот блок не показываем, чтобы не путать пользователя.
         
-        return message
+        return "".join(parts)
+
+
+class _TTLCache:
+    """
+    Результат fn() запоминается на ttl секунд: серия нажатий одной кнопки строит текст один раз.
+    Вызовы могут идти из потоков asyncio.to_thread; пока текст строится, повторные нажатия ждут его же.
+    """
+
+    def __init__(self, fn: Callable[[], str], ttl: float = 3.0):
+        self.fn = fn
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value: Optional[str] = None
+        self._ts = 0.0
+
+    def get(self) -> str:
+        with self._lock:
+            if self._value is not None and time.monotonic() - self._ts < self.ttl:
+                return self._value
+            value = self.fn()
+            self._value, self._ts = value, time.monotonic()
+            return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
 
 
 class TelegramControlPanel:
@@ -258,8 +572,17 @@ class TelegramControlPanel:
     Панель управления ботом через Telegram кнопки.
 
     Важно: команды обрабатываются ТОЛЬКО из TELEGRAM_CHAT_ID.
+
+    get_portfolio_text / get_trades_text / get_day_report_text синхронные (ходят к брокеру и в audit-лог)
+    и вызываются в потоке asyncio.to_thread, чтобы не блокировать polling: они только читают данные.
+    get_status_text вызывается в потоке event loop: он сверяет дневное состояние бота с audit-логом
+    (trades_today, day_start/peak_equity) и сохраняет его — то же делает торговый цикл.
     """
 
+    TEXT_CACHE_TTL = 3.0
+    # Сколько сообщений панели помнить для пропуска неизменённых правок
+    LAST_TEXTS_MAX = 32
+
     def __init__(
         self,
         token: str,
@@ -275,15 +598,32 @@ class TelegramControlPanel:
         self.token = token
         self.chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else chat_id
         self.keyboard_factory = keyboard_factory
+        # Разметка кнопок не меняется — запрашиваем у фабрики один раз
+        self._kb = keyboard_factory()
         self.on_start = on_start
         self.on_stop = on_stop
         self.get_status_text = get_status_text
         self.get_portfolio_text = get_portfolio_text
         self.get_trades_text = get_trades_text
         self.get_day_report_text = get_day_report_text
+        # Тексты кнопок ℹ️/💼/🧾 кэшируем на TEXT_CACHE_TTL секунд; Старт/Стоп сбрасывают кэш
+        self._status_cache = _TTLCache(get_status_text, self.TEXT_CACHE_TTL)
+        self._portfolio_cache = _TTLCache(get_portfolio_text, self.TEXT_CACHE_TTL)
+        self._trades_cache = _TTLCache(get_trades_text, self.TEXT_CACHE_TTL)
         self.app: Optional[Application] = None
         # хранение последнего запроса диапазона (в рамках одного чата)
         self._pending_range: Optional[tuple[str, str]] = None
+        # (chat_id, message_id) -> (text, parse_mode) последней успешной правки сообщения панели (LRU)
+        self._last_texts: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # callback_data кнопки -> обработчик (получает _safe_edit текущего нажатия)
+        self._dispatch: dict[str, Callable[..., Awaitable[None]]] = {
+            "CTL_START": self._cb_start,
+            "CTL_STOP": self._cb_stop,
+            "CTL_STATUS": self._cb_status,
+            "CTL_PORTFOLIO": self._cb_portfolio,
+            "CTL_TRADES": self._cb_trades,
+            "CTL_DAY": self._cb_day_help,
+        }
 
     def _authorized(self, update: Update) -> bool:
         try:
@@ -303,8 +643,7 @@ class TelegramControlPanel:
             logger.info(f"Telegram: /menu от chat_id={update.effective_chat.id if update.effective_chat else None}")
         except Exception:
             pass
-        kb = self.keyboard_factory()
-        await update.effective_message.reply_text("Панель управления:", reply_markup=kb)
+        await update.effective_message.reply_text("Панель управления:", reply_markup=self._kb)
 
     async def _cmd_day(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not self._authorized(update):
@@ -314,12 +653,7 @@ class TelegramControlPanel:
             return
         args = getattr(context, "args", None) or []
         if not args:
-            await update.effective_message.reply_text(
-                "Использование:\n"
-                "- /day YYYY-MM-DD\n"
-                "- /day YYYY-MM-DD YYYY-MM-DD (диапазон)\n\n"
-                "Пример: /day 2026-01-02 2026-01-04"
-            )
+            await update.effective_message.reply_text(DAY_USAGE_TEXT)
             return
 
         # Диапазон: /day 2026-01-02 2026-01-04
@@ -327,11 +661,7 @@ class TelegramControlPanel:
             start = str(args[0]).strip()
             end = str(args[1]).strip()
             self._pending_range = (start, end)
-            kb = InlineKeyboardMarkup([
-                [InlineKeyboardButton("📆 По дням", callback_data=f"DAYR|{start}|{end}|D")],
-                [InlineKeyboardButton("📈 Среднее за период", callback_data=f"DAYR|{start}|{end}|A")],
-                [InlineKeyboardButton("📆+📈 По дням + среднее", callback_data=f"DAYR|{start}|{end}|B")],
-            ])
+            kb = _build_dayr_kb(start, end)
             await update.effective_message.reply_text(
                 f"Вы указали период *{start} → {end}*.\n\n"
                 "Что вывести?",
@@ -342,7 +672,7 @@ class TelegramControlPanel:
 
         # Один день
         date_str = str(args[0]).strip()
-        text = self.get_day_report_text(date_str)
+        text = await asyncio.to_thread(self.get_day_report_text, date_str)
         await update.effective_message.reply_text(text, parse_mode="Markdown")
 
     async def _on_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -364,88 +694,125 @@ class TelegramControlPanel:
         except Exception:
             pass
         await query.answer()
+        msg_id = getattr(query.message, "message_id", None) if query.message else None
+        text_key = (self.chat_id, msg_id) if msg_id is not None else None
+
+        def _remember(sent: tuple):
+            if text_key is None:
+                return
+            self._last_texts[text_key] = sent
+            self._last_texts.move_to_end(text_key)
+            if len(self._last_texts) > self.LAST_TEXTS_MAX:
+                self._last_texts.popitem(last=False)
+
+        def _forget():
+            if text_key is not None:
+                self._last_texts.pop(text_key, None)
 
         async def _safe_edit(text: str, *, parse_mode: Optional[str] = None):
             """
             Telegram иногда падает на Markdown разметке (Can't parse entities) или Message_too_long.
             Тогда повторяем отправку без parse_mode или сокращаем текст, чтобы кнопка всегда отвечала.
+            Если сообщение уже показывает этот же текст — запрос в Telegram не отправляем.
             """
+            requested = (text, parse_mode)
+            if text_key is not None and self._last_texts.get(text_key) == requested:
+                logger.info(f"Telegram: {data} — текст не изменился, правку не отправляем")
+                return
             try:
                 # Проверяем длину сообщения (лимит Telegram: 4096 символов)
-                if len(text) > 4096:
+                if len(text) > TELEGRAM_MAX_TEXT:
                     logger.warning(f"Telegram: {data} — сообщение слишком длинное ({len(text)} символов), сокращаем")
                     # Сокращаем до 4000 символов с предупреждением
-                    text = text[:4000] + "\n\n⚠️ _Сообщение обрезано (превышен лимит Telegram)_"
+                    text = _truncate(text)
                 
-                await query.edit_message_text(text, reply_markup=self.keyboard_factory(), parse_mode=parse_mode)
+                await query.edit_message_text(text, reply_markup=self._kb, parse_mode=parse_mode)
+                _remember(requested)
             except Exception as e:
+                # Что сейчас в сообщении, неизвестно до успешной правки ниже (fallback-текст, ошибка)
+                _forget()
                 msg = str(e)
                 if "Message is not modified" in msg:
                     logger.info(f"Telegram: {data} — сообщение не изменилось (Message is not modified)")
+                    _remember(requested)
                     return
                 if "Message_too_long" in msg or "message is too long" in msg.lower():
                     logger.warning(f"Telegram: {data} — сообщение слишком длинное, отправляем сокращенную версию")
                     # Пытаемся отправить без разметки (может быть короче)
                     try:
-                        shortened = text[:3800] + "\n\n⚠️ _Сообщение обрезано (превышен лимит Telegram)_"
-                        await query.edit_message_text(shortened, reply_markup=self.keyboard_factory())
+                        shortened = _truncate(text, 3800)
+                        await query.edit_message_text(shortened, reply_markup=self._kb)
+                        _remember(requested)
                         return
                     except Exception:
                         # Если и это не помогло, отправляем минимальное сообщение
                         await query.edit_message_text(
                             f"⚠️ Сообщение слишком длинное ({len(text)} символов).\n"
                             f"Попробуйте позже или уменьшите количество позиций.",
-                            reply_markup=self.keyboard_factory()
+                            reply_markup=self._kb
                         )
                         return
                 if "Can't parse entities" in msg or "can't parse entities" in msg:
                     logger.warning(f"Telegram: {data} — ошибка Markdown, повторяем без разметки: {e}")
-                    await query.edit_message_text(text, reply_markup=self.keyboard_factory())
+                    await query.edit_message_text(text, reply_markup=self._kb)
+                    _remember(requested)
                     return
                 logger.error(f"Telegram: ошибка {data}: {e}", exc_info=True)
                 raise
 
         # Выбор режима отчёта по диапазону
         if data.startswith("DAYR|"):
-            if not self.get_day_report_text:
-                await _safe_edit("Отчет /day недоступен в этой сборке.")
-                return
-            try:
-                _, start, end, mode = data.split("|", 3)
-            except Exception:
-                await _safe_edit("Некорректный формат запроса периода.")
-                return
-
-            # Пробрасываем в get_day_report_text строкой "start..end|mode"
-            text = self.get_day_report_text(f"{start}..{end}|{mode}")
-            await _safe_edit(text, parse_mode="Markdown")
+            await self._cb_day_range(data, _safe_edit)
             return
 
-        if data == "CTL_START":
-            await self.on_start()
-            await _safe_edit("▶️ Входы (BUY) включены.")
-        elif data == "CTL_STOP":
-            await self.on_stop()
-            await _safe_edit("⏸ Входы (BUY) выключены.")
-        elif data == "CTL_STATUS":
-            await _safe_edit(self.get_status_text(), parse_mode="Markdown")
-        elif data == "CTL_PORTFOLIO":
-            await _safe_edit(self.get_portfolio_text(), parse_mode="Markdown")
-        elif data == "CTL_TRADES":
-            await _safe_edit(self.get_trades_text(), parse_mode="Markdown")
-        elif data == "CTL_DAY":
-            await _safe_edit(
-                "📅 *Отчёт /day*\n\n"
-                "Команды:\n"
-                "- `/day YYYY-MM-DD`\n"
-                "- `/day YYYY-MM-DD YYYY-MM-DD`\n\n"
-                "После ввода диапазона бот спросит: вывести *по дням* или *среднее*.\n\n"
-                "Пример: `/day 2026-01-02 2026-01-04`",
-                parse_mode="Markdown",
-            )
+        handler = self._dispatch.get(data)
+        if handler is not None:
+            await handler(_safe_edit)
         else:
             logger.info(f"Telegram: неизвестный callback data={data}")
 
+    def _invalidate_texts(self):
+        for cache in (self._status_cache, self._portfolio_cache, self._trades_cache):
+            cache.invalidate()
+
+    async def _cb_start(self, edit):
+        await self.on_start()
+        self._invalidate_texts()
+        await edit("▶️ Входы (BUY) включены.")
+
+    async def _cb_stop(self, edit):
+        await self.on_stop()
+        self._invalidate_texts()
+        await edit("⏸ Входы (BUY) выключены.")
+
+    async def _cb_status(self, edit):
+        # Не в потоке: get_status_text меняет состояние бота и пишет daily state (см. docstring класса)
+        await edit(self._status_cache.get(), parse_mode="Markdown")
+
+    async def _cb_portfolio(self, edit):
+        await edit(await asyncio.to_thread(self._portfolio_cache.get), parse_mode="Markdown")
+
+    async def _cb_trades(self, edit):
+        await edit(await asyncio.to_thread(self._trades_cache.get), parse_mode="Markdown")
+
+    async def _cb_day_help(self, edit):
+        await edit(DAY_HELP_MD, parse_mode="Markdown")
+
+    async def _cb_day_range(self, data: str, edit):
+        """DAYR|start|end|mode — выбор режима отчёта по диапазону."""
+        if not self.get_day_report_text:
+            await edit("Отчет /day недоступен в этой сборке.")
+            return
+        try:
+            _, start, end, mode = data.split("|", 3)
+        except Exception:
+            await edit("Некорректный формат запроса периода.")
+            return
+
+        # Пробрасываем в get_day_report_text строкой "start..end|mode"
+        text = await asyncio.to_thread(self.get_day_report_text, f"{start}..{end}|{mode}")
+        await edit(text, parse_mode="Markdown")
+
     async def _on_error(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         """Глобальный error handler для python-telegram-bot, чтобы ошибки не терялись в логах."""
         try:
@@ -462,8 +829,9 @@ class TelegramControlPanel:
         # Если Telegram временно недоступен — просто ретраим.
         while True:
             try:
-                req = HTTPXRequest(connect_timeout=15, read_timeout=30, write_timeout=30, pool_timeout=30)
-                self.app = ApplicationBuilder().token(self.token).request(req).build()
+                # Запросы бота идут через общий с TelegramBot пул; getUpdates (long polling) держит
+                # соединение до таймаута, поэтому у него свой запрос по умолчанию
+                self.app = ApplicationBuilder().token(self.token).request(get_shared_request()).build()
                 self.app.add_handler(CommandHandler("menu", self._cmd_menu))
                 self.app.add_handler(CommandHandler("start", self._cmd_menu))
                 self.app.add_handler(CommandHandler("day", self._cmd_day))
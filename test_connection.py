@@ -47,7 +47,7 @@ async def test_connections():
     telegram = TelegramBot()
     if telegram.bot:
         test_message = "🧪 Тестовое сообщение от торгового бота"
-        success = await telegram.send_message(test_message)
+        success = await telegram.send_message(test_message, wait=True)
         if success:
             print("✓ Telegram бот работает корректно")
         else:
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест ротации JSONL audit-лога.
+Быстрая ротация (_rotate_jsonl) должна давать тот же результат, что и полный проход (_rotate_jsonl_scan).
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Добавляем путь к модулям
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rotate_audit_logs import _rotate_jsonl, _rotate_jsonl_scan
+
+CUTOFF = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+OLD = b'{"ts_utc":"2020-01-01T00:00:00Z","event":"old"}'
+NEW = b'{"ts_utc":"2026-02-01T00:00:00Z","event":"new"}'
+OLD_TS_ONLY = b'{"ts":"2020-01-02T00:00:00Z","event":"old_ts"}'
+
+CASES = {
+    # Лог целиком старый, последняя запись оборвана без перевода строки
+    "old_no_trailing_newline": b'{"ts_utc":"2020-01-01T00:00:00Z"}',
+    "old_new_no_trailing_newline": OLD + b"\n" + NEW,
+    # Старая строка только с "ts" после границы
+    "old_ts_only_in_tail": OLD + b"\n" + OLD_TS_ONLY + b"\n" + NEW + b"\n",
+    # Пустая строка ровно на границе
+    "blank_line_at_offset": OLD + b"\n\n" + NEW + b"\n",
+    "crlf_blank_line_at_offset": OLD + b"\n\r\n" + NEW + b"\n",
+    "all_new": NEW + b"\n" + NEW + b"\n",
+}
+
+
+def _rotate_both(name: str, data: bytes, tmp_dir: Path) -> tuple:
+    fast = tmp_dir / f"{name}_fast.jsonl"
+    scan = tmp_dir / f"{name}_scan.jsonl"
+    fast.write_bytes(data)
+    scan.write_bytes(data)
+    _rotate_jsonl(fast, CUTOFF)
+    _rotate_jsonl_scan(scan, CUTOFF)
+    return fast.read_bytes(), scan.read_bytes()
+
+
+def test_rotate_matches_scan():
+    """Регрессии: быстрая ротация совпадает с полным проходом"""
+    with tempfile.TemporaryDirectory() as d:
+        for name, data in CASES.items():
+            fast, scan = _rotate_both(name, data, Path(d))
+            assert fast == scan, f"{name}: {fast!r} != {scan!r}"
+
+
+def test_rotate_random_matches_scan():
+    """Случайные логи из старых/новых/пустых строк и строк только с "ts" """
+    rnd = random.Random(0)
+    pieces = [OLD, NEW, OLD_TS_ONLY, b"", b"\r", b'{"event":"no_ts"}', b"not json"]
+    with tempfile.TemporaryDirectory() as d:
+        for i in range(600):
+            n_old = rnd.randint(0, 5)
+            lines = [OLD] * n_old + [rnd.choice(pieces) for _ in range(rnd.randint(0, 6))]
+            data = b"\n".join(lines)
+            if lines and rnd.random() < 0.7:
+                data += b"\n"
+            fast, scan = _rotate_both(f"r{i}", data, Path(d))
+            assert fast == scan, f"{data!r}: {fast!r} != {scan!r}"
+
+
+if __name__ == "__main__":
+    test_rotate_matches_scan()
+    test_rotate_random_matches_scan()
+    print("РЕЗУЛЬТАТ: ВСЕ ТЕСТЫ ПРОЙДЕНЫ ✓")
@@ -101,25 +101,25 @@ class TradingStrategy:
         # Рассчитываем индикаторы
         rsi = self.calculate_rsi(data)
         ma_short, ma_long = self.calculate_moving_averages(data)
-        macd, signal, histogram = self.calculate_macd(data)
+        macd, macd_signal_line, histogram = self.calculate_macd(data)
         bb_upper, bb_middle, bb_lower = self.calculate_bollinger_bands(data)
         volume_ma = self.calculate_volume_indicator(data)
         atr = self.calculate_atr(data)
         
-        # Получаем последние значения
-        current_price = data['Close'].iloc[-1]
-        current_rsi = rsi.iloc[-1]
-        current_ma_short = ma_short.iloc[-1]
-        current_ma_long = ma_long.iloc[-1]
-        current_macd = macd.iloc[-1]
-        current_signal = signal.iloc[-1]
-        current_histogram = histogram.iloc[-1]
-        prev_histogram = histogram.iloc[-2] if len(histogram) > 1 else current_histogram
-        current_bb_upper = bb_upper.iloc[-1]
-        current_bb_lower = bb_lower.iloc[-1]
-        current_volume = data['Volume'].iloc[-1] if 'Volume' in data.columns else 0
-        current_volume_ma = volume_ma.iloc[-1] if not volume_ma.empty else 0
-        current_atr = atr.iloc[-1] if not atr.empty else np.nan
+        # Получаем последние значения (.iat — позиционный доступ к скаляру без разбора меток)
+        current_price = data['Close'].iat[-1]
+        current_rsi = rsi.iat[-1]
+        current_ma_short = ma_short.iat[-1]
+        current_ma_long = ma_long.iat[-1]
+        current_macd = macd.iat[-1]
+        current_signal = macd_signal_line.iat[-1]
+        current_histogram = histogram.iat[-1]
+        prev_histogram = histogram.iat[-2] if len(histogram) > 1 else current_histogram
+        current_bb_upper = bb_upper.iat[-1]
+        current_bb_lower = bb_lower.iat[-1]
+        current_volume = data['Volume'].iat[-1] if 'Volume' in data.columns else 0
+        current_volume_ma = volume_ma.iat[-1] if not volume_ma.empty else 0
+        current_atr = atr.iat[-1] if not atr.empty else np.nan
 
         # Тренд-фильтр (упрощённый, чтобы не "задушить" сделки)
         trend = 'sideways'
@@ -155,8 +155,8 @@ class TradingStrategy:
         # Moving Average сигналы (золотой/смертельный крест)
         if not pd.isna(current_ma_short) and not pd.isna(current_ma_long):
             # Проверяем пересечение
-            prev_ma_short = ma_short.iloc[-2] if len(ma_short) > 1 else current_ma_short
-            prev_ma_long = ma_long.iloc[-2] if len(ma_long) > 1 else current_ma_long
+            prev_ma_short = ma_short.iat[-2] if len(ma_short) > 1 else current_ma_short
+            prev_ma_long = ma_long.iat[-2] if len(ma_long) > 1 else current_ma_long
             
             # Золотой крест (быстрая пересекает медленную снизу вверх)
             if prev_ma_short <= prev_ma_long and current_ma_short > current_ma_long:
@@ -180,8 +180,8 @@ class TradingStrategy:
         
         # MACD сигналы
         if not pd.isna(current_macd) and not pd.isna(current_signal):
-            prev_macd = macd.iloc[-2] if len(macd) > 1 else current_macd
-            prev_signal = signal.iloc[-2] if len(signal) > 1 else current_signal
+            prev_macd = macd.iat[-2] if len(macd) > 1 else current_macd
+            prev_signal = macd_signal_line.iat[-2] if len(macd_signal_line) > 1 else current_signal
             
             # Пересечение MACD и сигнальной линии
             if prev_macd <= prev_signal and current_macd > current_signal and current_histogram > 0:
@@ -242,12 +242,13 @@ class TradingStrategy:
             
             # Momentum сигнал: цена движется быстрее ATR
             if len(data) >= 2:
-                price_change = abs((current_price - data['Close'].iloc[-2]) / data['Close'].iloc[-2]) * 100
+                prev_close = data['Close'].iat[-2]
+                price_change = abs((current_price - prev_close) / prev_close) * 100
                 if price_change > atr_pct * 1.5:  # Сильное движение
-                    if current_price > data['Close'].iloc[-2] and buy_signals > sell_signals:
+                    if current_price > prev_close and buy_signals > sell_signals:
                         buy_signals += 1
                         confidence += 0.15
-                    elif current_price < data['Close'].iloc[-2] and sell_signals > buy_signals:
+                    elif current_price < prev_close and sell_signals > buy_signals:
                         sell_signals += 1
                         confidence += 0.15
         
@@ -263,6 +264,9 @@ class TradingStrategy:
             if confidence >= required_conf:
                 signal = 'buy'
                 confidence = min(confidence, 1.0)
+            else:
+                # Недостаточно уверенности для BUY — hold (confidence сохраняем, как и в ветке hold ниже)
+                signal = 'hold'
         # Для продажи: минимум 3 сигнала + уверенность >= 0.5
         elif sell_signals >= 3 and sell_signals > buy_signals and confidence >= 0.5:
             signal = 'sell'